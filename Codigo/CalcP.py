@@ -2,19 +2,37 @@ import pandas as pd
 import numpy as np
 import math
 import random
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json  # Import necessari per a l'exportació
+import io
+import time
+import contextlib
+import heapq
+import bisect
+import os
+import tempfile
+import weakref
+import sqlite3
+import hashlib
+import statistics
+import pickle
+import gzip
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # --- 1. CONFIGURACIÓ I CONSTANTS ---
 
 # Configuració de la Simulació
 DIES_SETMANA = 7  # Setmana natural (Dilluns=0 ... Diumenge=6)
 DIES_SIMULACIO = 15  # Simulem 15 dies (2 setmanes + 1 dilluns extra)
+DIES_VAN_BUIT = 7  # Dies entre que un lot es buida i l'arribada del lot de reposició (neteja i buit sanitari)
+EDAT_REPOSICIO = 10  # Setmanes dels porcs que arriben a reposar un lot (primera setmana de la corba de pes)
 DATA_INICI = pd.Timestamp('2024-05-01')
 
 # --- VARIABLES CLAU DE FLOTA I PREUS ---
 NUM_CAMIONS_FLOTA = 3  # LIMIT REAL: Màxim de camions disponibles per dia
+NUM_CAMIONS_PETITS = 0  # Camions de 10T de la flota per defecte (a més dels NUM_CAMIONS_FLOTA de 20T)
+MAX_HORES_SETMANA_CAMIO = 40
 COST_CAMIO_FIXE_SETMANAL = 2000 # Cost de tenir el camió llogat (el facis servir o no)
 PREU_BASE_KG = 1.56
 PREU_MENJAR_KG = 0.35 
@@ -27,6 +45,10 @@ COST_KM_GRAN = 1.25  # Camió 20T
 PENALITZACIO_LLEU = 0.15  # 100-105kg o 115-120kg
 PENALITZACIO_GREU = 0.20  # <100kg o >120kg
 RANG_OPTIM = (105, 115)
+RANG_LLEU = (100, 120)  # Fora d'aquest rang s'aplica la penalització greu
+# Límits de franja en l'ordre de les columnes de slaughterhouses 1.csv:
+# (penalty_20_min, penalty_15_min, penalty_15_max, penalty_20_max)
+LIMITS_PENALITZACIO = (RANG_LLEU[0], RANG_OPTIM[0], RANG_OPTIM[1], RANG_LLEU[1])
 
 # Capacitats Transport
 CAPACITAT_CAMIO_PETIT = 10000  # kg
@@ -35,8 +57,61 @@ VELOCITAT_MITJANA = 60  # km/h
 TEMPS_CARREGA_PER_PORC = 0.5 / 60  # 0.5 minuts per porc en hores
 MAX_HORES_DIA = 8
 
+# Matriu de distàncies
+MODE_DISTANCIA = "pla"  # "pla" (aproximació 111/85 km per grau) o "haversine"
+MAX_NODES_MATRIU_MEMORIA = 8000  # Per sobre, la matriu es guarda en un fitxer float32 mapat a memòria
+RADI_TERRA_KM = 6371.0
+MIDA_CELLA_INDEX_KM = 10.0  # Mida de cel·la de l'índex espacial de granges
+RADI_VEINS_KM = 100  # Distància màxima per afegir una granja veïna a una ruta
+
+# Ensemble Monte Carlo
+MIN_REPLIQUES_ENSEMBLE = 8  # Rèpliques mínimes abans de plantejar-se l'aturada anticipada
+METRIQUES_ENSEMBLE = ["benefici_net", "porcs_lliurats", "penalitzacions"]
+
+# Xarxa d'escorxadors
+NUM_ESCORXADORS = 1  # Escorxadors generats; amb més d'un, cada dia s'assignen granges a escorxadors abans de fer rutes
+
+# Fitxers de dades
+DIR_DADES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dades")
+FITXER_TRANSPORTS = os.path.join(DIR_DADES, "transports 1.csv")
+FITXER_GRANGES = os.path.join(DIR_DADES, "target", "granjas.json")
+FITXER_ESCORXADORS = os.path.join(DIR_DADES, "slaughterhouses 1.csv")
+FITXER_BD = os.path.join(DIR_DADES, "logistics 1.db")
+FITXER_CORBA_PES = os.path.join(DIR_DADES, "weight 1.xlsx")
+FITXER_CORBA_CONSUM = os.path.join(DIR_DADES, "Consumption 1.xlsx")
+DIR_RESULTATS_WEB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "web", "pig-logistics-web",
+                                 "public", "resultats")  # manifest.json + dia_NNN.json que carrega App.jsx
+DIR_CACHE_DADES = os.path.join(DIR_DADES, ".cache")  # Instantànies .npz de les taules ja parsejades
+VERSIO_SNAPSHOT = 1  # Incrementar si canvia el format de les instantànies
+VERSIO_PUNT_CONTROL = 1  # Incrementar si canvia el format dels punts de control de simular
+EDAT_PER_DEFECTE = 20  # Setmanes d'un lot sense edat ni pes a les dades
+MAX_SETMANES_CORBA = 104  # Abast (dos anys) de les taules denses de creixement i consum; per sobre, l'últim valor
+
+# Escenaris sintètics de generar_entorn_massiu: zona = (lat_min, lat_max, lon_min, lon_max)
+ESCALES_ENTORN = {
+    "petit": {"granges": 60, "lots": 4, "porcs_lot": (150, 350), "escorxadors": 1,
+              "capacitat_escorxador": 1800, "zona": (41.50, 42.10, 0.50, 2.50)},
+    "regional": {"granges": 1000, "lots": 4, "porcs_lot": (300, 1500), "escorxadors": 8,
+                 "capacitat_escorxador": 6000, "zona": (40.50, 42.90, 0.20, 3.30)},
+    "nacional": {"granges": 10000, "lots": 4, "porcs_lot": (500, 2000), "escorxadors": 40,
+                 "capacitat_escorxador": 20000, "zona": (36.00, 43.80, -9.30, 3.30)},
+}
+
+# Columnes (text, numèriques) de cada taula, amb els noms de logistics 1.db i dels CSV/JSON
+COLUMNES_DADES = {
+    "Farms": (["farm_id", "name"],
+              ["lat", "lon", "inventory_pigs", "avg_weight_kg", "growth_rate_kg_per_week", "age_weeks",
+               "price_per_kg", "capacity"]),
+    "Slaughterhouses": (["slaughterhouse_id", "name"],
+                        ["lat", "lon", "capacity_per_day", "price_per_kg", "penalty_15_min", "penalty_15_max",
+                         "penalty_20_min", "penalty_20_max"]),
+    "Transports": (["transport_id", "type"],
+                   ["capacity_tons", "cost_per_km", "max_hours_per_week", "fixed_weekly_cost", "available"]),
+}
+
 # --- DATA DEL CSV (Weight 1.xlsx - Weight.csv) ---
 # Format: {setmana: {'mean': mitjana_kg, 'sd': desviacio_estandard}}
+# Còpia incrustada de FITXER_CORBA_PES, només per si no es pot llegir el .xlsx (igual amb el consum)
 GROWTH_DATA = {
     10: {'mean': 29.7, 'sd': 3.9},
     11: {'mean': 33.4, 'sd': 4.6},
@@ -86,90 +161,476 @@ CUMULATIVE_INTAKE_DATA = {
 
 # --- 2. CLASSES D'ENTITATS ---
 
+def _hash_fitxer(fitxer):
+    h = hashlib.sha1()
+    with open(fitxer, 'rb') as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()[:16]
+
+
+def _instantania_npz(fitxer, nom, llegir, dir_cache=DIR_CACHE_DADES):
+    """
+    El dict d'arrays de `llegir()`, desat com a instantània .npz a `dir_cache` amb la clau feta del
+    nom i el hash de `fitxer`: les execucions següents el carreguen sense tornar a parsejar.
+    `dir_cache=None` desactiva la cache.
+    """
+    if dir_cache is None:
+        return llegir()
+    clau = f"{os.path.splitext(os.path.basename(fitxer))[0]}-{nom}-v{VERSIO_SNAPSHOT}-{_hash_fitxer(fitxer)}"
+    instantania = os.path.join(dir_cache, clau.replace(" ", "_") + ".npz")
+    if os.path.exists(instantania):
+        with np.load(instantania, allow_pickle=False) as z:
+            return {c: z[c] for c in z.files}
+
+    columnes = llegir()
+    try:
+        os.makedirs(dir_cache, exist_ok=True)
+        temporal = instantania[:-4] + f".{os.getpid()}.tmp.npz"
+        np.savez(temporal, **columnes)
+        os.replace(temporal, instantania)
+    except OSError:
+        pass  # Sense permisos d'escriptura: simplement no hi haurà cache
+    return columnes
+
+
+def _llegir_corba(fitxer):
+    """Files (setmana, mitjana, desviació) de la primera fulla d'un .xlsx de corbes; les capçaleres es descarten."""
+    df = pd.read_excel(fitxer, header=None).iloc[:, :3].apply(pd.to_numeric, errors='coerce').dropna()
+    df = df.sort_values(0)
+    return {"setmanes": df[0].to_numpy(dtype=np.float64), "mean": df[1].to_numpy(dtype=np.float64),
+            "sd": df[2].to_numpy(dtype=np.float64)}
+
+
+def carregar_corba(fitxer, dades_per_defecte, dir_cache=DIR_CACHE_DADES):
+    """
+    (setmanes, mitjanes, desviacions) d'una corba setmanal del .xlsx de Dades/, a través d'una
+    instantània .npz. Si el fitxer no hi és o no es pot llegir (p. ex. sense openpyxl), la còpia
+    incrustada `dades_per_defecte` ({setmana: {'mean', 'sd'}}).
+    """
+    try:
+        corba = _instantania_npz(fitxer, "corba", lambda: _llegir_corba(fitxer), dir_cache)
+        if len(corba["setmanes"]) >= 2:
+            return corba["setmanes"], corba["mean"], corba["sd"]
+    except (OSError, ImportError, ValueError, KeyError):
+        pass
+    setmanes = sorted(dades_per_defecte)
+    return (np.array(setmanes, dtype=np.float64), np.array([dades_per_defecte[s]['mean'] for s in setmanes]),
+            np.array([dades_per_defecte[s]['sd'] for s in setmanes]))
+
+
+def _taula_corba(setmanes, valors, minim=-np.inf):
+    """
+    Taula densa d'una corba setmanal amb una posició per dia d'edat (setmanes × DIES_SETMANA) fins a
+    MAX_SETMANES_CORBA: interpolació lineal entre setmanes i, fora del rang de les dades, extrapolació
+    amb el pendent del primer i de l'últim tram (np.interp sol hi posaria el valor de l'extrem).
+    """
+    edats = np.arange(MAX_SETMANES_CORBA * DIES_SETMANA + 1) / DIES_SETMANA
+    taula = np.interp(edats, setmanes, valors)
+    abans, despres = edats < setmanes[0], edats > setmanes[-1]
+    pendent_inici = (valors[1] - valors[0]) / (setmanes[1] - setmanes[0])
+    pendent_final = (valors[-1] - valors[-2]) / (setmanes[-1] - setmanes[-2])
+    taula[abans] = valors[0] + (edats[abans] - setmanes[0]) * pendent_inici
+    taula[despres] = valors[-1] + (edats[despres] - setmanes[-1]) * pendent_final
+    return np.maximum(taula, minim)
+
+
+CORBA_PES = carregar_corba(FITXER_CORBA_PES, GROWTH_DATA)
+CORBA_CONSUM = carregar_corba(FITXER_CORBA_CONSUM, CUMULATIVE_INTAKE_DATA)
+# Pes i desviació no baixen d'1 kg en extrapolar cap enrere; el consum acumulat només s'usa en diferències
+GROWTH_MEAN, GROWTH_SD = (_taula_corba(CORBA_PES[0], v, minim=1.0) for v in CORBA_PES[1:])
+INTAKE_MEAN, INTAKE_SD = (_taula_corba(CORBA_CONSUM[0], v) for v in CORBA_CONSUM[1:])
+
+
+def _consultar_taula(taula, setmanes):
+    """Valors de la corba a edats `setmanes` (fraccionàries, arrodonides al dia) amb un sol gather."""
+    return np.take(taula, np.rint(np.asarray(setmanes) * DIES_SETMANA).astype(np.int64), mode='clip')
+
+
+class Ramat:
+    """
+    Magatzem struct-of-arrays de tot el ramat.
+    Tots els pesos individuals viuen en un únic array contigu; cada lot ocupa un segment
+    [base, base + capacitat) i els seus porcs vius són el tram [inici, fi) d'aquest segment.
+    Invariant: cada segment està ordenat de més pesat a menys, de manera que vendre els porcs
+    més pesants és avançar `inici`. Edat, z-score d'ingesta i granja són arrays per lot.
+    """
+    def __init__(self, pesos, quantitats, edats, z_intake, granja_lot, num_granges,
+                 pes_mig=None, desviacio_std=None, ordenat=False):
+        quantitats = np.asarray(quantitats, dtype=np.int64)
+        self.lot_de_porc = np.repeat(np.arange(len(quantitats)), quantitats)
+        pesos = np.asarray(pesos, dtype=np.float64)
+        # `ordenat=True`: el que crida ja dona cada lot de més pesat a menys i ens estalviem el lexsort
+        self.pesos = np.ascontiguousarray(pesos) if ordenat else \
+            np.ascontiguousarray(pesos[np.lexsort((-pesos, self.lot_de_porc))])
+        self._prefix = None  # Suma acumulada dels pesos, invalidada quan el ramat creix
+        self._consum_setmanal = None  # Consum setmanal per porc de cada lot, invalidat quan el ramat creix
+        self._cost_granja = None  # Cost diari de menjar per granja, invalidat quan el ramat creix o ven
+        self.base = np.zeros(len(quantitats), dtype=np.int64)
+        np.cumsum(quantitats[:-1], out=self.base[1:])
+        self.inici = self.base.copy()
+        self.fi = self.base + quantitats
+        self.edat = np.asarray(edats, dtype=np.float64).copy()  # Setmanes; fraccionària amb creixement diari
+        self.z_intake = np.asarray(z_intake, dtype=np.float64).copy()
+        self.granja_lot = np.asarray(granja_lot, dtype=np.int64).copy()
+        self.num_granges = num_granges
+        self.menjar_acumulat = np.zeros(num_granges)
+
+        # Estadístiques per granja (pes màxim i prioritat) mantingudes de manera incremental:
+        # només es recalculen les granges marcades com a modificades (creixement o vendes)
+        self._lots_per_granja = np.argsort(self.granja_lot, kind='stable')
+        self._inici_lots_granja = np.searchsorted(self.granja_lot[self._lots_per_granja], np.arange(num_granges + 1))
+        self._max_granja = np.full(num_granges, -np.inf)
+        self._prioritat_granja = np.full(num_granges, -np.inf)
+        self._granges_modificades = np.ones(num_granges, dtype=bool)
+        self.versio_granja = np.zeros(num_granges, dtype=np.int64)  # Invalida les caches per granja
+        self.lots_buidats = []  # Lots que s'han quedat sense porcs (els recull el motor de simulació)
+
+        mitjana_inicial, sd_inicial = self._parametres_creixement(self.edat)
+        self.pes_mig = mitjana_inicial if pes_mig is None else np.asarray(pes_mig, dtype=np.float64).copy()
+        self.desviacio_std = sd_inicial if desviacio_std is None else np.asarray(desviacio_std, dtype=np.float64).copy()
+
+    @classmethod
+    def des_de_granges(cls, granges):
+        """Consolida els lots (i els seus pesos) de totes les granges en un sol magatzem i hi reenllaça les vistes."""
+        ramat = granges[0]._ramat if granges else None
+        if ramat is not None and ramat.num_granges == len(granges) and \
+                all(g._ramat is ramat and g._idx == i for i, g in enumerate(granges)):
+            return ramat  # Ja consolidat (p. ex. per generar_entorn_massiu)
+        lots = [lot for g in granges for lot in g.lots]
+        granja_lot = [i for i, g in enumerate(granges) for _ in g.lots]
+        pesos = np.concatenate([lot.pesos_individuals for lot in lots]) if lots else np.empty(0)
+        ramat = cls(
+            pesos,
+            [lot.quantitat for lot in lots],
+            [lot.edat_setmanes for lot in lots],
+            [lot.z_score_intake for lot in lots],
+            granja_lot,
+            len(granges),
+            pes_mig=[lot.pes_mig for lot in lots],
+            desviacio_std=[lot.desviacio_std for lot in lots],
+        )
+        for i, lot in enumerate(lots):
+            lot._ramat, lot._i = ramat, i
+        for i, g in enumerate(granges):
+            ramat.menjar_acumulat[i] = g.menjar_consumit_acumulat
+            g._ramat, g._idx = ramat, i
+        return ramat
+
+    @staticmethod
+    def _parametres_creixement(setmanes):
+        return _consultar_taula(GROWTH_MEAN, setmanes), _consultar_taula(GROWTH_SD, setmanes)
+
+    @property
+    def quantitats(self):
+        return self.fi - self.inici
+
+    def pesos_lot(self, i):
+        return self.pesos[self.inici[i]:self.fi[i]]
+
+    @property
+    def prefix(self):
+        """Suma acumulada exclusiva de `pesos`: el pes del tram [a, b) és prefix[b] - prefix[a]."""
+        if self._prefix is None:
+            self._prefix = np.zeros(len(self.pesos) + 1)
+            np.cumsum(self.pesos, out=self._prefix[1:])
+        return self._prefix
+
+    def creixer(self, setmanes=1.0, lots=None):
+        """
+        Aplica `setmanes` de creixement (p. ex. 1 / DIES_SETMANA per a un dia). Sense `lots`, una sola
+        passada sobre tot el ramat. El Z-Score update (p - m0) / sd0 * sd1 + m1 s'expressa com
+        p * escala + desplaçament per lot; com que escala > 0, l'ordre dins de cada lot es manté.
+        """
+        idx = slice(None) if lots is None else np.atleast_1d(lots)
+        edat = self.edat[idx]
+        m_old, sd_old = self._parametres_creixement(edat)
+        m_new, sd_new = self._parametres_creixement(edat + setmanes)
+        escala = sd_new / sd_old
+        desplacament = m_new - m_old * escala
+
+        if lots is None:
+            self.pesos *= escala[self.lot_de_porc]
+            self.pesos += desplacament[self.lot_de_porc]
+        else:
+            for k, i in enumerate(idx):
+                segment = self.pesos[self.base[i]:self.fi[i]]
+                segment *= escala[k]
+                segment += desplacament[k]
+        self._prefix = None
+        self._consum_setmanal = self._cost_granja = None
+
+        self.pes_mig[idx] = m_new
+        self.desviacio_std[idx] = sd_new
+        self.edat[idx] = edat + setmanes
+        self._granges_modificades[self.granja_lot[idx]] = True
+        self.versio_granja[self.granja_lot[idx]] += 1
+
+    def creixer_una_setmana(self, lots=None):
+        self.creixer(1.0, lots)
+
+    def consum_setmanal_per_porc(self, lots=None):
+        """Consum setmanal per porc de cada lot a partir de les dades ACUMULADES i la DESVIACIÓ ESTÀNDARD."""
+        idx = slice(None) if lots is None else lots
+        edat = self.edat[idx]
+        z = self.z_intake[idx]
+        cum_curr = _consultar_taula(INTAKE_MEAN, edat) + z * _consultar_taula(INTAKE_SD, edat)
+        cum_prev = _consultar_taula(INTAKE_MEAN, edat - 1) + z * _consultar_taula(INTAKE_SD, edat - 1)
+        return np.maximum(cum_curr - cum_prev, 1.0)
+
+    @property
+    def consum_setmanal(self):
+        """consum_setmanal_per_porc de tots els lots, calculat un cop per setmana (només depèn d'edat i z-score)."""
+        if self._consum_setmanal is None:
+            self._consum_setmanal = self.consum_setmanal_per_porc()
+        return self._consum_setmanal
+
+    def cost_menjar_diari(self):
+        """
+        Cost diari d'alimentació de cada granja, sense acumular-lo: consum per porc × porcs de cada lot,
+        sumat per granja. Queda en cache fins que el ramat creix o ven; després d'una venda només es
+        refà la suma ponderada. L'array retornat és el de la cache: no s'ha de modificar.
+        """
+        if self._cost_granja is None:
+            kg_dia_lot = self.consum_setmanal / 7.0 * self.quantitats
+            self._cost_granja = np.bincount(self.granja_lot, weights=kg_dia_lot * PREU_MENJAR_KG,
+                                            minlength=self.num_granges)
+        return self._cost_granja
+
+    def calcular_consum_diari(self, dies=1):
+        """Cost diari d'alimentació de cada granja. L'acumula `dies` vegades a `menjar_acumulat`."""
+        cost_granja = self.cost_menjar_diari()
+        self.menjar_acumulat += cost_granja * dies
+        return cost_granja
+
+    def porcs_per_granja(self):
+        return np.bincount(self.granja_lot, weights=self.quantitats, minlength=self.num_granges).astype(np.int64)
+
+    def max_pes_lot(self, lots=None):
+        # Per l'invariant d'ordre, el porc més pesant de cada lot és el primer viu
+        idx = slice(None) if lots is None else lots
+        inici, fi = self.inici[idx], self.fi[idx]
+        amb_porcs = fi > inici
+        max_lot = np.full(len(inici), -np.inf)
+        max_lot[amb_porcs] = self.pesos[inici[amb_porcs]]
+        return max_lot
+
+    def mitjana_pes_lot(self, lots=None):
+        idx = slice(None) if lots is None else lots
+        inici, fi = self.inici[idx], self.fi[idx]
+        sumes = self.prefix[fi] - self.prefix[inici]
+        q = fi - inici
+        return np.divide(sumes, q, out=np.full(len(q), -np.inf), where=q > 0)
+
+    def refrescar_estadistiques(self):
+        """
+        Recalcula el pes màxim i la prioritat de les granges modificades des de l'últim refresc
+        (totes després de créixer; només les que han venut porcs la resta de dies). Retorna els seus índexs.
+        """
+        modificades = np.flatnonzero(self._granges_modificades)
+        if len(modificades) == 0:
+            return modificades
+        if len(modificades) == self.num_granges:
+            lots = np.arange(len(self.inici))
+        else:
+            lots = np.concatenate([self._lots_per_granja[self._inici_lots_granja[g]:self._inici_lots_granja[g + 1]]
+                                   for g in modificades.tolist()])
+        granja = self.granja_lot[lots]
+        self._max_granja[modificades] = -np.inf
+        self._prioritat_granja[modificades] = -np.inf
+        np.maximum.at(self._max_granja, granja, self.max_pes_lot(lots))
+        np.maximum.at(self._prioritat_granja, granja, self.mitjana_pes_lot(lots))
+        self._granges_modificades[modificades] = False
+        return modificades
+
+    def max_pes_granja(self):
+        self.refrescar_estadistiques()
+        return self._max_granja
+
+    def max_mitjana_granja(self):
+        """Prioritat de cada granja: la mitjana de pes del seu lot més pesant."""
+        self.refrescar_estadistiques()
+        return self._prioritat_granja
+
+    def te_porcs_per_venda(self):
+        # Una granja sense porcs té màxim -inf
+        return self.max_pes_granja() > 100
+
+    def porcs_que_caben(self, i, max_kg):
+        """Quants dels porcs més pesants del lot `i` caben en `max_kg`, i el seu pes. O(log n)."""
+        a, b = self.inici[i], self.fi[i]
+        prefix = self.prefix
+        n = int(np.searchsorted(prefix[a:b + 1], prefix[a] + max_kg, side='right')) - 1
+        return n, float(prefix[a + n] - prefix[a])
+
+    def treure_primers(self, i, n):
+        """
+        Dona per venuts els `n` primers porcs vius del lot `i` en O(1) i en retorna els pesos
+        com a vista (vàlida fins al següent creixement del ramat).
+        """
+        a = self.inici[i]
+        self.inici[i] = a + n
+        if n:
+            self._cost_granja = None
+            self._granges_modificades[self.granja_lot[i]] = True
+            self.versio_granja[self.granja_lot[i]] += 1
+            if a + n == self.fi[i]:
+                self.lots_buidats.append(i)
+        return self.pesos[a:a + n]
+
+    def repoblar_lot(self, i, edat_setmanes=EDAT_REPOSICIO):
+        """
+        Arribada d'un lot nou al segment del lot `i`: tants porcs com la capacitat del segment, de
+        `edat_setmanes` setmanes, amb pesos i z-score d'ingesta generats com a PorcBatch. Retorna els porcs.
+        """
+        a, b = int(self.base[i]), int(self.fi[i])
+        pes_mig, desviacio_std = (float(v[0]) for v in self._parametres_creixement(np.array([edat_setmanes])))
+        self.z_intake[i] = np.random.normal(0, 1)
+        self.pesos[a:b] = np.sort(np.random.normal(pes_mig, desviacio_std, b - a))[::-1]
+        self._prefix = None
+        self._consum_setmanal = self._cost_granja = None
+        self.inici[i] = a
+        self.edat[i] = edat_setmanes
+        self.pes_mig[i] = pes_mig
+        self.desviacio_std[i] = desviacio_std
+        self._granges_modificades[self.granja_lot[i]] = True
+        self.versio_granja[self.granja_lot[i]] += 1
+        return b - a
+
+    def estimar_carrega_lot(self, i, max_kg):
+        """
+        Estimació de càrrega sense treure porcs: recorre el lot de més pesat a menys i hi afegeix
+        cada porc que encara hi cap, sense aturar-se al primer que no hi cap. Els trams que hi caben
+        es troben amb searchsorted sobre la suma acumulada i els que no, amb bisect sobre els pesos
+        ordenats: O(salts · log n) en lloc d'un bucle per porc.
+        """
+        a, b = int(self.inici[i]), int(self.fi[i])
+        _perfil.comptar("porcs_escanejats", b - a)
+        prefix, pesos = self.prefix, self.pesos
+        num_porcs, kg = 0, 0.0
+        restant = max_kg
+        while a < b:
+            _perfil.comptar("salts_estimacio")
+            n = int(np.searchsorted(prefix[a:b + 1], prefix[a] + restant, side='right')) - 1
+            kg_tram = float(prefix[a + n] - prefix[a])
+            num_porcs += n
+            kg += kg_tram
+            restant -= kg_tram
+            a += n
+            # Saltem els porcs que ja no hi caben fins al primer que sí
+            a = bisect.bisect_left(pesos, -restant, lo=a, hi=b, key=lambda p: -p)
+        return num_porcs, kg
+
+    def estimar_carrega_granges(self, granges, max_kg):
+        """
+        `Granja.estimar_carrega` de moltes granges alhora: els lots de cada granja es recorren en ordre
+        i cada salt de estimar_carrega_lot es fa per a tots els lots actius a la vegada. Com que la suma
+        acumulada és creixent, el tram que hi cap surt d'un sol searchsorted global limitat al final del
+        lot, i el bisect passa a ser una cerca binària vectoritzada. Retorna (porcs, kg) per granja.
+        """
+        granges = np.asarray(granges, dtype=np.int64)
+        porcs = np.zeros(len(granges), dtype=np.int64)
+        kg = np.zeros(len(granges))
+        prefix, pesos = self.prefix, self.pesos
+        primer_lot = self._inici_lots_granja[granges]
+        num_lots = self._inici_lots_granja[granges + 1] - primer_lot
+        for posicio in range(int(num_lots.max(initial=0))):
+            g = np.flatnonzero(num_lots > posicio)
+            lots = self._lots_per_granja[primer_lot[g] + posicio]
+            a, b = self.inici[lots], self.fi[lots]
+            _perfil.comptar("porcs_escanejats", int((b - a).sum()))
+            porcs_lot, kg_lot = np.zeros(len(lots), dtype=np.int64), np.zeros(len(lots))
+            restant = max_kg - kg[g]
+            actius = np.flatnonzero(a < b)
+            while len(actius):
+                _perfil.comptar("salts_estimacio", len(actius))
+                inici, fi = a[actius], b[actius]
+                fi_tram = np.minimum(np.searchsorted(prefix, prefix[inici] + restant[actius], side='right') - 1, fi)
+                kg_tram = prefix[fi_tram] - prefix[inici]
+                porcs_lot[actius] += fi_tram - inici
+                kg_lot[actius] += kg_tram
+                restant[actius] -= kg_tram
+                # Primer porc de [fi_tram, fi) que encara hi cap (els pesos del lot són decreixents)
+                lo, hi, r = fi_tram, fi.copy(), restant[actius]
+                while len(cerca := np.flatnonzero(lo < hi)):
+                    mig = (lo[cerca] + hi[cerca]) // 2
+                    no_hi_cap = pesos[mig] > r[cerca]
+                    lo[cerca[no_hi_cap]] = mig[no_hi_cap] + 1
+                    hi[cerca[~no_hi_cap]] = mig[~no_hi_cap]
+                a[actius] = lo
+                actius = actius[lo < fi]
+            porcs[g] += porcs_lot
+            kg[g] += kg_lot
+        return porcs, kg
+
+
 class PorcBatch:
-    """Representa un lot de porcs a una granja."""
-    def __init__(self, id_lot, quantitat, edat_setmanes):
+    """Representa un lot de porcs a una granja. És una vista sobre un `Ramat`."""
+    def __init__(self, id_lot, quantitat, edat_setmanes, pes_mig=None):
         self.id_lot = id_lot
-        self.quantitat = quantitat
-        self.edat_setmanes = edat_setmanes
-        
+        pes_dades = pes_mig
+
         # Factor de consum propi d'aquest lot (Z-Score d'ingesta).
-        self.z_score_intake = np.random.normal(0, 1)
+        z_score_intake = np.random.normal(0, 1)
 
-        # Inicialització del pes basada en GROWTH_DATA
-        if edat_setmanes in GROWTH_DATA:
-            params = GROWTH_DATA[edat_setmanes]
-            self.pes_mig = params['mean']
-            self.desviacio_std = params['sd']
-        else:
-            self.pes_mig = 30 + (edat_setmanes * 4)
-            self.desviacio_std = 5
+        # Inicialització del pes basada en la corba de creixement
+        pes_mig, desviacio_std = (float(v[0]) for v in Ramat._parametres_creixement(np.array([edat_setmanes])))
+        if pes_dades is not None:
+            pes_mig = pes_dades  # Pes mig real de la granja (p. ex. avg_weight_kg de les dades)
 
         # Generem la distribució inicial de pesos individuals
-        self.pesos_individuals = np.random.normal(self.pes_mig, self.desviacio_std, quantitat)
-        self.pesos_individuals = np.sort(self.pesos_individuals)[::-1]
+        pesos = np.sort(np.random.normal(pes_mig, desviacio_std, quantitat))[::-1]
+
+        # Fins que la granja es consolida amb Ramat.des_de_granges, el lot té un magatzem propi
+        self._ramat = Ramat(pesos, [quantitat], [edat_setmanes], [z_score_intake], [0], 1,
+                            pes_mig=[pes_mig], desviacio_std=[desviacio_std])
+        self._i = 0
+
+    @classmethod
+    def vista(cls, id_lot, ramat, i):
+        """Lot `i` d'un `Ramat` ja construït, sense generar pesos."""
+        lot = cls.__new__(cls)
+        lot.id_lot, lot._ramat, lot._i = id_lot, ramat, i
+        return lot
+
+    @property
+    def quantitat(self):
+        return int(self._ramat.fi[self._i] - self._ramat.inici[self._i])
+
+    @property
+    def edat_setmanes(self):
+        return float(self._ramat.edat[self._i])
+
+    @property
+    def z_score_intake(self):
+        return float(self._ramat.z_intake[self._i])
+
+    @property
+    def pes_mig(self):
+        return float(self._ramat.pes_mig[self._i])
+
+    @property
+    def desviacio_std(self):
+        return float(self._ramat.desviacio_std[self._i])
+
+    @property
+    def pesos_individuals(self):
+        return self._ramat.pesos_lot(self._i)
 
     def creixer_una_setmana(self):
-        old_week = self.edat_setmanes
-        new_week = old_week + 1
-        
-        if old_week in GROWTH_DATA and new_week in GROWTH_DATA:
-            old_params = GROWTH_DATA[old_week]
-            new_params = GROWTH_DATA[new_week]
-            
-            # Z-Score update per pes (manté la jerarquia dins del lot)
-            z_scores = (self.pesos_individuals - old_params['mean']) / old_params['sd']
-            self.pesos_individuals = z_scores * new_params['sd'] + new_params['mean']
-            
-            self.pes_mig = new_params['mean']
-            self.desviacio_std = new_params['sd']
-            self.edat_setmanes = new_week
-        else:
-            # Fallback si falten dades
-            GUANY_ESTIMAT = 5.0
-            self.edat_setmanes += 1
-            self.pes_mig += GUANY_ESTIMAT
-            self.pesos_individuals += GUANY_ESTIMAT
+        self._ramat.creixer_una_setmana(lots=self._i)
 
     def obtenir_consum_setmanal_per_porc(self):
         """
         Calcula el consum setmanal tenint en compte les dades ACUMULADES i la DESVIACIÓ ESTÀNDARD.
         """
-        curr_week = self.edat_setmanes
-        prev_week = curr_week - 1
-        
-        if curr_week not in CUMULATIVE_INTAKE_DATA or prev_week not in CUMULATIVE_INTAKE_DATA:
-            return 15.0 # Valor per defecte segur
-            
-        curr_data = CUMULATIVE_INTAKE_DATA[curr_week]
-        prev_data = CUMULATIVE_INTAKE_DATA[prev_week]
-        
-        cum_curr = curr_data['mean'] + (self.z_score_intake * curr_data['sd'])
-        cum_prev = prev_data['mean'] + (self.z_score_intake * prev_data['sd'])
-        
-        consum_setmanal = cum_curr - cum_prev
-        if consum_setmanal < 1.0: consum_setmanal = 1.0
-        
-        return consum_setmanal
+        return float(self._ramat.consum_setmanal[self._i])
 
     def obtenir_porcs_per_venda(self, max_kg_capacitat):
-        pes_acumulat = 0
-        seleccionats = []
-        indexs_a_eliminar = []
-
-        self.pesos_individuals = np.sort(self.pesos_individuals)[::-1]
-
-        for i, pes in enumerate(self.pesos_individuals):
-            if pes_acumulat + pes <= max_kg_capacitat:
-                pes_acumulat += pes
-                seleccionats.append(pes)
-                indexs_a_eliminar.append(i)
-            else:
-                break
-
-        self.pesos_individuals = np.delete(self.pesos_individuals, indexs_a_eliminar)
-        self.quantitat = len(self.pesos_individuals)
-        return pes_acumulat, len(seleccionats), seleccionats
+        """Treu del lot els porcs més pesants que caben en `max_kg_capacitat` (searchsorted sobre la suma acumulada)."""
+        n, pes_acumulat = self._ramat.porcs_que_caben(self._i, max_kg_capacitat)
+        seleccionats = self._ramat.treure_primers(self._i, n)
+        return pes_acumulat, n, seleccionats
 
 
 class Granja:
@@ -179,7 +640,24 @@ class Granja:
         self.capacitat_total = capacitat_total
         self.lots = []
         self.visitada_aquesta_setmana = False
-        self.menjar_consumit_acumulat = 0
+        self._menjar_consumit_acumulat = 0
+        self._ramat = None
+        self._idx = None
+        self._cache_carrega = {}
+        self._cache_carrega_versio = None
+
+    @property
+    def menjar_consumit_acumulat(self):
+        if self._ramat is not None:
+            return float(self._ramat.menjar_acumulat[self._idx])
+        return self._menjar_consumit_acumulat
+
+    @menjar_consumit_acumulat.setter
+    def menjar_consumit_acumulat(self, valor):
+        if self._ramat is not None:
+            self._ramat.menjar_acumulat[self._idx] = valor
+        else:
+            self._menjar_consumit_acumulat = valor
 
     def afegir_lot(self, lot):
         self.lots.append(lot)
@@ -187,12 +665,69 @@ class Granja:
     def get_total_porcs(self):
         return sum(l.quantitat for l in self.lots)
 
+    def estimar_carrega(self, max_kg):
+        """
+        Quants porcs (i quants kg) d'aquesta granja caben en `max_kg`, sense treure'ls.
+        El resultat queda en cache fins que la granja creix o ven porcs.
+        """
+        versio = int(self._ramat.versio_granja[self._idx]) if self._ramat is not None else None
+        if versio is not None and self._cache_carrega_versio == versio:
+            if max_kg in self._cache_carrega:
+                _perfil.comptar("estimacions_carrega_cache")
+                return self._cache_carrega[max_kg]
+        else:
+            self._cache_carrega, self._cache_carrega_versio = {}, versio
+
+        _perfil.comptar("estimacions_carrega")
+        num_porcs, kg = 0, 0.0
+        for lot in self.lots:
+            n, k = lot._ramat.estimar_carrega_lot(lot._i, max_kg - kg)
+            num_porcs += n
+            kg += k
+        if versio is not None:
+            self._cache_carrega[max_kg] = (num_porcs, kg)
+        return num_porcs, kg
+
+    @staticmethod
+    def estimar_carregues(granges, max_kg):
+        """
+        `estimar_carrega` de moltes granges. Les que no tenen el resultat en cache es calculen totes
+        juntes amb Ramat.estimar_carrega_granges i hi queden desades. Retorna un array (n, 2) de (porcs, kg).
+        """
+        carregues = np.zeros((len(granges), 2))
+        ramat = granges[0]._ramat if granges else None
+        pendents = []
+        for n, g in enumerate(granges):
+            if ramat is None or g._ramat is not ramat:
+                carregues[n] = g.estimar_carrega(max_kg)
+            elif g._cache_carrega_versio == ramat.versio_granja[g._idx] and max_kg in g._cache_carrega:
+                _perfil.comptar("estimacions_carrega_cache")
+                carregues[n] = g._cache_carrega[max_kg]
+            else:
+                pendents.append(n)
+        if pendents:
+            _perfil.comptar("estimacions_carrega", len(pendents))
+            idx = [granges[n]._idx for n in pendents]
+            porcs, kg = ramat.estimar_carrega_granges(idx, max_kg)
+            carregues[pendents, 0], carregues[pendents, 1] = porcs, kg
+            for n, versio, carrega in zip(pendents, ramat.versio_granja[idx].tolist(), zip(porcs.tolist(), kg.tolist())):
+                g = granges[n]
+                if g._cache_carrega_versio != versio:
+                    g._cache_carrega, g._cache_carrega_versio = {}, versio
+                g._cache_carrega[max_kg] = carrega
+        return carregues
+
     def calcular_consum_diari(self):
         """
-        Calcula el cost diari d'alimentació.
+        Calcula el cost diari d'alimentació. Consolidada en un Ramat, és la seva entrada de la cache
+        de cost per granja; si no, es recorren els lots.
         """
+        if self._ramat is not None:
+            cost_dia_total = float(self._ramat.cost_menjar_diari()[self._idx])
+            self.menjar_consumit_acumulat += cost_dia_total
+            return cost_dia_total
         cost_dia_total = 0
-        
+
         for lot in self.lots:
             if lot.quantitat > 0:
                 kg_setmana_per_porc = lot.obtenir_consum_setmanal_per_porc()
@@ -205,20 +740,17 @@ class Granja:
 
     def te_porcs_per_venda(self):
         if self.get_total_porcs() == 0: return False
-        max_pes = 0
-        for lot in self.lots:
-            if len(lot.pesos_individuals) > 0:
-                current_max = np.max(lot.pesos_individuals)
-                if current_max > max_pes:
-                    max_pes = current_max
+        max_pes = max((float(np.max(lot.pesos_individuals)) for lot in self.lots if lot.quantitat > 0), default=0)
         return max_pes > 100
 
 
 class Escorxador:
-    def __init__(self, id_esc, lat, lon, capacitat_diaria):
+    def __init__(self, id_esc, lat, lon, capacitat_diaria, preu_kg=PREU_BASE_KG, limits_penalitzacio=LIMITS_PENALITZACIO):
         self.id = id_esc
         self.location = (lat, lon)
         self.capacitat_diaria = capacitat_diaria
+        self.preu_kg = preu_kg
+        self.limits_penalitzacio = limits_penalitzacio
         self.processats_avui = 0
 
     def reset_diari(self):
@@ -228,6 +760,106 @@ class Escorxador:
         return self.capacitat_diaria - self.processats_avui
 
 
+class Flota:
+    """
+    Flota heterogènia (un array per atribut i un índex per camió) amb un planificador best-fit:
+    cada viatge va al camió del tipus demanat amb menys hores restants que encara el pugui fer,
+    tenint en compte tant el límit diari (MAX_HORES_DIA) com el setmanal de cada camió.
+    """
+    def __init__(self, tipus, capacitat_kg, cost_km, max_hores_setmana, cost_fix_setmanal, ids=None):
+        self.tipus = [str(t) for t in tipus]
+        self.ids = [str(i) for i in ids] if ids is not None else [f"T{c + 1}" for c in range(len(self.tipus))]
+        self.capacitat_kg = np.asarray(capacitat_kg, dtype=np.float64)
+        self.cost_km = np.asarray(cost_km, dtype=np.float64)
+        self.max_hores_setmana = np.asarray(max_hores_setmana, dtype=np.float64)
+        self.cost_fix_setmanal = np.asarray(cost_fix_setmanal, dtype=np.float64)
+        self.hores_dia = np.zeros(len(self.tipus))
+        self.hores_setmana = np.zeros(len(self.tipus))
+        self.viatges_dia = [0] * len(self.tipus)
+
+        # Classes de camió: mateix tipus, capacitat i cost per km
+        claus = list(zip(self.tipus, self.capacitat_kg.tolist(), self.cost_km.tolist()))
+        self.classes = sorted(set(claus), key=lambda c: (c[2], -c[1]))
+        self.classe_camio = [self.classes.index(c) for c in claus]
+        self._lliures = None
+        self.nou_dia()
+
+    @classmethod
+    def per_defecte(cls, num_grans=NUM_CAMIONS_FLOTA, num_petits=NUM_CAMIONS_PETITS):
+        n = num_grans + num_petits
+        return cls(
+            ["GRAN"] * num_grans + ["PETIT"] * num_petits,
+            [CAPACITAT_CAMIO_GRAN] * num_grans + [CAPACITAT_CAMIO_PETIT] * num_petits,
+            [COST_KM_GRAN] * num_grans + [COST_KM_PETIT] * num_petits,
+            [MAX_HORES_SETMANA_CAMIO] * n,
+            [COST_CAMIO_FIXE_SETMANAL] * n,
+        )
+
+    @classmethod
+    def carregar(cls, fitxer=FITXER_TRANSPORTS):
+        """
+        Flota de la taula Transports (CSV, JSON o logistics 1.db; capacity_tons en tones), sense els
+        camions amb available = 0. Si la font no té files, la flota per defecte.
+        """
+        try:
+            t = carregar_taula(fitxer, "Transports")
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            return cls.per_defecte()
+        disponibles = t["available"] != 0  # NaN (sense informació) compta com a disponible
+        t = {c: v[disponibles] for c, v in t.items()}
+        if len(t["transport_id"]) == 0:
+            return cls.per_defecte()
+        num = lambda col, defecte: np.where(np.isnan(t[col]), defecte, t[col])
+        return cls(
+            np.char.upper(np.where(t["type"] == "", "GRAN", t["type"])),
+            num("capacity_tons", CAPACITAT_CAMIO_GRAN / 1000) * 1000,
+            num("cost_per_km", COST_KM_GRAN),
+            num("max_hours_per_week", MAX_HORES_SETMANA_CAMIO),
+            num("fixed_weekly_cost", COST_CAMIO_FIXE_SETMANAL),
+            ids=t["transport_id"],
+        )
+
+    def __len__(self):
+        return len(self.tipus)
+
+    @property
+    def capacitat_max(self):
+        return float(self.capacitat_kg.max()) if len(self.tipus) else 0.0
+
+    def hores_restants(self, c):
+        return min(MAX_HORES_DIA - self.hores_dia[c], self.max_hores_setmana[c] - self.hores_setmana[c])
+
+    def nou_dia(self):
+        self.hores_dia[:] = 0
+        self.viatges_dia = [0] * len(self.tipus)
+        # Per classe, llista ordenada de (hores restants, camió): el best-fit és un bisect
+        self._lliures = [[] for _ in self.classes]
+        for c, k in enumerate(self.classe_camio):
+            self._lliures[k].append((self.hores_restants(c), c))
+        for llista in self._lliures:
+            llista.sort()
+
+    def nova_setmana(self):
+        self.hores_setmana[:] = 0
+
+    def buscar_camio(self, classe, temps):
+        """Camió de la classe amb menys hores restants >= `temps` (O(log n)), o -1."""
+        llista = self._lliures[classe]
+        k = bisect.bisect_left(llista, (temps, -1))
+        return llista[k][1] if k < len(llista) else -1
+
+    def assignar(self, c, temps):
+        llista = self._lliures[self.classe_camio[c]]
+        llista.pop(bisect.bisect_left(llista, (self.hores_restants(c), c)))
+        self.hores_dia[c] += temps
+        self.hores_setmana[c] += temps
+        self.viatges_dia[c] += 1
+        bisect.insort(llista, (self.hores_restants(c), c))
+
+    def saturada(self):
+        return all(not llista or llista[-1][0] <= 0 for llista in self._lliures)
+
+
 # --- 3. FUNCIONS AUXILIARS ---
 
 def calcular_distancia_km(coord1, coord2):
@@ -238,31 +870,404 @@ def calcular_distancia_km(coord1, coord2):
     return math.sqrt(dx ** 2 + dy ** 2)
 
 
-def calcular_benefici_lot(llista_pesos):
-    ingressos = 0
-    penalitzacions_total = 0
-
-    for pes in llista_pesos:
-        descompte = 0
-        if 105 <= pes <= 115:
-            descompte = 0
-        elif (100 <= pes < 105) or (115 < pes <= 120):
-            descompte = PENALITZACIO_LLEU
-        else:
-            descompte = PENALITZACIO_GREU
-
-        valor_brut = pes * PREU_BASE_KG
-        penalitzacio = valor_brut * descompte
-        ingressos += (valor_brut - penalitzacio)
-        penalitzacions_total += penalitzacio
-
-    return ingressos, penalitzacions_total
-
-def print_configuracion():
+def _distancies_km(lat1, lon1, lat2, lon2, mode=MODE_DISTANCIA):
+    """Distàncies element a element (amb broadcasting) entre coordenades en graus."""
+    if mode == "haversine":
+        lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * RADI_TERRA_KM * np.arcsin(np.sqrt(a))
+    if mode != "pla":
+        raise ValueError(f"Mode de distància desconegut: {mode}")
+    dy = (lat2 - lat1) * 111
+    dx = (lon2 - lon1) * 85
+    return np.sqrt(dx ** 2 + dy ** 2)
+
+
+def _esborrar_fitxers(*fitxers):
+    for fitxer in fitxers:
+        try:
+            os.remove(fitxer)
+        except OSError:
+            pass  # Ja esborrat, o encara obert en un sistema que no deixa esborrar-lo
+
+
+class MatriuDistancies:
+    """
+    Distàncies (km) i temps de viatge (h) entre tots els nodes de l'entorn, calculats un sol cop.
+    Els nodes 0..N-1 són les granges (en l'ordre de `granges`) i els següents, els escorxadors;
+    cada entitat en guarda l'índex a `_idx`. Per a conjunts molt grans la matriu és float32 en un
+    fitxer mapat a memòria i es calcula per blocs de files. Sense `fitxer`, els fitxers temporals
+    viuen el que viu l'objecte: en POSIX es treuen del disc tan bon punt estan mapats (l'espai
+    s'allibera en tancar-se el mapa) i, si no, en alliberar l'objecte o en sortir del procés.
+    """
+    def __init__(self, lats, lons, mode=MODE_DISTANCIA, fitxer=None, max_nodes_memoria=MAX_NODES_MATRIU_MEMORIA):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.mode = mode
+        self.fitxer = fitxer
+        self._columnes = {}
+        n = len(lats)
+
+        if n <= max_nodes_memoria and fitxer is None:
+            self.dist = _distancies_km(lats[:, None], lons[:, None], lats[None, :], lons[None, :], mode)
+            self.temps = self.dist / VELOCITAT_MITJANA
+            return
+
+        temporal = fitxer is None
+        if temporal:
+            fd, fitxer = tempfile.mkstemp(prefix="distancies_", suffix=".f32")
+            os.close(fd)
+        self.dist = np.memmap(fitxer, dtype=np.float32, mode='w+', shape=(n, n))
+        self.temps = np.memmap(fitxer + ".temps", dtype=np.float32, mode='w+', shape=(n, n))
+        if temporal:
+            self._esborrar = weakref.finalize(self, _esborrar_fitxers, fitxer, fitxer + ".temps")
+            if os.name == "posix":
+                self._esborrar()
+        bloc = max(1, (1 << 22) // max(n, 1))  # ~4M elements per bloc
+        for i in range(0, n, bloc):
+            files = _distancies_km(lats[i:i + bloc, None], lons[i:i + bloc, None], lats[None, :], lons[None, :], mode)
+            self.dist[i:i + bloc] = files
+            self.temps[i:i + bloc] = files / VELOCITAT_MITJANA
+        self.dist.flush()
+        self.temps.flush()
+
+    def columnes(self, nodes):
+        """
+        Les columnes `nodes` de `dist` (p. ex. les dels escorxadors) per a tots els nodes, en float64.
+        Es llegeixen un sol cop: recollir-les cada dia del fitxer mapat vol tocar una pàgina per fila.
+        """
+        clau = tuple(nodes)
+        if clau not in self._columnes:
+            self._columnes[clau] = np.asarray(self.dist[:, list(clau)], dtype=np.float64)
+        return self._columnes[clau]
+
+    @classmethod
+    def des_de_entorn(cls, granges, escorxadors, **kwargs):
+        nodes = list(granges) + list(escorxadors)
+        for i, node in enumerate(nodes):
+            node._idx = i
+        return cls([n.location[0] for n in nodes], [n.location[1] for n in nodes], **kwargs)
+
+
+def _factor_cota_haversine(lats, lons):
+    """
+    Factor que converteix una distància en cel·les de la graella (111/85 km per grau) en una cota
+    inferior de la distància haversine entre els punts donats. En latitud, un grau són sempre
+    R·π/180 km o més; en longitud, com a mínim R·π/180·cos(φ_max)·sinc(Δλ/2), amb φ_max la latitud
+    absoluta màxima i Δλ l'amplada en longitud del conjunt (el cercle màxim retalla el paral·lel).
+    """
+    if len(lats) == 0:
+        return 1.0
+    km_grau = RADI_TERRA_KM * math.pi / 180
+    cos_max = math.cos(math.radians(float(np.max(np.abs(lats)))))
+    amplada = math.radians(float(np.max(lons) - np.min(lons)))
+    km_grau_lon = km_grau * cos_max * float(np.sinc(amplada / (2 * math.pi)))
+    return min(km_grau / 111, km_grau_lon / 85)
+
+
+class IndexEspacial:
+    """
+    Graella uniforme (en km, amb la mateixa projecció 111/85 del mode "pla") sobre les granges
+    per a consultes de veïns més propers i per radi restringides als nodes actius. Desactivar un
+    node (p. ex. quan es marca `visitada_aquesta_setmana`) és O(1). Les distàncies retornades
+    surten de la `MatriuDistancies`, de manera que coincideixen amb la resta del càlcul de rutes.
+    """
+    def __init__(self, lats, lons, distancies, mida_cella_km=MIDA_CELLA_INDEX_KM):
+        self.distancies = distancies
+        self.mida = mida_cella_km
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        # La projecció plana és una cota inferior exacta del mode "pla"; amb haversine, la graella
+        # sobreestima la longitud a latituds altes i cal escalar-la (0.944 a 43.8°N, p. ex.)
+        self._factor_cota = 1.0 if distancies.mode == "pla" else _factor_cota_haversine(lats, lons)
+        cx = np.floor(lons * 85 / mida_cella_km).astype(np.int64)
+        cy = np.floor(lats * 111 / mida_cella_km).astype(np.int64)
+        self.cella = np.stack([cx, cy], axis=1)
+        self.actiu = np.zeros(len(cx), dtype=bool)
+        self.cx_min, self.cx_max = (int(cx.min()), int(cx.max())) if len(cx) else (0, -1)
+        self.cy_min, self.cy_max = (int(cy.min()), int(cy.max())) if len(cy) else (0, -1)
+
+        ordre = np.lexsort((cy, cx))
+        claus, inicis = np.unique(self.cella[ordre], axis=0, return_index=True)
+        trams = np.split(ordre, inicis[1:])
+        self.nodes_cella = {(int(x), int(y)): ids for (x, y), ids in zip(claus, trams)}
+        self.actius_cella = dict.fromkeys(self.nodes_cella, 0)
+
+    def activar(self, nodes):
+        for i in nodes:
+            if not self.actiu[i]:
+                self.actiu[i] = True
+                self.actius_cella[tuple(self.cella[i])] += 1
+
+    def desactivar(self, i):
+        if self.actiu[i]:
+            self.actiu[i] = False
+            self.actius_cella[tuple(self.cella[i])] -= 1
+
+    def buidar(self):
+        self.actiu[:] = False
+        self.actius_cella = dict.fromkeys(self.nodes_cella, 0)
+
+    def _anell(self, cx, cy, r):
+        if r == 0:
+            yield cx, cy
+            return
+        for x in range(cx - r, cx + r + 1):
+            yield x, cy - r
+            yield x, cy + r
+        for y in range(cy - r + 1, cy + r):
+            yield cx - r, y
+            yield cx + r, y
+
+    def k_mes_propers(self, node, k=1, radi=np.inf, exclou=()):
+        """Els `k` nodes actius més propers a `node` a distància < `radi`, com a llista de (node, km)."""
+        cx, cy = (int(v) for v in self.cella[node])
+        r_max = max(cx - self.cx_min, self.cx_max - cx, cy - self.cy_min, self.cy_max - cy, 0)
+        fila = self.distancies.dist[node]
+        trobats = []
+        _perfil.comptar("consultes_veins")
+        for r in range(r_max + 1):
+            # Tot el que queda per explorar és com a mínim a (r - 1) cel·les de distància
+            cota = max(r - 1, 0) * self.mida * self._factor_cota
+            if cota >= radi or (len(trobats) >= k and trobats[k - 1][1] <= cota):
+                break
+            for clau in self._anell(cx, cy, r):
+                if not self.actius_cella.get(clau):
+                    continue
+                ids = self.nodes_cella[clau]
+                ids = ids[self.actiu[ids]]
+                _perfil.comptar("avaluacions_distancia", len(ids))
+                for i, d in zip(ids.tolist(), fila[ids].tolist()):
+                    if d < radi and i != node and i not in exclou:
+                        trobats.append((i, d))
+            trobats.sort(key=lambda t: t[1])
+        return trobats[:k]
+
+    def dins_radi(self, node, radi, exclou=()):
+        return self.k_mes_propers(node, k=len(self.actiu), radi=radi, exclou=exclou)
+
+
+class CuaPrioritat:
+    """
+    Heap indexat de granges candidates amb invalidació mandrosa: actualitzar o eliminar una granja
+    només n'incrementa la versió, i les entrades obsoletes es descarten quan arriben al cim.
+    A igual prioritat guanya l'índex de granja més baix, com l'ordenació estable original.
+    """
+    def __init__(self, num_nodes):
+        self._heap = []
+        self._versio = [0] * num_nodes
+        self._actiu = [False] * num_nodes
+        self._mida = 0
+
+    def __len__(self):
+        return self._mida
+
+    def __contains__(self, i):
+        return self._actiu[i]
+
+    def reconstruir(self, nodes, prioritats):
+        self._actiu = [False] * len(self._versio)
+        for i in nodes:
+            self._actiu[i] = True
+        self._mida = len(nodes)
+        self._heap = [(-p, i, self._versio[i]) for i, p in zip(nodes, prioritats)]
+        heapq.heapify(self._heap)
+
+    def actualitzar(self, i, prioritat):
+        self._versio[i] += 1
+        heapq.heappush(self._heap, (-prioritat, i, self._versio[i]))
+        if not self._actiu[i]:
+            self._actiu[i] = True
+            self._mida += 1
+        self._compactar()
+
+    def eliminar(self, i):
+        if self._actiu[i]:
+            self._versio[i] += 1
+            self._actiu[i] = False
+            self._mida -= 1
+
+    def ordenats(self):
+        """Recorre les granges actives per ordre de prioritat sense modificar la cua: O(n + k log n) per a k granges."""
+        heap = list(self._heap)
+        while heap:
+            _, i, versio = heapq.heappop(heap)
+            if self._actiu[i] and versio == self._versio[i]:
+                yield i
+
+    def cim(self):
+        """Granja activa amb més prioritat (sense treure-la), o None."""
+        heap = self._heap
+        while heap:
+            _, i, versio = heap[0]
+            if self._actiu[i] and versio == self._versio[i]:
+                return i
+            heapq.heappop(heap)
+        return None
+
+    def _compactar(self):
+        if len(self._heap) > 2 * self._mida + 64:
+            self._heap = [e for e in self._heap if self._actiu[e[1]] and e[2] == self._versio[e[1]]]
+            heapq.heapify(self._heap)
+
+
+def resoldre_transport(cost, oferta, capacitat):
+    """
+    Problema de transport de cost mínim: `cost` (N, E) per unitat (negatiu = surt a compte), `oferta`
+    (N,) i `capacitat` (E,) enteres. Envia flux mentre el camí augmentador més barat tingui cost negatiu.
+
+    Camins més curts successius sobre el graf residual comprimit als E destins: l'aresta j -> k és la
+    granja amb flux cap a j que surt més barata de reassignar a k, mantinguda en un heap per parella
+    (j, k) amb invalidació mandrosa. El cim vàlid de cada heap es desa a `cim` i només es refresca per
+    als destins que toca l'augment, de manera que el Dijkstra O(E^2) no consulta cap heap. Cada augment
+    costa O(E^2 + E log N) i el cost creix linealment amb les granges. Retorna la matriu de flux (N, E).
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    N, E = cost.shape
+    flux = np.zeros((N, E), dtype=np.int64)
+    if N == 0 or E == 0:
+        return flux
+    resta_oferta = np.asarray(oferta, dtype=np.int64).tolist()
+    resta_cap = np.asarray(capacitat, dtype=np.int64).tolist()
+    C = cost.tolist()
+    F = [[0] * E for _ in range(N)]
+
+    # Arestes font -> destí: orígens per ordre de cost amb un punter (l'oferta restant només baixa)
+    ordre_font = np.argsort(cost, axis=0, kind='stable').T.tolist()
+    punter = [0] * E
+    reassignar = [[[] for _ in range(E)] for _ in range(E)]
+    cim = [[math.inf] * E for _ in range(E)]  # cim[j][k]: cost de reassignar de j a k, o inf
+    cim_granja = [[-1] * E for _ in range(E)]
+    potencial = [0.0] * E
+
+    while True:
+        _perfil.comptar("iteracions_transport")
+        # Dijkstra sobre els E destins amb costos reduïts (tots no negatius gràcies als potencials)
+        dist = [math.inf] * E
+        entrada = [None] * E
+        for j in range(E):
+            ordre, q = ordre_font[j], punter[j]
+            while q < N and resta_oferta[ordre[q]] <= 0:
+                q += 1
+            punter[j] = q
+            if q < N:
+                dist[j] = C[ordre[q]][j] - potencial[j]
+                entrada[j] = (-1, ordre[q])
+        pendents = list(range(E))
+        while pendents:
+            j = min(pendents, key=dist.__getitem__)
+            if dist[j] == math.inf:
+                break
+            pendents.remove(j)
+            fila, granja = cim[j], cim_granja[j]
+            for k in pendents:
+                d = dist[j] + fila[k] + potencial[j] - potencial[k]
+                if d < dist[k]:
+                    dist[k] = d
+                    entrada[k] = (j, granja[k])
+        for j in range(E):
+            if dist[j] < math.inf:
+                potencial[j] += dist[j]
+
+        # Destí amb capacitat més barat; si ja no surt a compte, hem acabat
+        lliures = [j for j in range(E) if resta_cap[j] > 0 and dist[j] < math.inf]
+        if not lliures:
+            break
+        desti = min(lliures, key=potencial.__getitem__)
+        if potencial[desti] >= 0:
+            break
+
+        cami = []
+        j = desti
+        while True:
+            origen, i = entrada[j]
+            cami.append((origen, i, j))
+            if origen == -1:
+                break
+            j = origen
+        delta = resta_cap[desti]
+        for origen, i, _ in cami:
+            delta = min(delta, resta_oferta[i] if origen == -1 else F[i][origen])
+
+        resta_cap[desti] -= delta
+        tocats = set()
+        for origen, i, j in cami:
+            if origen == -1:
+                resta_oferta[i] -= delta
+            else:
+                F[i][origen] -= delta
+                tocats.add(origen)
+            if F[i][j] == 0:
+                for k in range(E):
+                    if k != j:
+                        heapq.heappush(reassignar[j][k], (C[i][k] - C[i][j], i))
+                tocats.add(j)
+            F[i][j] += delta
+        for j in tocats:
+            for k, heap in enumerate(reassignar[j]):
+                while heap and F[heap[0][1]][j] <= 0:
+                    heapq.heappop(heap)
+                cim[j][k], cim_granja[j][k] = heap[0] if heap else (math.inf, -1)
+
+    flux[:] = F
+    return flux
+
+
+def valorar_carrega(pesos, preu_kg=PREU_BASE_KG, limits=LIMITS_PENALITZACIO,
+                    penalitzacio_lleu=PENALITZACIO_LLEU, penalitzacio_greu=PENALITZACIO_GREU):
+    """
+    Motor de preus vectoritzat: classifica tota la càrrega alhora en les franges òptima / lleu / greu.
+    `preu_kg` i `limits` poden ser taules per escorxador (forma (E,) i (E, 4)); llavors la mateixa
+    càrrega es valora contra tots els escorxadors a la vegada.
+    Retorna (ingressos, penalitzacions, recompte) amb recompte[..., :] = porcs (òptim, lleu, greu).
+    """
+    pesos = np.sort(np.asarray(pesos, dtype=np.float64))
+    prefix = np.zeros(len(pesos) + 1)
+    np.cumsum(pesos, out=prefix[1:])
+    limits = np.asarray(limits, dtype=np.float64)
+
+    # Franges tancades [penalty_20_min, penalty_20_max] i [penalty_15_min, penalty_15_max]
+    baix = np.searchsorted(pesos, limits[..., [0, 1]], side='left')
+    alt = np.searchsorted(pesos, limits[..., [3, 2]], side='right')
+    n_dins = alt - baix
+    kg_dins = prefix[alt] - prefix[baix]
+
+    n_optim, kg_optim = n_dins[..., 1], kg_dins[..., 1]
+    n_lleu, kg_lleu = n_dins[..., 0] - n_optim, kg_dins[..., 0] - kg_optim
+    n_greu, kg_greu = len(pesos) - n_dins[..., 0], prefix[-1] - kg_dins[..., 0]
+
+    preu_kg = np.asarray(preu_kg, dtype=np.float64)
+    penalitzacions = preu_kg * (penalitzacio_lleu * kg_lleu + penalitzacio_greu * kg_greu)
+    ingressos = preu_kg * prefix[-1] - penalitzacions
+    return ingressos, penalitzacions, np.stack([n_optim, n_lleu, n_greu], axis=-1)
+
+
+def taula_preus_escorxadors(df):
+    """Taules (preus_kg, limits) per a `valorar_carrega` a partir de columnes com les de slaughterhouses 1.csv."""
+    columnes = ['penalty_20_min', 'penalty_15_min', 'penalty_15_max', 'penalty_20_max']
+    limits = df.reindex(columns=columnes).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    limits = np.where(np.isnan(limits), np.asarray(LIMITS_PENALITZACIO, dtype=np.float64), limits)
+    preus = pd.to_numeric(df.reindex(columns=['price_per_kg'])['price_per_kg'], errors='coerce').to_numpy(dtype=np.float64)
+    preus = np.where(np.isnan(preus), PREU_BASE_KG, preus)
+    return preus, limits
+
+
+def calcular_benefici_lot(llista_pesos, escorxador=None):
+    if escorxador is None:
+        ingressos, penalitzacions, _ = valorar_carrega(llista_pesos)
+    else:
+        ingressos, penalitzacions, _ = valorar_carrega(llista_pesos, escorxador.preu_kg, escorxador.limits_penalitzacio)
+    return float(ingressos), float(penalitzacions)
+
+def print_configuracion(flota=None):
     print("\n" + "="*50)
     print("   PARÀMETRES DE LA SIMULACIÓ")
     print("="*50)
-    print(f"Flota Disponible:      {NUM_CAMIONS_FLOTA} camions")
+    if flota is None:
+        print(f"Flota Disponible:      {NUM_CAMIONS_FLOTA} camions")
+    else:
+        per_tipus = pd.Series(flota.tipus).value_counts()
+        print(f"Flota Disponible:      {len(flota)} camions ({', '.join(f'{n} {t}' for t, n in per_tipus.items())})")
     print(f"Cost Fix Camió:        {COST_CAMIO_FIXE_SETMANAL} €/setmana")
     print(f"Cost Km (Gran/Petit):  {COST_KM_GRAN}/{COST_KM_PETIT} €/km")
     print(f"Preu Venda Porc:       {PREU_BASE_KG} €/kg")
@@ -271,9 +1276,86 @@ def print_configuracion():
     print("="*50 + "\n")
 
 
+# --- Instrumentació ---
+
+class Perfil:
+    """
+    Temps i comptadors per fase i per dia d'una simulació (`simular(perfil=Perfil())`). Les fases es
+    poden niar i el temps de cadascuna és inclusiu. El dia 0 agrupa el que passa fora del bucle de
+    dies: la simulació sencera ("simulacio") i, des de la línia d'ordres, l'exportació i el dashboard.
+    """
+    def __init__(self):
+        self.dia = 0
+        self.temps = {}  # (dia, fase) -> [segons, crides]
+        self.comptadors = {}  # (dia, nom) -> valor
+
+    @contextlib.contextmanager
+    def fase(self, nom):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.afegir_temps(nom, time.perf_counter() - t0)
+
+    def afegir_temps(self, nom, segons):
+        entrada = self.temps.setdefault((self.dia, nom), [0.0, 0])
+        entrada[0] += segons
+        entrada[1] += 1
+
+    def comptar(self, nom, n=1):
+        clau = (self.dia, nom)
+        self.comptadors[clau] = self.comptadors.get(clau, 0) + n
+
+    def resum(self):
+        """Totals per fase i per comptador, i el desglossament per dia."""
+        fases, comptadors, per_dia = {}, {}, {}
+        for (dia, nom), (segons, crides) in self.temps.items():
+            total = fases.setdefault(nom, {"temps_s": 0.0, "crides": 0})
+            total["temps_s"] += segons
+            total["crides"] += crides
+            per_dia.setdefault(dia, {"dia": dia, "fases": {}, "comptadors": {}})["fases"][nom] = \
+                {"temps_s": segons, "crides": crides}
+        for (dia, nom), valor in self.comptadors.items():
+            comptadors[nom] = comptadors.get(nom, 0) + valor
+            per_dia.setdefault(dia, {"dia": dia, "fases": {}, "comptadors": {}})["comptadors"][nom] = valor
+        return {"fases": fases, "comptadors": comptadors,
+                "per_dia": [per_dia[d] for d in sorted(per_dia)]}
+
+    def exportar(self, prefix):
+        """Escriu `prefix`.json (resum) i `prefix`.csv (una fila per dia, tipus i nom). Retorna els dos fitxers."""
+        with open(prefix + ".json", 'w', encoding='utf-8') as f:
+            json.dump(self.resum(), f, ensure_ascii=False, indent=2)
+        files = [{"dia": d, "tipus": "temps_s", "nom": nom, "valor": segons, "crides": crides}
+                 for (d, nom), (segons, crides) in self.temps.items()]
+        files += [{"dia": d, "tipus": "comptador", "nom": nom, "valor": valor, "crides": None}
+                  for (d, nom), valor in self.comptadors.items()]
+        pd.DataFrame(files, columns=["dia", "tipus", "nom", "valor", "crides"]).astype({"crides": "Int64"}) \
+            .sort_values(["dia", "tipus", "nom"]).to_csv(prefix + ".csv", index=False)
+        return prefix + ".json", prefix + ".csv"
+
+
+class _PerfilInactiu:
+    """Mateixa interfície que Perfil sense fer res: és el valor per defecte dels punts d'instrumentació."""
+    dia = 0
+    _sense_fase = contextlib.nullcontext()
+
+    def fase(self, nom):
+        return self._sense_fase
+
+    def afegir_temps(self, nom, segons):
+        pass
+
+    def comptar(self, nom, n=1):
+        pass
+
+
+PERFIL_INACTIU = _PerfilInactiu()
+_perfil = PERFIL_INACTIU  # Perfil de la simulació en curs (el fixa simular)
+
+
 # --- 4. GENERACIÓ D'ENTORN ---
 
-def generar_entorn():
+def generar_entorn(mode_distancia=MODE_DISTANCIA, num_escorxadors=NUM_ESCORXADORS):
     lat_min, lat_max = 41.50, 42.10
     lon_min, lon_max = 0.50, 2.50
     
@@ -299,267 +1381,866 @@ def generar_entorn():
             g.afegir_lot(lot)
             
         granges.append(g)
-        
-    return escorxador, granges
 
+    # Escorxadors addicionals dins la mateixa zona, amb capacitat i preu propis
+    escorxadors = [escorxador]
+    for k in range(1, num_escorxadors):
+        escorxadors.append(Escorxador(
+            f"ESCO_{k + 1}", lat_c + random.uniform(-0.3, 0.3), lon_c + random.uniform(-0.4, 0.4),
+            capacitat_diaria=random.randint(1000, 2000), preu_kg=round(PREU_BASE_KG * random.uniform(0.97, 1.03), 3)))
+
+    distancies = MatriuDistancies.des_de_entorn(granges, escorxadors, mode=mode_distancia)
+    return escorxadors, granges, distancies
+
+
+def _flux_aleatori(llavor, *clau):
+    """Generador fill `clau` de la llavor (el mateix que donaria SeedSequence(llavor).spawn), accessible sense crear els altres."""
+    return np.random.default_rng(np.random.SeedSequence(llavor, spawn_key=clau))
+
+
+def generar_pesos_granges(llavor, quantitats, pes_mig, desviacio_std, inici_lots, granges):
+    """
+    Pesos individuals de les granges `granges` (cada lot de més pesat a menys), concatenats.
+    Cada granja fa servir el seu propi flux fill de `llavor`, de manera que el resultat d'una granja
+    no depèn de quines altres es generen: es pot repartir per rangs entre processos.
+    `inici_lots[i]:inici_lots[i + 1]` són els lots de la granja i.
+    """
+    granges = np.asarray(granges, dtype=np.int64)
+    lots = np.concatenate([np.arange(inici_lots[i], inici_lots[i + 1]) for i in granges]) if len(granges) \
+        else np.empty(0, dtype=np.int64)
+    limits = np.zeros(len(lots) + 1, dtype=np.int64)
+    np.cumsum(quantitats[lots], out=limits[1:])
+    pesos = np.empty(limits[-1])
+    k = 0
+    for i in granges.tolist():
+        n_lots = int(inici_lots[i + 1] - inici_lots[i])
+        a, b = limits[k], limits[k + n_lots]
+        _flux_aleatori(llavor, 1, i).standard_normal(out=pesos[a:b])
+        for l in range(k, k + n_lots):
+            tram = pesos[limits[l]:limits[l + 1]]
+            tram[::-1].sort()
+            tram *= desviacio_std[lots[l]]
+            tram += pes_mig[lots[l]]
+        k += n_lots
+    return pesos
+
+
+def generar_entorn_massiu(escala="regional", seed=0, mode_distancia=MODE_DISTANCIA):
+    """
+    Entorn sintètic vectoritzat per a escenaris grans (`escala` de ESCALES_ENTORN o un dict amb les
+    mateixes claus). Coordenades, edats, mides de lot i z-scores surten de poques operacions sobre
+    arrays; els pesos, de generar_pesos_granges, i s'escriuen directament en un únic Ramat ja ordenat.
+    Tot és reproduïble a partir de `seed` (np.random.Generator) i no toca l'estat global de random.
+    """
+    cfg = ESCALES_ENTORN[escala] if isinstance(escala, str) else escala
+    n_granges, n_lots_granja, n_esc = cfg["granges"], cfg["lots"], cfg["escorxadors"]
+    lat_min, lat_max, lon_min, lon_max = cfg["zona"]
+    gen = _flux_aleatori(seed, 0)
+
+    lat_esc = gen.uniform(lat_min, lat_max, n_esc)
+    lon_esc = gen.uniform(lon_min, lon_max, n_esc)
+    preus_esc = np.round(PREU_BASE_KG * gen.uniform(0.97, 1.03, n_esc), 3)
+    lat_g = gen.uniform(lat_min, lat_max, n_granges)
+    lon_g = gen.uniform(lon_min, lon_max, n_granges)
+
+    n_lots = n_granges * n_lots_granja
+    granja_lot = np.repeat(np.arange(n_granges), n_lots_granja)
+    inici_lots = np.arange(0, n_lots + 1, n_lots_granja)
+    edats = gen.integers(15, 25, n_lots)
+    quantitats = gen.integers(cfg["porcs_lot"][0], cfg["porcs_lot"][1] + 1, n_lots)
+    z_intake = gen.standard_normal(n_lots)
+    pes_mig, desviacio_std = _consultar_taula(GROWTH_MEAN, edats), _consultar_taula(GROWTH_SD, edats)
+
+    pesos = generar_pesos_granges(seed, quantitats, pes_mig, desviacio_std, inici_lots, np.arange(n_granges))
+    ramat = Ramat(pesos, quantitats, edats, z_intake, granja_lot, n_granges,
+                  pes_mig=pes_mig, desviacio_std=desviacio_std, ordenat=True)
+    del pesos
+
+    porcs_granja = np.bincount(granja_lot, weights=quantitats, minlength=n_granges)
+    granges = []
+    for i, (lat, lon, porcs) in enumerate(zip(lat_g.tolist(), lon_g.tolist(), porcs_granja.tolist())):
+        g = Granja(f"GRANJA_{i + 1}", lat, lon, capacitat_total=int(porcs * 1.25))
+        g.lots = [PorcBatch.vista(f"L_{i}_{j}", ramat, i * n_lots_granja + j) for j in range(n_lots_granja)]
+        g._ramat, g._idx = ramat, i
+        granges.append(g)
 
-# --- 5. LÒGICA DE SIMULACIÓ ---
+    escorxadors = [Escorxador(f"ESCO_{k + 1}", lat, lon, capacitat_diaria=cfg["capacitat_escorxador"], preu_kg=preu)
+                   for k, (lat, lon, preu) in enumerate(zip(lat_esc.tolist(), lon_esc.tolist(), preus_esc.tolist()))]
+    distancies = MatriuDistancies.des_de_entorn(granges, escorxadors, mode=mode_distancia)
+    return escorxadors, granges, distancies
+
+
+# --- Dades reals (Dades/) ---
+
+def _llegir_font(fitxer, taula):
+    """Taula sense tipar d'un CSV, un JSON (llista de registres), una fulla d'un .xlsx o una taula de SQLite."""
+    ext = os.path.splitext(fitxer)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(fitxer, dtype=str, keep_default_na=False)
+    if ext == ".json":
+        with open(fitxer, encoding='utf-8') as f:
+            return pd.DataFrame.from_records(json.load(f))
+    if ext in (".db", ".sqlite"):
+        with contextlib.closing(sqlite3.connect(fitxer)) as con:
+            return pd.read_sql_query(f'SELECT * FROM "{taula}"', con)
+    if ext in (".xlsx", ".xls"):
+        return pd.read_excel(fitxer, sheet_name=taula)
+    raise ValueError(f"Format de dades no suportat: {fitxer}")
+
+
+def _tipar_taula(df, taula):
+    """
+    Tipus per columna sencera (no fila a fila): text com a str, números com a float64 amb NaN on el
+    camp és buit o no numèric (granjas.json ho guarda tot com a text). Es descarten les files sense id.
+    """
+    text, numeriques = COLUMNES_DADES[taula]
+    df = df.reindex(columns=text + numeriques)
+    columnes = {c: df[c].fillna("").astype(str).str.strip().to_numpy(dtype=str) for c in text}
+    valors = df[numeriques].replace({"": None, "True": 1, "False": 0, "true": 1, "false": 0})
+    valors = valors.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    for k, c in enumerate(numeriques):
+        columnes[c] = valors[:, k]
+    valides = columnes[text[0]] != ""
+    return {c: v[valides] for c, v in columnes.items()}
+
+
+def carregar_taula(fitxer, taula, dir_cache=DIR_CACHE_DADES):
+    """
+    Columnes tipades (dict nom -> array) de `taula` llegida de `fitxer`. El resultat es desa com a
+    instantània .npz a `dir_cache`, amb la clau feta del hash del fitxer, i les execucions següents
+    la carreguen directament sense tornar a parsejar. `dir_cache=None` desactiva la cache.
+    """
+    return _instantania_npz(fitxer, taula, lambda: _tipar_taula(_llegir_font(fitxer, taula), taula), dir_cache)
+
+
+def completar_pes_edat(pes, edat):
+    """Omple `avg_weight_kg` i `age_weeks` absents amb la corba de creixement (l'un a partir de l'altre)."""
+    setmanes, mitjanes, _ = CORBA_PES
+    pes, edat = np.array(pes, dtype=np.float64), np.array(edat, dtype=np.float64)
+    nomes_pes = np.isnan(edat) & ~np.isnan(pes)
+    edat[nomes_pes] = np.round(np.interp(pes[nomes_pes], mitjanes, setmanes))
+    edat[np.isnan(edat)] = EDAT_PER_DEFECTE
+    sense_pes = np.isnan(pes)
+    pes[sense_pes] = np.interp(edat[sense_pes], setmanes, mitjanes)
+    return pes, edat.astype(np.int64)
+
+
+def carregar_entorn(font_granges=FITXER_GRANGES, font_escorxadors=FITXER_ESCORXADORS,
+                    mode_distancia=MODE_DISTANCIA, dir_cache=DIR_CACHE_DADES):
+    """
+    Entorn (escorxadors, granges, distàncies) a partir de les dades reals en lloc de l'aleatori de
+    `generar_entorn`. Cada font pot ser CSV, JSON o logistics 1.db. Cada granja és un lot amb el seu
+    inventari, edat i pes mig. Si no hi ha cap escorxador a les dades, se'n posa un de central al
+    centre de les granges; si no hi ha cap granja, ValueError.
+    """
+    g = carregar_taula(font_granges, "Farms", dir_cache)
+    pes, edat = completar_pes_edat(g["avg_weight_kg"], g["age_weeks"])
+    inventari = np.nan_to_num(g["inventory_pigs"]).astype(np.int64)
+    capacitat = np.where(np.isnan(g["capacity"]), inventari, g["capacity"]).astype(np.int64)
 
-def simular():
-    print_configuracion()
-    escorxador, granges = generar_entorn()
-    registre_activitat = []
+    granges = []
+    for id_g, lat, lon, cap, q, e, p in zip(g["farm_id"].tolist(), g["lat"].tolist(), g["lon"].tolist(),
+                                            capacitat.tolist(), inventari.tolist(), edat.tolist(), pes.tolist()):
+        granja = Granja(f"GRANJA_{id_g}", lat, lon, capacitat_total=cap)
+        granja.afegir_lot(PorcBatch(f"L_{id_g}_0", q, e, pes_mig=p))
+        granges.append(granja)
+    if len(granges) == 0:
+        raise ValueError(f"cap granja a {font_granges}")
+
+    esc = {"slaughterhouse_id": np.empty(0, dtype=str)}
+    if font_escorxadors is not None:
+        try:
+            esc = carregar_taula(font_escorxadors, "Slaughterhouses", dir_cache)
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            pass
+    if len(esc["slaughterhouse_id"]):
+        preus, limits = taula_preus_escorxadors(pd.DataFrame(esc))
+        capacitats = np.where(np.isnan(esc["capacity_per_day"]), 1800, esc["capacity_per_day"]).astype(np.int64)
+        escorxadors = [Escorxador(f"ESCO_{id_e}", lat, lon, capacitat_diaria=c, preu_kg=pr, limits_penalitzacio=tuple(lim))
+                       for id_e, lat, lon, c, pr, lim in zip(esc["slaughterhouse_id"].tolist(), esc["lat"].tolist(),
+                                                             esc["lon"].tolist(), capacitats.tolist(), preus.tolist(),
+                                                             limits.tolist())]
+    else:
+        lat_c, lon_c = float(np.mean(g["lat"])), float(np.mean(g["lon"]))
+        escorxadors = [Escorxador("ESCO_CENTRAL", lat_c, lon_c, capacitat_diaria=1800)]
+
+    distancies = MatriuDistancies.des_de_entorn(granges, escorxadors, mode=mode_distancia)
+    return escorxadors, granges, distancies
+
+
+# --- 5. PLANIFICACIÓ DE RUTES ---
+
+MAX_PARADES_RUTA = 3
+FACTOR_POOL_ESTALVIS = 1.5  # Porcs candidats que recull el planificador d'estalvis respecte l'espai de l'escorxador
+MAX_ITERACIONS_CERCA_LOCAL = 100
+MAX_POOL_ESTALVIS_COMPLET = 200  # Per sobre, només es calculen els estalvis amb els veïns més propers
+VEINS_ESTALVIS = 15
+
+
+class ContextPlanificacio:
+    """
+    Estat d'un dia laborable compartit pels planificadors: entorn, candidats, hores de la flota
+    i l'execució (destructiva) de les rutes triades.
+    """
+    def __init__(self, dia, granges, escorxador, distancies, ramat, cua_candidates, index_granges, flota):
+        self.dia = dia
+        self.granges = granges
+        self.escorxador = escorxador
+        self.distancies = distancies
+        self.ramat = ramat
+        self.cua_candidates = cua_candidates
+        self.index_granges = index_granges
+        self.flota = flota
+
+    @property
+    def temps_camions(self):
+        return self.flota.hores_dia
+
+    def estimar_ruta(self, ruta_granges, capacitat_kg=None):
+        """
+        Estimació encadenada (sense modificar lots): distància, temps, porcs i kg acumulats fins a cada
+        parada. Les rutes més curtes en són un prefix; només cal afegir-hi la tornada.
+        """
+        capacitat_kg = self.flota.capacitat_max if capacitat_kg is None else capacitat_kg
+        D, T = self.distancies.dist, self.distancies.temps
+        _perfil.comptar("estimacions_ruta")
+        _perfil.comptar("avaluacions_distancia", len(ruta_granges))
+        acumulat_parades = []
+        dist_anada, t_anada, num_porcs_est, kg_est = 0, 0, 0, 0
+        curr = self.escorxador._idx
+        for g in ruta_granges:
+            dist_anada += float(D[curr, g._idx])
+            t_anada += float(T[curr, g._idx])
+            curr = g._idx
+            n, kg = g.estimar_carrega(capacitat_kg - kg_est)
+            num_porcs_est += n
+            kg_est += kg
+            acumulat_parades.append((dist_anada, t_anada, num_porcs_est, kg_est))
+        return acumulat_parades
+
+    def tancar_ruta(self, ruta_granges, acumulat_parades):
+        """Distància i temps total estimat de `ruta_granges` (prefix de l'estimació) tornant a l'escorxador."""
+        dist_total, t_viatge, num_porcs_est, _ = acumulat_parades[len(ruta_granges) - 1]
+        _perfil.comptar("avaluacions_distancia")
+        curr = ruta_granges[-1]._idx
+        dist_total += float(self.distancies.dist[curr, self.escorxador._idx])
+        t_viatge += float(self.distancies.temps[curr, self.escorxador._idx])
+        t_carrega = num_porcs_est * TEMPS_CARREGA_PER_PORC
+        return dist_total, t_viatge + t_carrega
+
+    def programar_ruta(self, ruta_granges):
+        """
+        Tria el tipus de camió més barat que pot portar tota la càrrega estimada de la ruta (si no en
+        queda cap amb hores, la resta de tipus de més a menys capacitat) i, dins del tipus, el camió
+        per best-fit. Retorna (camio, distància, temps) o None si cap camió pot fer la ruta avui.
+        """
+        flota = self.flota
+        if len(ruta_granges) == 0:
+            return None
+        _perfil.comptar("rutes_provades")
+        acumulat_max = self.estimar_ruta(ruta_granges)
+        kg_ruta = acumulat_max[len(ruta_granges) - 1][3]
+        dist_total = self.tancar_ruta(ruta_granges, acumulat_max)[0]
+
+        def cost_estimat(classe):
+            _, capacitat, cost_km = classe
+            return dist_total * cost_km * max(0.1, min(kg_ruta, capacitat) / capacitat)
+
+        hi_caben = [k for k, c in enumerate(flota.classes) if c[1] >= kg_ruta]
+        no_hi_caben = [k for k, c in enumerate(flota.classes) if c[1] < kg_ruta]
+        ordre = sorted(hi_caben, key=lambda k: cost_estimat(flota.classes[k])) \
+            + sorted(no_hi_caben, key=lambda k: -flota.classes[k][1])
+
+        for k in ordre:
+            capacitat = flota.classes[k][1]
+            acumulat = acumulat_max if capacitat == flota.capacitat_max else self.estimar_ruta(ruta_granges, capacitat)
+            dist_total, temps_total_estimat = self.tancar_ruta(ruta_granges, acumulat)
+            camio = flota.buscar_camio(k, temps_total_estimat)
+            if camio != -1:
+                return camio, dist_total, temps_total_estimat
+        _perfil.comptar("rutes_rebutjades")
+        return None
+
+    def flota_saturada(self):
+        return self.flota.saturada()
+
+    def executar_ruta(self, ruta_granges, camio, dist_total, temps_total_estimat):
+        """Assigna la ruta al camió, treu els porcs de les granges i en retorna el registre."""
+        escorxador = self.escorxador
+        flota = self.flota
+        flota.assignar(camio, temps_total_estimat)
+        capacitat_kg = float(flota.capacitat_kg[camio])
+
+        ruta_real = {
+            "dia": self.dia,
+            "camio_id": f"{flota.ids[camio]}_V{flota.viatges_dia[camio]}", # ID Tipus T1_V2
+            "tipus_camio": flota.tipus[camio],
+            "escorxador_id": escorxador.id,
+            "parades": [],
+            "detalls_parades": [], # GUARDAR DETALLS DE CADA PARADA
+            "porcs_totals": 0,
+            "pes_total": 0,
+            "distancia_total": dist_total, # Usem la calculada
+            "temps_total": temps_total_estimat,
+            "ingressos": 0,
+            "penalitzacions": 0,
+            "cost_viatge": 0
+        }
+
+        kg_disponibles = capacitat_kg
+
+        for g in ruta_granges:
+            ruta_real["parades"].append(g.id)
+
+            # Lògica real de treure porcs
+            porcs_granja = 0
+            kg_granja = 0
+            pesos_granja = []
+
+            for lot in g.lots:
+                espai = kg_disponibles - kg_granja
+                if espai <= 0: break
+                k, n, l = lot.obtenir_porcs_per_venda(espai)
+
+                # Check limit escorxador (global), comptant també els lots d'aquesta granja ja carregats
+                if escorxador.espai_disponible() - (ruta_real["porcs_totals"] + porcs_granja + n) < 0:
+                    # Retallar excedent
+                    sobran = (ruta_real["porcs_totals"] + porcs_granja + n) - escorxador.espai_disponible()
+                    n -= sobran
+                    l = l[:n]
+                    k = float(l.sum())
+
+                kg_granja += k
+                porcs_granja += n
+                pesos_granja.append(l)
+
+            if porcs_granja > 0:
+                with _perfil.fase("preus"):
+                    rev, pen = calcular_benefici_lot(np.concatenate(pesos_granja), escorxador)
+                ruta_real["porcs_totals"] += porcs_granja
+                ruta_real["pes_total"] += kg_granja
+                ruta_real["ingressos"] += rev
+                ruta_real["penalitzacions"] += pen
+                ruta_real["detalls_parades"].append(f"{g.id} ({porcs_granja} porcs)")
+
+                kg_disponibles -= kg_granja
+
+                # Marcar visitada
+                g.visitada_aquesta_setmana = True
+                self.cua_candidates.eliminar(g._idx)
+                self.index_granges.desactivar(g._idx)
+
+        # Finalitzar ruta
+        load_factor = max(0.1, ruta_real["pes_total"] / capacitat_kg)
+        ruta_real["cost_viatge"] = ruta_real["distancia_total"] * float(flota.cost_km[camio]) * load_factor
+
+        escorxador.processats_avui += ruta_real["porcs_totals"]
+        _perfil.comptar("porcs_venuts", ruta_real["porcs_totals"])
+        return ruta_real
+
+
+def planificar_greedy(ctx):
+    """
+    Planificador original: la granja amb porcs més pesants, fins a 2 veïns propers, i es va
+    escurçant la ruta fins que cap en algun camió.
+    """
+    granges, escorxador = ctx.granges, ctx.escorxador
+    rutes_dia = []
+
+    # BUCLE DE PLANIFICACIÓ
+    # Continuem mentre hi hagi granges, espai a l'escorxador i ALGUN camió tingui temps
+    while len(ctx.cua_candidates) > 0 and escorxador.espai_disponible() > 50:
+
+        # Verificació ràpida: Si tots els camions superen les 8h, parem.
+        if ctx.flota_saturada():
+            print("   -> Tota la flota ha arribat al límit d'hores diari.")
+            break
+
+        # 1. Triar la millor granja inicial
+        g_inicial = granges[ctx.cua_candidates.cim()] # Cim de la cua de prioritat
+
+        # 2. Buscar veïns (fins a 2 més)
+        ruta_candidata_granges = [g_inicial]
+
+        loc_temp = g_inicial._idx
+        for _ in range(MAX_PARADES_RUTA - 1): # Intentar afegir 2 més
+            # Veí més proper encara disponible dins del radi raonable
+            veins = ctx.index_granges.k_mes_propers(loc_temp, k=1, radi=RADI_VEINS_KM,
+                                                    exclou={g._idx for g in ruta_candidata_granges})
+            if not veins: break
+            vei = granges[veins[0][0]]
+            ruta_candidata_granges.append(vei)
+            loc_temp = vei._idx
+
+        # Ara tenim una llista de 1, 2 o 3 granges [g1, g2, g3] que volem visitar.
+        # Provem si aquesta ruta cap en algun camió. Si no, provem amb [g1, g2]. Si no, [g1].
+
+        ruta_acceptada = False
+
+        while len(ruta_candidata_granges) > 0:
+            # BUSCAR CAMIÓ (tipus més barat que hi cap, best-fit d'hores)
+            programacio = ctx.programar_ruta(ruta_candidata_granges)
+
+            if programacio is not None:
+                # --- ÈXIT: EXECUTEM LA RUTA ---
+                rutes_dia.append(ctx.executar_ruta(ruta_candidata_granges, *programacio))
+                ruta_acceptada = True
+                break # Sortim del while de reducció, ja hem fet la ruta
 
-    for dia in range(1, DIES_SIMULACIO + 1):
-        dia_setmana = (dia - 1) % DIES_SETMANA 
-        escorxador.reset_diari()
+            else:
+                # NO CAP -> Provem traient l'última granja (ruta més curta)
+                if len(ruta_candidata_granges) > 1:
+                    ruta_candidata_granges.pop() # Eliminem l'última i reintentem el bucle
+                    _perfil.comptar("retalls_ruta")
+                else:
+                    break
+
+        if not ruta_acceptada:
+            # Si hem sortit del while sense acceptar res, vol dir que la flota està plena
+            print("   -> Flota saturada per avui (cap camió té temps per a la següent ruta mínima).")
+            break
+
+    return rutes_dia
+
+
+def _parelles_estalvi(Dl, p):
+    """Parelles (estalvi, a, b) de Clarke-Wright amb estalvi positiu, de més a menys estalvi."""
+    D = np.asarray(Dl)
+    estalvi = D[0, 1:, None] + D[0, None, 1:] - D[1:, 1:]
+    if p > MAX_POOL_ESTALVIS_COMPLET:
+        # Només els veïns més propers de cada node
+        veins = np.argpartition(D[1:, 1:], min(VEINS_ESTALVIS, p - 1), axis=1)[:, :VEINS_ESTALVIS + 1]
+        mascara = np.zeros((p, p), dtype=bool)
+        mascara[np.arange(p)[:, None], veins] = True
+        mascara |= mascara.T
+    else:
+        mascara = np.ones((p, p), dtype=bool)
+    a, b = np.nonzero(np.triu(mascara & (estalvi > 0), k=1))
+    ordre = np.argsort(-estalvi[a, b], kind='stable')
+    return [(float(estalvi[i, j]), int(i) + 1, int(j) + 1) for i, j in zip(a[ordre], b[ordre])]
+
+
+def _cerca_local(Dl, rutes, dist, kg_ruta, porcs_ruta, kg_node, porcs_node, capacitat_kg=CAPACITAT_CAMIO_GRAN,
+                 max_parades=MAX_PARADES_RUTA):
+    """
+    Millora 2-opt (dins de ruta) i reubicació / or-opt d'un node (dins i entre rutes) amb
+    avaluació delta O(1) sobre la matriu de distàncies. Respecta capacitat, parades i hores.
+    """
+    EPS = 1e-9
+
+    for _ in range(MAX_ITERACIONS_CERCA_LOCAL):
+        _perfil.comptar("iteracions_cerca_local")
+        millora = False
+
+        # 2-opt: invertir el tram seq[i..j]
+        for r, R in rutes.items():
+            seq = [0] + R + [0]
+            for i in range(1, len(seq) - 2):
+                for j in range(i + 1, len(seq) - 1):
+                    a, b, c, d = seq[i - 1], seq[i], seq[j], seq[j + 1]
+                    delta = Dl[a][c] + Dl[b][d] - Dl[a][b] - Dl[c][d]
+                    if delta < -EPS:
+                        seq[i:j + 1] = seq[i:j + 1][::-1]
+                        dist[r] += delta
+                        millora = True
+            R[:] = seq[1:-1]
+
+        # Reubicació d'un node: a una altra posició de la mateixa ruta (or-opt) o a una altra ruta
+        for ra in list(rutes):
+            A = rutes.get(ra)
+            i = 0
+            while A and i < len(A):
+                x = A[i]
+                prev = A[i - 1] if i > 0 else 0
+                nxt = A[i + 1] if i + 1 < len(A) else 0
+                guany_treure = Dl[prev][nxt] - Dl[prev][x] - Dl[x][nxt]
+                millor = None
+                for rb, B in rutes.items():
+                    if rb == ra:
+                        reduida = A[:i] + A[i + 1:]
+                    elif len(B) + 1 > max_parades or kg_ruta[rb] + kg_node[x] > capacitat_kg:
+                        continue
+                    else:
+                        reduida = B
+                    for j in range(len(reduida) + 1):
+                        if rb == ra and j == i:
+                            continue
+                        u = reduida[j - 1] if j > 0 else 0
+                        v = reduida[j] if j < len(reduida) else 0
+                        cost_posar = Dl[u][x] + Dl[x][v] - Dl[u][v]
+                        if rb != ra:
+                            temps_b = (dist[rb] + cost_posar) / VELOCITAT_MITJANA \
+                                + (porcs_ruta[rb] + porcs_node[x]) * TEMPS_CARREGA_PER_PORC
+                            if temps_b > MAX_HORES_DIA:
+                                continue
+                        delta = guany_treure + cost_posar
+                        if delta < -EPS and (millor is None or delta < millor[0]):
+                            millor = (delta, rb, j, cost_posar)
+                if millor is None:
+                    i += 1
+                    continue
+
+                delta, rb, j, cost_posar = millor
+                millora = True
+                del A[i]
+                if rb == ra:
+                    A.insert(j, x)
+                    dist[ra] += delta
+                    i += 1
+                    continue
+                rutes[rb].insert(j, x)
+                dist[rb] += cost_posar
+                dist[ra] += guany_treure
+                kg_ruta[rb] += kg_node[x]
+                porcs_ruta[rb] += porcs_node[x]
+                kg_ruta[ra] -= kg_node[x]
+                porcs_ruta[ra] -= porcs_node[x]
+            if ra in rutes and not rutes[ra]:
+                del rutes[ra], dist[ra], kg_ruta[ra], porcs_ruta[ra]
+
+        if not millora:
+            break
+    return rutes
+
+
+def planificar_estalvis(ctx):
+    """
+    Clarke-Wright: es parteix d'una ruta directa per granja candidata i es fusionen rutes per
+    ordre d'estalvi d(0,a) + d(0,b) - d(a,b) mentre la càrrega, les parades i les hores ho permetin.
+    Després, cerca local (2-opt, or-opt, reubicació) i assignació als camions per prioritat.
+    """
+    granges, escorxador = ctx.granges, ctx.escorxador
+    capacitat_kg = ctx.flota.capacitat_max
+    espai = escorxador.espai_disponible()
+    if espai <= 50 or not ctx.cua_candidates:
+        return []
+
+    # 1. Pool de granges per prioritat fins a cobrir (amb marge) l'espai de l'escorxador
+    pool, porcs_pool = [], 0
+    for i in ctx.cua_candidates.ordenats():
+        n, kg = granges[i].estimar_carrega(capacitat_kg)
+        if n == 0:
+            continue
+        pool.append((granges[i], n, kg))
+        porcs_pool += n
+        if porcs_pool >= espai * FACTOR_POOL_ESTALVIS:
+            break
+    p = len(pool)
+
+    # Índexs locals: 0 = escorxador, 1..p = granges del pool
+    nodes = [escorxador._idx] + [g._idx for g, _, _ in pool]
+    Dl = np.asarray(ctx.distancies.dist[np.ix_(nodes, nodes)], dtype=np.float64).tolist()
+    kg = [0.0] + [k for _, _, k in pool]
+    porcs = [0] + [n for _, n, _ in pool]
+
+    # 2. Clarke-Wright
+    rutes = {k: [k] for k in range(1, p + 1)}
+    ruta_de = list(range(p + 1))
+    dist = {k: 2 * Dl[0][k] for k in range(1, p + 1)}
+    kg_ruta = {k: kg[k] for k in rutes}
+    porcs_ruta = {k: porcs[k] for k in rutes}
+    for estalvi, a, b in _parelles_estalvi(Dl, p):
+        ra, rb = ruta_de[a], ruta_de[b]
+        if ra == rb:
+            continue
+        A, B = rutes[ra], rutes[rb]
+        if len(A) + len(B) > MAX_PARADES_RUTA or kg_ruta[ra] + kg_ruta[rb] > capacitat_kg:
+            continue
+        nova_dist = dist[ra] + dist[rb] - estalvi
+        if nova_dist / VELOCITAT_MITJANA + (porcs_ruta[ra] + porcs_ruta[rb]) * TEMPS_CARREGA_PER_PORC > MAX_HORES_DIA:
+            continue
+        # a ha de ser l'últim de A i b el primer de B
+        if A[-1] != a:
+            if A[0] != a: continue
+            A.reverse()
+        if B[0] != b:
+            if B[-1] != b: continue
+            B.reverse()
+        A.extend(B)
+        for node in B:
+            ruta_de[node] = ra
+        dist[ra] = nova_dist
+        kg_ruta[ra] += kg_ruta.pop(rb)
+        porcs_ruta[ra] += porcs_ruta.pop(rb)
+        del rutes[rb], dist[rb]
+
+    # 3. Cerca local amb avaluació delta
+    rutes = _cerca_local(Dl, rutes, dist, kg_ruta, porcs_ruta, kg, porcs, capacitat_kg)
+
+    # 4. Execució per prioritat: primer les rutes amb els porcs més pesants
+    prioritat = ctx.ramat.max_mitjana_granja()
+    ordre = sorted(rutes.values(), key=lambda R: max(prioritat[pool[k - 1][0]._idx] for k in R), reverse=True)
+    rutes_dia = []
+    for R in ordre:
+        if escorxador.espai_disponible() <= 50 or ctx.flota_saturada():
+            break
+        ruta_granges = [pool[k - 1][0] for k in R]
+        programacio = ctx.programar_ruta(ruta_granges)
+        if programacio is None:
+            continue
+        rutes_dia.append(ctx.executar_ruta(ruta_granges, *programacio))
+    return rutes_dia
+
+
+PLANIFICADORS = {
+    "greedy": planificar_greedy,
+    "estalvis": planificar_estalvis,
+}
+
+
+def assignar_escorxadors(candidates, granges, escorxadors, distancies, flota):
+    """
+    Reparteix les granges candidates del dia entre escorxadors resolent un problema de transport:
+    oferta = porcs que cabrien en un camió, capacitat = espai de cada escorxador, i cost per porc =
+    anada i tornada al cost per kg del camió més eficient menys el valor del porc mitjà de la granja
+    a aquell escorxador (preu i franges pròpies). Les poques granges que la solució reparteix entre
+    dos escorxadors van al que se n'emporta més. Retorna una llista de granges per escorxador,
+    conservant l'ordre de `candidates`.
+
+    Al problema de transport només hi entren les granges que poden rebre flux: si per a cada escorxador
+    hi ha granges més barates amb més oferta que tota la capacitat, la granja no s'arriba a fer servir
+    mai (ni en cap solució intermèdia), i treure-la no canvia el resultat.
+    """
+    assignacio = [[] for _ in escorxadors]
+    if not candidates:
+        return assignacio
+    idx = np.asarray(candidates, dtype=np.int64)
+    carregues = Granja.estimar_carregues([granges[i] for i in candidates], flota.capacitat_max)
+    oferta = carregues[:, 0].astype(np.int64)
+    pes_mig = carregues[:, 1] / np.maximum(carregues[:, 0], 1)
+
+    km = distancies.columnes([e._idx for e in escorxadors])[idx]
+    cost_kg_km = float((flota.cost_km / flota.capacitat_kg).min())
+
+    limits = np.array([e.limits_penalitzacio for e in escorxadors], dtype=np.float64)
+    preus = np.array([e.preu_kg for e in escorxadors], dtype=np.float64)
+    w = pes_mig[:, None]
+    dins_lleu = (w >= limits[:, 0]) & (w <= limits[:, 3])
+    dins_optim = (w >= limits[:, 1]) & (w <= limits[:, 2])
+    valor_kg = preus * (1 - PENALITZACIO_LLEU * (dins_lleu & ~dins_optim) - PENALITZACIO_GREU * ~dins_lleu)
+    cost = w * (2 * km * cost_kg_km - valor_kg)
+
+    capacitat = [max(e.espai_disponible(), 0) for e in escorxadors]
+    # Llindar de cost per escorxador: el de la granja amb què l'oferta acumulada supera la capacitat total
+    N, E = cost.shape
+    ordre = np.argsort(cost, axis=0, kind='stable')
+    posicio = (np.cumsum(oferta[ordre], axis=0) <= sum(capacitat)).sum(axis=0)
+    llindar = np.where(posicio < N, cost[ordre[np.minimum(posicio, N - 1), np.arange(E)], np.arange(E)], np.inf)
+    utils = np.flatnonzero((cost <= llindar).any(axis=1))
+    _perfil.comptar("candidats_transport", len(utils))
+
+    flux = resoldre_transport(cost[utils], oferta[utils], capacitat)
+    servides = flux.sum(axis=1) > 0
+    desti = flux.argmax(axis=1)
+    for i, ok, j in zip(idx[utils].tolist(), servides.tolist(), desti.tolist()):
+        if ok:
+            assignacio[j].append(i)
+    return assignacio
+
+
+
+# --- 6. LÒGICA DE SIMULACIÓ ---
+
+def simular(planificador="greedy", seed=None, flota=None, num_escorxadors=NUM_ESCORXADORS, entorn=None,
+            exportador=None, dies=DIES_SIMULACIO, reprendre=None, punts_control=None, reposicio=False, perfil=None,
+            creixement_diari=False):
+    """
+    `dies` pot ser qualsevol horitzó (p. ex. 364); amb `reposicio`, cada lot que es buida rep un lot
+    nou de EDAT_REPOSICIO setmanes DIES_VAN_BUIT dies després, de manera que les granges no s'esgoten.
+    `reprendre`: un PuntControl des d'on continuar (fins al dia `dies`), amb el planificador i la flota
+    que es donin; els registres dels dies anteriors ja hi són inclosos. `punts_control`: dict
+    {dia: directori} on desar l'estat a l'inici d'aquells dies (dies + 1 = estat final).
+    `perfil`: un Perfil on recollir temps i comptadors per fase i per dia. `creixement_diari`: els
+    porcs creixen 1/7 de setmana cada dia (edat fraccionària) en lloc d'un salt cada dilluns.
+    """
+    global _perfil
+    # El perfil és global del mòdul mentre dura la simulació; es restaura també si acaba amb una excepció
+    anterior = _perfil
+    _perfil = perfil if perfil is not None else PERFIL_INACTIU
+    try:
+        return _simular(planificador, seed, flota, num_escorxadors, entorn, exportador, dies, reprendre,
+                        punts_control, reposicio, _perfil, creixement_diari)
+    finally:
+        _perfil = anterior
+
+
+def _simular(planificador, seed, flota, num_escorxadors, entorn, exportador, dies, reprendre, punts_control,
+             reposicio, perfil, creixement_diari):
+    t_inici = time.perf_counter()
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    planificar = PLANIFICADORS[planificador]
+    punts_control = punts_control or {}
+    if reprendre is not None:
+        flota = reprendre.preparar_flota(flota)
+        entorn = reprendre.entorn
+        reprendre.restaurar_aleatori()
+    flota = Flota.carregar() if flota is None else flota
+    print_configuracion(flota)
+    # `entorn` (p. ex. de carregar_entorn) es fa servir tal qual i queda modificat per la simulació
+    escorxadors, granges, distancies = entorn if entorn is not None else generar_entorn(num_escorxadors=num_escorxadors)
+    index_granges = IndexEspacial([g.location[0] for g in granges], [g.location[1] for g in granges], distancies)
+    ramat = Ramat.des_de_granges(granges)
+    cua_candidates = CuaPrioritat(len(granges))
+    if len(escorxadors) > 1:
+        # Cua i índex de treball per a les granges assignades a l'escorxador que s'està planificant
+        index_escorxador = IndexEspacial([g.location[0] for g in granges], [g.location[1] for g in granges], distancies)
+        cua_escorxador = CuaPrioritat(len(granges))
+    registre_activitat = list(reprendre.registres) if reprendre is not None else []
+    temps_planificacio = reprendre.temps_planificacio if reprendre is not None else 0.0
+    if exportador is not None:
+        exportador.capcalera({"dies_simulats": dies, "flota_utilitzada": len(flota), "planificador": planificador}, granges)
+
+    def registrar(dia, registres):
+        if exportador is None:
+            registre_activitat.extend(registres)
+            return
+        # En streaming els registres van al fitxer i aquí només queda una fila agregada per dia
+        with perfil.fase("exportacio"):
+            exportador.escriure_dia(registres)
+        fila = {"dia": dia, "camio_id": "RESUM_DIA", "rutes": sum(1 for r in registres if r["porcs_totals"] > 0)}
+        for camp in ("porcs_totals", "pes_total", "ingressos", "penalitzacions", "cost_viatge"):
+            fila[camp] = sum(r[camp] for r in registres)
+        registre_activitat.append(fila)
+
+    # Motor per esdeveniments (dia, ordre, tipus, lot): dins d'un dia, primer el punt de control, el reset
+    # setmanal i el creixement, després les arribades de reposició i al final la planificació. Entre
+    # esdeveniments el ramat no canvia i el menjar s'acumula en forma tancada (tancar_dies).
+    dia_inici = reprendre.dia if reprendre is not None else 1
+    esdeveniments = list(reprendre.reposicions) if reprendre is not None else []
+    for dia in range(dia_inici, dies + 2):
+        if dia in punts_control:
+            esdeveniments.append((dia, -1, "punt_control", -1))
+        if dia <= dies and (dia - 1) % DIES_SETMANA == 0:
+            esdeveniments.append((dia, 0, "setmana", -1))
+        if creixement_diari and 1 < dia <= dies:
+            esdeveniments.append((dia, 0, "creixement", -1))
+        if dia <= dies and (dia - 1) % DIES_SETMANA < 5:
+            esdeveniments.append((dia, 2, "laborable", -1))
+    heapq.heapify(esdeveniments)
+    dia_obert = dia_inici  # Primer dia amb el menjar encara per comptar
+
+    def tancar_dies(fins):
+        """
+        Menjar dels dies [dia_obert, fins) d'un sol cop (el Ramat manté el cost diari en cache
+        fins que creix o ven), i el registre de descans dels caps de setmana.
+        """
+        nonlocal dia_obert
+        if fins <= dia_obert:
+            return
+        with perfil.fase("alimentacio"):
+            cost_menjar = ramat.calcular_consum_diari(dies=fins - dia_obert)
+        for dia in range(dia_obert, fins):
+            if (dia - 1) % DIES_SETMANA >= 5:
+                print(f"Dia {dia} (Cap de setmana): Descans. Cost menjar: {cost_menjar.sum():.0f}€")
+                registrar(dia, [{"dia": dia, "camio_id": "DESCANS", "porcs_totals": 0, "ingressos": 0, "cost_viatge": 0, "pes_total": 0, "penalitzacions": 0}])
+        dia_obert = fins
+
+    while esdeveniments:
+        dia, _, tipus, lot = heapq.heappop(esdeveniments)
+        perfil.dia = dia
+        if tipus == "punt_control":
+            tancar_dies(dia)
+            with perfil.fase("punt_control"):
+                desar_punt_control(punts_control[dia], dia, (escorxadors, granges, distancies), flota, planificador,
+                                   registre_activitat, temps_planificacio,
+                                   reposicions=[(d, l) for d, _, t, l in esdeveniments if t == "reposicio"])
+            continue
+        if dia > dies:
+            break
+        tancar_dies(dia)
 
         # 1. Biològic (Dilluns)
-        if dia_setmana == 0:
+        if tipus == "setmana":
             print(f"\n>> DILLUNS (Dia {dia}): Reset setmanal.")
             for g in granges: g.visitada_aquesta_setmana = False
-            if dia > 1:
+            flota.nova_setmana()
+            if dia > 1 and not creixement_diari:
                 print("   Aplicant corba de creixement (Weight.csv)...")
-                for g in granges:
-                    for lot in g.lots: lot.creixer_una_setmana()
-
-        # 2. Alimentació
-        cost_total_menjar_avui = 0
-        for g in granges: 
-            cost_total_menjar_avui += g.calcular_consum_diari()
-        
-        # 3. Logística (Laborables)
-        if dia_setmana >= 5:
-            print(f"Dia {dia} (Cap de setmana): Descans. Cost menjar: {cost_total_menjar_avui:.0f}€")
-            registre_activitat.append({"dia": dia, "camio_id": "DESCANS", "porcs_totals": 0, "ingressos": 0, "cost_viatge": 0, "pes_total": 0, "penalitzacions": 0})
-            continue 
-
+                with perfil.fase("creixement"):
+                    ramat.creixer_una_setmana()
+            continue
+        if tipus == "creixement":
+            with perfil.fase("creixement"):
+                ramat.creixer(1 / DIES_SETMANA)
+            continue
+
+        # 2. Reposició d'un lot buit
+        if tipus == "reposicio":
+            with perfil.fase("reposicio"):
+                porcs = ramat.repoblar_lot(lot)
+            perfil.comptar("porcs_reposats", porcs)
+            print(f"   Reposició (Dia {dia}): {porcs} porcs nous a {granges[ramat.granja_lot[lot]].id}")
+            continue
+
+        # 3. Logística (Laborables). El menjar d'avui es compta abans de les vendes
+        tancar_dies(dia + 1)
+        dia_setmana = (dia - 1) % DIES_SETMANA
+        for e in escorxadors: e.reset_diari()
         print(f"Dia {dia}: Laborable. Planificant rutes...")
 
-        # Granges candidates per avui
-        candidates = [g for g in granges if not g.visitada_aquesta_setmana and g.te_porcs_per_venda()]
-        # Ordenar prioritat (porcs més grans primer)
-        candidates.sort(key=lambda g: max([np.mean(l.pesos_individuals) for l in g.lots]), reverse=True)
-
-        rutes_dia = []
+        # Granges candidates per avui: el dilluns es reconstrueix la cua sencera; la resta de dies
+        # només es reavaluen les granges modificades (prioritat = porcs més grans primer)
+        with perfil.fase("candidats"):
+            modificades = ramat.refrescar_estadistiques()
+            max_granja = ramat.max_pes_granja()
+            prioritat = ramat.max_mitjana_granja()
+            if dia_setmana == 0:
+                elegibles = [i for i in np.flatnonzero(max_granja > 100).tolist() if not granges[i].visitada_aquesta_setmana]
+                cua_candidates.reconstruir(elegibles, prioritat[elegibles].tolist())
+                index_granges.buidar()
+                index_granges.activar(elegibles)
+            else:
+                for i in modificades.tolist():
+                    if max_granja[i] > 100 and not granges[i].visitada_aquesta_setmana:
+                        cua_candidates.actualitzar(i, float(prioritat[i]))
+                        index_granges.activar([i])
+                    else:
+                        cua_candidates.eliminar(i)
+                        index_granges.desactivar(i)
+        perfil.comptar("candidats", len(cua_candidates))
 
-        if not candidates:
+        if not cua_candidates:
              print("   -> Cap granja disponible per recollida avui.")
              # DIAGNÒSTIC PER L'USUARI
-             visitades_amb_porcs = [g for g in granges if g.visitada_aquesta_setmana and g.te_porcs_per_venda()]
-             sense_porcs = [g for g in granges if not g.te_porcs_per_venda()]
+             te_venda = ramat.te_porcs_per_venda()
+             visitades_amb_porcs = [g for g, ok in zip(granges, te_venda) if ok and g.visitada_aquesta_setmana]
+             sense_porcs = [g for g, ok in zip(granges, te_venda) if not ok]
              print(f"      [Diagnòstic] Granges amb porcs però ja visitades (bloquejades fins dilluns): {len(visitades_amb_porcs)}")
              print(f"      [Diagnòstic] Granges sense porcs de talla comercial: {len(sense_porcs)}")
 
         
-        # --- ESTAT DE LA FLOTA EN HORES (Nou sistema) ---
-        # 0.0 hores usades per defecte a l'inici del dia per a cada camió (0, 1, 2)
-        temps_camions = [0.0] * NUM_CAMIONS_FLOTA
-        viajes_per_camio = [0] * NUM_CAMIONS_FLOTA # Per generar IDs T1_V1, T1_V2...
-
-        # BUCLE DE PLANIFICACIÓ
-        # Continuem mentre hi hagi granges, espai a l'escorxador i ALGUN camió tingui temps
-        while len(candidates) > 0 and escorxador.espai_disponible() > 50:
-            
-            # Verificació ràpida: Si tots els camions superen les 8h, parem.
-            if min(temps_camions) >= MAX_HORES_DIA:
-                print("   -> Tota la flota ha arribat al límit d'hores diari.")
-                break
-
-            # --- CONSTRUCCIÓ DE RUTA POTENCIAL ---
-            
-            camio_tipus = "GRAN"
-            capacitat_kg = CAPACITAT_CAMIO_GRAN
-            cost_km = COST_KM_GRAN
-
-            ruta_potencial = {
-                "parades": [],
-                "granjas_obj": [], 
-                "porcs_totals": 0,
-                "pes_total": 0,
-                "distancia_total": 0,
-                "temps_total": 0,
-                "ingressos": 0,
-                "penalitzacions": 0,
-                "cost_viatge": 0
-            }
-
-            loc_actual = escorxador.location
-            kg_disponibles_camio = capacitat_kg
-            temps_acumulat = 0
-            
-            # Llista temporal de granges triades per a aquesta ruta concreta
-            granjas_triades_ruta = [] 
-
-            for parada_idx in range(3):
-                # Condicions de parada
-                if kg_disponibles_camio < 500: break
-                if escorxador.espai_disponible() - ruta_potencial["porcs_totals"] <= 0: break
-                
-                # Busquem la millor següent granja (Nearest Neighbor) que no estigui ja triada
-                disponibles = [c for c in candidates if c not in granjas_triades_ruta]
-                
-                if not disponibles: break
-
-                disponibles.sort(key=lambda g: calcular_distancia_km(loc_actual, g.location))
-                granja_objectiu = disponibles[0]
-
-                dist = calcular_distancia_km(loc_actual, granja_objectiu.location)
-                temps_viatge = dist / VELOCITAT_MITJANA
-                
-                # NOTA: No comprovem MAX_HORES aquí, ho fem al final quan tenim el total
-                
-                # Sortim del bucle de parades per gestionar-ho manualment a baix
-                break 
-
-            # --- REIMPLANTACIÓ LÒGICA DE SELECCIÓ I ASSIGNACIÓ ---
-            
-            # 1. Triar la millor granja inicial
-            g_inicial = candidates[0] # Ja ordenada per prioritat
-            
-            # 2. Buscar veïns (fins a 2 més)
-            ruta_candidata_granges = [g_inicial]
-            candidates_restants = [c for c in candidates if c != g_inicial]
-            
-            loc_temp = g_inicial.location
-            for _ in range(2): # Intentar afegir 2 més
-                if not candidates_restants: break
-                candidates_restants.sort(key=lambda g: calcular_distancia_km(loc_temp, g.location))
-                vei = candidates_restants[0]
-                # Distància extra raonable? (Ex: < 50km)
-                if calcular_distancia_km(loc_temp, vei.location) < 100: 
-                    ruta_candidata_granges.append(vei)
-                    loc_temp = vei.location
-                    candidates_restants.remove(vei)
-            
-            # Ara tenim una llista de 1, 2 o 3 granges [g1, g2, g3] que volem visitar.
-            # Provem si aquesta ruta cap en algun camió. Si no, provem amb [g1, g2]. Si no, [g1].
-            
-            ruta_acceptada = False
-            
-            while len(ruta_candidata_granges) > 0:
-                # Calcular temps estimat d'aquesta combinació (sense modificar lots)
-                
-                t_viatge = 0
-                dist_total = 0
-                curr = escorxador.location
-                
-                # Estimació porcs (per temps càrrega)
-                num_porcs_est = 0
-                kg_est = 0
-                cap_temp = CAPACITAT_CAMIO_GRAN
-                
-                for g in ruta_candidata_granges:
-                    dist = calcular_distancia_km(curr, g.location)
-                    t_viatge += (dist / VELOCITAT_MITJANA)
-                    dist_total += dist
-                    curr = g.location
-                    
-                    # Estimem càrrega (sense borrar)
-                    for lot in g.lots:
-                        # Càlcul ràpid sense modificar
-                        for p in lot.pesos_individuals:
-                            if kg_est + p <= cap_temp:
-                                kg_est += p
-                                num_porcs_est += 1
-                
-                dist_tornada = calcular_distancia_km(curr, escorxador.location)
-                t_viatge += (dist_tornada / VELOCITAT_MITJANA)
-                dist_total += dist_tornada
-                
-                t_carrega = num_porcs_est * TEMPS_CARREGA_PER_PORC
-                temps_total_estimat = t_viatge + t_carrega
-                
-                # BUSCAR CAMIÓ
-                camio_id_trobat = -1
-                for idx_c in range(NUM_CAMIONS_FLOTA):
-                    if temps_camions[idx_c] + temps_total_estimat <= MAX_HORES_DIA:
-                        camio_id_trobat = idx_c
-                        break
-                
-                if camio_id_trobat != -1:
-                    # --- ÈXIT: EXECUTEM LA RUTA ---
-                    temps_camions[camio_id_trobat] += temps_total_estimat
-                    viajes_per_camio[camio_id_trobat] += 1
-                    
-                    # Ara sí, executem la lògica "destructiva" de treure porcs i crear l'objecte ruta real
-                    ruta_real = {
-                        "dia": dia,
-                        "camio_id": f"T{camio_id_trobat+1}_V{viajes_per_camio[camio_id_trobat]}", # ID Tipus T1_V2
-                        "tipus_camio": "GRAN",
-                        "parades": [],
-                        "detalls_parades": [], # GUARDAR DETALLS DE CADA PARADA
-                        "porcs_totals": 0,
-                        "pes_total": 0,
-                        "distancia_total": dist_total, # Usem la calculada
-                        "temps_total": temps_total_estimat,
-                        "ingressos": 0,
-                        "penalitzacions": 0,
-                        "cost_viatge": 0
-                    }
-                    
-                    kg_recollits_real = 0
-                    kg_disponibles = CAPACITAT_CAMIO_GRAN
-                    
-                    for g in ruta_candidata_granges:
-                        ruta_real["parades"].append(g.id)
-                        
-                        # Lògica real de treure porcs
-                        porcs_granja = 0
-                        kg_granja = 0
-                        pesos_granja = []
-                        
-                        for lot in g.lots:
-                            espai = kg_disponibles - kg_granja
-                            if espai <= 0: break
-                            k, n, l = lot.obtenir_porcs_per_venda(espai)
-                            
-                            # Check limit escorxador (global)
-                            if escorxador.espai_disponible() - (ruta_real["porcs_totals"] + n) < 0:
-                                # Retallar excedent
-                                sobran = (ruta_real["porcs_totals"] + n) - escorxador.espai_disponible()
-                                n -= sobran
-                                k = sum(l[:n])
-                                l = l[:n]
-                            
-                            kg_granja += k
-                            porcs_granja += n
-                            pesos_granja.extend(l)
-                        
-                        if porcs_granja > 0:
-                            rev, pen = calcular_benefici_lot(pesos_granja)
-                            ruta_real["porcs_totals"] += porcs_granja
-                            ruta_real["pes_total"] += kg_granja
-                            ruta_real["ingressos"] += rev
-                            ruta_real["penalitzacions"] += pen
-                            ruta_real["detalls_parades"].append(f"{g.id} ({porcs_granja} porcs)")
-                            
-                            kg_disponibles -= kg_granja
-                            
-                            # Marcar visitada
-                            g.visitada_aquesta_setmana = True
-                            if g in candidates: candidates.remove(g)
-                    
-                    # Finalitzar ruta
-                    load_factor = max(0.1, ruta_real["pes_total"] / CAPACITAT_CAMIO_GRAN)
-                    ruta_real["cost_viatge"] = ruta_real["distancia_total"] * COST_KM_GRAN * load_factor
-                    
-                    escorxador.processats_avui += ruta_real["porcs_totals"]
-                    rutes_dia.append(ruta_real)
-                    ruta_acceptada = True
-                    break # Sortim del while de reducció, ja hem fet la ruta
-                
-                else:
-                    # NO CAP -> Provem traient l'última granja (ruta més curta)
-                    if len(ruta_candidata_granges) > 1:
-                        ruta_candidata_granges.pop() # Eliminem l'última i reintentem el bucle
-                    else:
-                        break
-            
-            if not ruta_acceptada:
-                # Si hem sortit del while sense acceptar res, vol dir que la flota està plena
-                print("   -> Flota saturada per avui (cap camió té temps per a la següent ruta mínima).")
-                break
+        # --- ESTAT DE LA FLOTA EN HORES I PLANIFICACIÓ ---
+        flota.nou_dia()
+        t0 = time.perf_counter()
+        if len(escorxadors) == 1:
+            ctx = ContextPlanificacio(dia, granges, escorxadors[0], distancies, ramat,
+                                      cua_candidates, index_granges, flota)
+            with perfil.fase("planificacio"):
+                rutes_dia = planificar(ctx)
+        else:
+            # Assignació granja -> escorxador i rutes per escorxador (els més carregats trien camió primer)
+            with perfil.fase("assignacio"):
+                assignacio = assignar_escorxadors(list(cua_candidates.ordenats()), granges, escorxadors, distancies, flota)
+            rutes_dia = []
+            for j in sorted(range(len(escorxadors)), key=lambda j: -len(assignacio[j])):
+                if not assignacio[j] or flota.saturada():
+                    continue
+                cua_escorxador.reconstruir(assignacio[j], prioritat[assignacio[j]].tolist())
+                index_escorxador.buidar()
+                index_escorxador.activar(assignacio[j])
+                ctx = ContextPlanificacio(dia, granges, escorxadors[j], distancies, ramat,
+                                          cua_escorxador, index_escorxador, flota)
+                with perfil.fase("planificacio"):
+                    rutes_dia.extend(planificar(ctx))
+                # executar_ruta només les treu de la cua de l'escorxador; també surten de la cua del dia
+                for i in assignacio[j]:
+                    if granges[i].visitada_aquesta_setmana:
+                        cua_candidates.eliminar(i)
+                        index_granges.desactivar(i)
+        temps_planificacio += time.perf_counter() - t0
+        temps_camions = flota.hores_dia
 
         # PRINT DE RUTES PER CONSOLA
         if len(rutes_dia) > 0:
@@ -570,23 +2251,164 @@ def simular():
                 print(f"      [🚚 {r['camio_id']}] {detall_text} | Total: {r['porcs_totals']} porcs ({r['pes_total']:.0f} kg) | Temps: {r['temps_total']:.1f}h | Benefici: {benefici_ruta:.2f}€")
             
             # MOSTRAR ÚS HORARI DELS CAMIONS
-            us_h = [f"T{i+1}: {h:.1f}h" for i, h in enumerate(temps_camions)]
+            us_h = [f"{flota.ids[i]}: {h:.1f}h" for i, h in enumerate(temps_camions)]
             print(f"      [🕒 Ús Horari] {', '.join(us_h)} (Max {MAX_HORES_DIA}h)")
 
-        for r in rutes_dia: registre_activitat.append(r)
-        if not rutes_dia and dia_setmana < 5:
-            registre_activitat.append({"dia": dia, "camio_id": "SENSE_ACTIVITAT", "porcs_totals": 0, "ingressos": 0, "cost_viatge": 0, "pes_total": 0, "penalitzacions": 0})
-
-    return pd.DataFrame(registre_activitat), granges, escorxador
-
-# --- 6. EXPORTACIÓ JSON ---
+        registrar(dia, rutes_dia or [{"dia": dia, "camio_id": "SENSE_ACTIVITAT", "porcs_totals": 0, "ingressos": 0, "cost_viatge": 0, "pes_total": 0, "penalitzacions": 0}])
+        perfil.comptar("rutes", len(rutes_dia))
+        buidats, ramat.lots_buidats = ramat.lots_buidats, []
+        if reposicio:
+            for l in buidats:
+                heapq.heappush(esdeveniments, (dia + DIES_VAN_BUIT, 1, "reposicio", l))
+
+    tancar_dies(dies + 1)
+    perfil.dia = 0
+    perfil.afegir_temps("simulacio", time.perf_counter() - t_inici)
+    df = pd.DataFrame(registre_activitat)
+    df.attrs["planificador"] = planificador
+    df.attrs["dies"] = dies
+    df.attrs["temps_planificacio"] = temps_planificacio
+    df.attrs["num_camions"] = len(flota)
+    df.attrs["cost_fix_setmanal_flota"] = float(flota.cost_fix_setmanal.sum())
+    return df, granges, escorxadors
+
+
+# --- Punts de control (reprendre i bifurcar) ---
+
+ARRAYS_RAMAT = ("pesos", "base", "inici", "fi", "edat", "z_intake", "granja_lot", "pes_mig", "desviacio_std",
+                "menjar_acumulat")
+
+
+def desar_punt_control(directori, dia, entorn, flota, planificador, registres, temps_planificacio, reposicions=()):
+    """
+    Desa a `directori` l'estat de la simulació a l'inici del dia `dia`: els arrays del Ramat i les
+    dades de les granges com a .npy (es carreguen mapats a memòria), i la resta (entitats petites,
+    flota, comptador de dies, reposicions pendents, estat de random i np.random) a estat.json, que
+    s'escriu l'últim i marca el punt com a complet. Els registres dels dies ja simulats van a registres.ndjson.
+    La matriu de distàncies no es desa: es recalcula de les coordenades.
+    """
+    escorxadors, granges, distancies = entorn
+    ramat = Ramat.des_de_granges(granges)
+    os.makedirs(directori, exist_ok=True)
+    arrays = {nom: getattr(ramat, nom) for nom in ARRAYS_RAMAT}
+    arrays["granja_lat"] = np.array([g.location[0] for g in granges], dtype=np.float64)
+    arrays["granja_lon"] = np.array([g.location[1] for g in granges], dtype=np.float64)
+    arrays["granja_capacitat"] = np.array([g.capacitat_total for g in granges], dtype=np.int64)
+    arrays["granja_visitada"] = np.array([g.visitada_aquesta_setmana for g in granges], dtype=bool)
+    for nom, valors in arrays.items():
+        np.save(os.path.join(directori, nom + ".npy"), valors)
+
+    with open(os.path.join(directori, "registres.ndjson"), 'w', encoding='utf-8') as f:
+        for r in registres:
+            f.write(json.dumps(r, ensure_ascii=False, separators=(',', ':'), default=_valor_json) + "\n")
+
+    lots = [None] * len(ramat.edat)
+    for g in granges:
+        for lot in g.lots:
+            lots[lot._i] = lot.id_lot
+    versio_random, estat_random, gauss_random = random.getstate()
+    _, claus_np, pos_np, te_gauss_np, gauss_np = np.random.get_state()
+    estat = {
+        "versio": VERSIO_PUNT_CONTROL,
+        "dia": dia,
+        "planificador": planificador,
+        "temps_planificacio": temps_planificacio,
+        "mode_distancia": distancies.mode,
+        "granges": [g.id for g in granges],
+        "lots": lots,
+        "escorxadors": [{"id": e.id, "lat": e.location[0], "lon": e.location[1], "capacitat_diaria": e.capacitat_diaria,
+                         "preu_kg": e.preu_kg, "limits_penalitzacio": list(e.limits_penalitzacio)} for e in escorxadors],
+        "flota": {"tipus": flota.tipus, "ids": flota.ids, "capacitat_kg": flota.capacitat_kg.tolist(),
+                  "cost_km": flota.cost_km.tolist(), "max_hores_setmana": flota.max_hores_setmana.tolist(),
+                  "cost_fix_setmanal": flota.cost_fix_setmanal.tolist(), "hores_setmana": flota.hores_setmana.tolist()},
+        "reposicions": [[int(d), int(l)] for d, l in reposicions],
+        "random": [versio_random, list(estat_random), gauss_random],
+        "np_random": [claus_np.tolist(), pos_np, te_gauss_np, gauss_np],
+    }
+    temporal = os.path.join(directori, "estat.json.tmp")
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estat, f, ensure_ascii=False, default=_valor_json)
+    os.replace(temporal, os.path.join(directori, "estat.json"))
+
+
+class PuntControl:
+    """
+    Estat desat per `desar_punt_control` (o `simular(punts_control=...)`), per passar a `simular(reprendre=...)`. Cada càrrega
+    crea entitats noves sobre arrays mapats en mode còpia-en-escriptura, de manera que diverses
+    branques poden partir del mateix punt (i compartir-ne les pàgines) sense modificar-lo. Abans de
+    reprendre es poden canviar paràmetres de l'entorn (p. ex. `escorxadors[0].preu_kg`).
+    """
+    def __init__(self, directori):
+        with open(os.path.join(directori, "estat.json"), encoding='utf-8') as f:
+            estat = json.load(f)
+        if estat["versio"] != VERSIO_PUNT_CONTROL:
+            raise ValueError(f"Punt de control de versió {estat['versio']} (s'esperava {VERSIO_PUNT_CONTROL})")
+        arrays = {nom[:-4]: np.load(os.path.join(directori, nom), mmap_mode='c')
+                  for nom in os.listdir(directori) if nom.endswith(".npy")}
+
+        ramat = Ramat(arrays["pesos"], arrays["fi"] - arrays["base"], arrays["edat"], arrays["z_intake"],
+                      arrays["granja_lot"], len(estat["granges"]), pes_mig=arrays["pes_mig"],
+                      desviacio_std=arrays["desviacio_std"], ordenat=True)
+        ramat.inici[:] = arrays["inici"]
+        ramat.menjar_acumulat[:] = arrays["menjar_acumulat"]
+        self.granges = []
+        for i, (id_g, lat, lon, cap, visitada) in enumerate(zip(
+                estat["granges"], arrays["granja_lat"].tolist(), arrays["granja_lon"].tolist(),
+                arrays["granja_capacitat"].tolist(), arrays["granja_visitada"].tolist())):
+            g = Granja(id_g, lat, lon, capacitat_total=cap)
+            g.visitada_aquesta_setmana = visitada
+            g._ramat, g._idx = ramat, i
+            self.granges.append(g)
+        for k, (id_lot, i) in enumerate(zip(estat["lots"], ramat.granja_lot.tolist())):
+            self.granges[i].lots.append(PorcBatch.vista(id_lot, ramat, k))
+        self.escorxadors = [Escorxador(e["id"], e["lat"], e["lon"], e["capacitat_diaria"], preu_kg=e["preu_kg"],
+                                       limits_penalitzacio=tuple(e["limits_penalitzacio"]))
+                            for e in estat["escorxadors"]]
+        self.mode_distancia = estat["mode_distancia"]
+
+        fl = estat["flota"]
+        self.flota = Flota(fl["tipus"], fl["capacitat_kg"], fl["cost_km"], fl["max_hores_setmana"],
+                           fl["cost_fix_setmanal"], ids=fl["ids"])
+        self.flota.hores_setmana[:] = fl["hores_setmana"]
+        self.dia = estat["dia"]
+        self.planificador = estat["planificador"]
+        self.temps_planificacio = estat["temps_planificacio"]
+        self.reposicions = [(d, 1, "reposicio", l) for d, l in estat.get("reposicions", [])]
+        self._random, self._np_random = estat["random"], estat["np_random"]
+        self._distancies = None
+        with open(os.path.join(directori, "registres.ndjson"), encoding='utf-8') as f:
+            self.registres = [json.loads(l) for l in f if l.strip()]
+
+    @property
+    def entorn(self):
+        if self._distancies is None:
+            self._distancies = MatriuDistancies.des_de_entorn(self.granges, self.escorxadors, mode=self.mode_distancia)
+        return self.escorxadors, self.granges, self._distancies
+
+    def preparar_flota(self, flota=None):
+        """La flota desada o, si se'n dona una altra, aquesta amb les hores setmanals ja fetes pels camions del mateix id."""
+        if flota is None:
+            return self.flota
+        hores = dict(zip(self.flota.ids, self.flota.hores_setmana.tolist()))
+        for c, id_c in enumerate(flota.ids):
+            flota.hores_setmana[c] = hores.get(id_c, 0.0)
+        flota.nou_dia()
+        return flota
+
+    def restaurar_aleatori(self):
+        versio, estat, gauss = self._random
+        random.setstate((versio, tuple(estat), gauss))
+        claus, pos, te_gauss, gauss_np = self._np_random
+        np.random.set_state(("MT19937", np.array(claus, dtype=np.uint32), pos, te_gauss, gauss_np))
+
+# --- 7. EXPORTACIÓ JSON ---
 
 def exportar_resultats_json(df, filename="resultats_simulacio.json"):
     dades = df.to_dict(orient='records')
     estructura_final = {
         "metadata": {
-            "dies_simulats": DIES_SIMULACIO,
-            "flota_utilitzada": NUM_CAMIONS_FLOTA,
+            "dies_simulats": df.attrs.get("dies", DIES_SIMULACIO),
+            "flota_utilitzada": df.attrs.get("num_camions", NUM_CAMIONS_FLOTA),
             "data_inici": str(DATA_INICI.date())
         },
         "activitat_diaria": dades
@@ -599,20 +2421,491 @@ def exportar_resultats_json(df, filename="resultats_simulacio.json"):
         print(f"\n❌ Error guardant el JSON: {e}")
 
 
-# --- 7. DASHBOARD ---
-
-def generar_dashboard(df, granges, escorxador):
-    df["benefici_net"] = df["ingressos"] - df["cost_viatge"]
+def _valor_json(obj):
+    """Tipus de numpy que poden quedar als registres (int64, float32, arrays)."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"{type(obj).__name__} no és serialitzable a JSON")
+
+
+def _obrir_text(fitxer, mode):
+    return gzip.open(fitxer, mode + "t", encoding='utf-8') if fitxer.endswith(".gz") else open(fitxer, mode, encoding='utf-8')
+
+
+class ExportadorNDJSON:
+    """
+    Exportació en streaming: `simular(exportador=...)` hi escriu els registres de cada dia quan el dia
+    acaba, una línia JSON compacta per registre, i no els guarda en memòria. La primera línia és
+    {"metadata": ...} i la segona {"ubicacions_granges": [...]}. Si el fitxer acaba en .gz, es
+    comprimeix al vol. `convertir_ndjson_a_json` en fa el resultats_simulacio.json de la web.
+    """
+    def __init__(self, fitxer="resultats_simulacio.ndjson"):
+        self.fitxer = fitxer
+        self._f = _obrir_text(fitxer, 'w')
+
+    def _escriure(self, registre):
+        self._f.write(json.dumps(registre, ensure_ascii=False, separators=(',', ':'), default=_valor_json))
+        self._f.write("\n")
+
+    def capcalera(self, metadata, granges):
+        self._escriure({"metadata": {"dies_simulats": DIES_SIMULACIO, "data_inici": str(DATA_INICI.date()), **metadata}})
+        self._escriure({"ubicacions_granges": [{"id": g.id, "lat": g.location[0], "lon": g.location[1]} for g in granges]})
+
+    def escriure_dia(self, registres):
+        for r in registres:
+            self._escriure(r)
+        self._f.flush()
+
+    def tancar(self):
+        if not self._f.closed:
+            self._f.close()
+            print(f"\n✅ Dades exportades correctament a: '{self.fitxer}'")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.tancar()
+
+
+def convertir_ndjson_a_json(fitxer_ndjson, filename="resultats_simulacio.json"):
+    """
+    Converteix l'NDJSON (o .ndjson.gz) d'ExportadorNDJSON en l'estructura de resultats_simulacio.json
+    que importa App.jsx (metadata, ubicacions_granges, activitat_diaria), registre a registre.
+    """
+    with _obrir_text(fitxer_ndjson, 'r') as entrada, open(filename, 'w', encoding='utf-8') as sortida:
+        sortida.write("{")
+        en_activitat = False
+        for linia in entrada:
+            if not linia.strip():
+                continue
+            registre = json.loads(linia)
+            if not en_activitat and len(registre) == 1 and next(iter(registre)) in ("metadata", "ubicacions_granges"):
+                clau, valor = next(iter(registre.items()))
+                sortida.write(f"\n{json.dumps(clau)}: {json.dumps(valor, ensure_ascii=False)},")
+                continue
+            sortida.write(",\n" if en_activitat else '\n"activitat_diaria": [\n')
+            en_activitat = True
+            sortida.write(json.dumps(registre, ensure_ascii=False))
+        sortida.write("\n]\n}\n" if en_activitat else '\n"activitat_diaria": []\n}\n')
+    print(f"\n✅ Dades exportades correctament a: '{filename}'")
+
+
+CAMPS_RUTA_COLUMNAR = ["porcs_totals", "pes_total", "distancia_total", "temps_total", "ingressos",
+                       "penalitzacions", "cost_viatge"]
+
+
+def _escriure_columnar(registres, metadata, ubicacions, directori):
+    """
+    Escriu `manifest.json` (metadata, granges, diccionaris i índex de dies) i un `dia_NNN.json` per dia
+    amb les rutes en columnes paral·leles. Les granges, tipus de camió i escorxadors van internats a
+    enters; les parades de totes les rutes del dia són un únic array amb `parades_inici` com a offsets.
+    `registres` s'ha de poder recórrer per ordre de dia, i només se'n guarda un dia en memòria.
+    """
+    os.makedirs(directori, exist_ok=True)
+    granges_id = [u["id"] for u in ubicacions]
+    index_granja = {g: i for i, g in enumerate(granges_id)}
+    diccionaris = {"tipus_camio": [], "escorxador_id": []}
+    index_dicc = {k: {} for k in diccionaris}
+
+    def internar(camp, valor):
+        taula = index_dicc[camp]
+        if valor not in taula:
+            taula[valor] = len(diccionaris[camp])
+            diccionaris[camp].append(valor)
+        return taula[valor]
+
+    def granja(pid):
+        if pid not in index_granja:
+            index_granja[pid] = len(granges_id)
+            granges_id.append(pid)
+            ubicacions.append({"id": pid, "lat": None, "lon": None})
+        return index_granja[pid]
+
+    dies = []
+
+    def tancar_dia(dia, rutes, estat):
+        columnes = {"dia": dia, "camio_id": [r["camio_id"] for r in rutes],
+                    "tipus_camio": [internar("tipus_camio", r.get("tipus_camio") or "GRAN") for r in rutes],
+                    "escorxador_id": [internar("escorxador_id", r.get("escorxador_id") or "ESCO_CENTRAL") for r in rutes]}
+        for camp in CAMPS_RUTA_COLUMNAR:
+            columnes[camp] = [round(float(r.get(camp) or 0), 2) for r in rutes]
+        columnes["porcs_totals"] = [int(v) for v in columnes["porcs_totals"]]
+        parades, inici = [], [0]
+        detall_granja, detall_porcs, detall_inici = [], [], [0]
+        for r in rutes:
+            parades.extend(granja(pid) for pid in r["parades"])
+            inici.append(len(parades))
+            for d in r.get("detalls_parades") or []:
+                pid, _, resta = d.partition(" (")
+                detall_granja.append(granja(pid))
+                detall_porcs.append(int(resta.split()[0]) if resta else 0)
+            detall_inici.append(len(detall_granja))
+        columnes.update(parades=parades, parades_inici=inici, detall_granja=detall_granja,
+                        detall_porcs=detall_porcs, detall_inici=detall_inici)
+        fitxer = f"dia_{dia:03d}.json"
+        with open(os.path.join(directori, fitxer), 'w', encoding='utf-8') as f:
+            json.dump(columnes, f, ensure_ascii=False, separators=(',', ':'))
+        dies.append({"dia": dia, "fitxer": fitxer, "estat": estat, "rutes": len(rutes),
+                     "porcs": int(sum(columnes["porcs_totals"])),
+                     "benefici": round(sum(columnes["ingressos"]) - sum(columnes["cost_viatge"]), 2)})
+
+    dia_actual, rutes, estat = None, [], "SENSE_ACTIVITAT"
+    for r in registres:
+        if r["dia"] != dia_actual:
+            if dia_actual is not None:
+                tancar_dia(dia_actual, rutes, estat)
+            dia_actual, rutes, estat = r["dia"], [], "SENSE_ACTIVITAT"
+        if isinstance(r.get("parades"), list) and r.get("porcs_totals", 0) > 0:
+            rutes.append(r)
+            estat = "ACTIU"
+        elif r.get("camio_id") == "DESCANS":
+            estat = "DESCANS"
+    if dia_actual is not None:
+        tancar_dia(dia_actual, rutes, estat)
+
+    manifest = {
+        "versio": 1,
+        "metadata": metadata,
+        "granges": {"id": granges_id, "lat": [u["lat"] for u in ubicacions], "lon": [u["lon"] for u in ubicacions]},
+        "diccionaris": diccionaris,
+        "dies": dies,
+    }
+    with open(os.path.join(directori, "manifest.json"), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"\n✅ Dades exportades correctament a: '{directori}' ({len(dies)} dies)")
+    return manifest
+
+
+def exportar_resultats_columnar(df, granges, directori=DIR_RESULTATS_WEB):
+    """Resultats d'una simulació en format columnar per dies (vegeu `_escriure_columnar`)."""
+    metadata = {"dies_simulats": df.attrs.get("dies", DIES_SIMULACIO), "flota_utilitzada": df.attrs.get("num_camions", NUM_CAMIONS_FLOTA),
+                "data_inici": str(DATA_INICI.date())}
+    ubicacions = [{"id": g.id, "lat": g.location[0], "lon": g.location[1]} for g in granges]
+    return _escriure_columnar(df.sort_values("dia", kind='stable').to_dict(orient='records'),
+                              metadata, ubicacions, directori)
+
+
+def convertir_a_columnar(fitxer, directori=DIR_RESULTATS_WEB):
+    """Converteix un NDJSON d'ExportadorNDJSON (en streaming) o un resultats_simulacio.json al format columnar."""
+    if fitxer.endswith((".ndjson", ".ndjson.gz")):
+        with _obrir_text(fitxer, 'r') as entrada:
+            metadata = json.loads(entrada.readline())["metadata"]
+            ubicacions = json.loads(entrada.readline())["ubicacions_granges"]
+            return _escriure_columnar((json.loads(l) for l in entrada if l.strip()), metadata, ubicacions, directori)
+    with open(fitxer, encoding='utf-8') as f:
+        dades = json.load(f)
+    return _escriure_columnar(dades["activitat_diaria"], dades.get("metadata", {}),
+                              dades.get("ubicacions_granges", []), directori)
+
+
+# --- 8. DASHBOARD ---
+
+def calcular_resum(df, granges, num_camions=None):
+    """Xifres globals d'una simulació (les mateixes que mostra el dashboard)."""
     total_ingressos = df["ingressos"].sum()
     total_cost_transport = df["cost_viatge"].sum()
-    total_cost_fixe = COST_CAMIO_FIXE_SETMANAL * 2 * NUM_CAMIONS_FLOTA
+    if num_camions is None:
+        num_camions = df.attrs.get("num_camions", NUM_CAMIONS_FLOTA)
+    setmanes = max(1, df.attrs.get("dies", DIES_SIMULACIO) // DIES_SETMANA)
+    total_cost_fixe = setmanes * df.attrs.get("cost_fix_setmanal_flota", COST_CAMIO_FIXE_SETMANAL * num_camions)
     total_alimentacio = sum(g.menjar_consumit_acumulat for g in granges)
-    benefici_global = total_ingressos - total_cost_transport - total_cost_fixe - total_alimentacio
+    return {
+        "porcs_lliurats": int(df["porcs_totals"].sum()),
+        "ingressos": float(total_ingressos),
+        "penalitzacions": float(df["penalitzacions"].sum()),
+        "cost_transport": float(total_cost_transport),
+        "cost_fixe": float(total_cost_fixe),
+        "cost_alimentacio": float(total_alimentacio),
+        "benefici_net": float(total_ingressos - total_cost_transport - total_cost_fixe - total_alimentacio),
+    }
+
+
+def comparar_planificadors(planificadors=None, seed=0):
+    """Executa cada planificador sobre el mateix entorn (mateixa llavor) i en compara benefici i temps de planificació."""
+    files = []
+    for nom in planificadors or PLANIFICADORS:
+        with contextlib.redirect_stdout(io.StringIO()):
+            df, granges, _ = simular(planificador=nom, seed=seed)
+        resum = calcular_resum(df, granges)
+        files.append({
+            "planificador": nom,
+            "benefici_net": resum["benefici_net"],
+            "porcs_lliurats": resum["porcs_lliurats"],
+            "cost_transport": resum["cost_transport"],
+            "rutes": int((df["porcs_totals"] > 0).sum()),
+            "temps_planificacio_s": df.attrs["temps_planificacio"],
+        })
+    taula = pd.DataFrame(files)
+    print(taula.to_string(index=False))
+    return taula
+
+
+def _executar_replica(llavor, planificador, opcions):
+    """Una rèplica en un procés treballador: només en torna el resum (no el DataFrame)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, granges, _ = simular(planificador=planificador, seed=llavor, **opcions)
+    resum = calcular_resum(df, granges)
+    resum["llavor"] = llavor
+    resum["rutes"] = int((df["porcs_totals"] > 0).sum())
+    return resum
+
+
+def resumir_ensemble(repliques, nivell_confianca=0.95):
+    """Mitjana, desviació, percentils i interval de confiança (normal) de la mitjana per a cada mètrica."""
+    z = statistics.NormalDist().inv_cdf(0.5 + nivell_confianca / 2)
+    files = []
+    for metrica in METRIQUES_ENSEMBLE:
+        valors = repliques[metrica].to_numpy(dtype=np.float64)
+        mitjana = float(valors.mean())
+        sd = float(valors.std(ddof=1)) if len(valors) > 1 else 0.0
+        marge = z * sd / math.sqrt(len(valors))
+        p5, p50, p95 = np.percentile(valors, [5, 50, 95])
+        files.append({"metrica": metrica, "mitjana": mitjana, "sd": sd, "p5": p5, "p50": p50, "p95": p95,
+                      "ic_baix": mitjana - marge, "ic_alt": mitjana + marge})
+    return pd.DataFrame(files).set_index("metrica")
+
+
+def executar_ensemble(num_repliques=32, planificador="greedy", seed=0, max_processos=None,
+                      precisio_relativa=None, nivell_confianca=0.95, **opcions):
+    """
+    Ensemble Monte Carlo de `simular`: `num_repliques` rèpliques amb llavors independents derivades de
+    `seed` (SeedSequence), repartides entre tots els nuclis amb un ProcessPoolExecutor. Cada procés té
+    el seu propi estat aleatori i només retorna un resum. Si es dona `precisio_relativa`, s'atura quan
+    la meitat de l'interval de confiança del benefici és <= aquesta fracció de la mitjana (avaluat sobre
+    les rèpliques per ordre de llavor, perquè el resultat no depengui de l'ordre d'arribada).
+    Retorna (rèpliques, resum).
+    """
+    llavors = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(num_repliques)]
+    max_processos = max_processos or os.cpu_count() or 1
+    z = statistics.NormalDist().inv_cdf(0.5 + nivell_confianca / 2)
+
+    def prou_precis(resultats):
+        if precisio_relativa is None or len(resultats) < max(MIN_REPLIQUES_ENSEMBLE, 2):
+            return False
+        benefici = [r["benefici_net"] for r in resultats]
+        marge = z * statistics.stdev(benefici) / math.sqrt(len(benefici))
+        return marge <= precisio_relativa * abs(statistics.fmean(benefici))
+
+    resultats = []
+    if max_processos == 1:
+        # En sèrie les rèpliques corren en aquest procés: se'n desa i restaura l'estat aleatori global
+        estat = random.getstate(), np.random.get_state()
+        try:
+            for llavor in llavors:
+                resultats.append(_executar_replica(llavor, planificador, opcions))
+                if prou_precis(resultats):
+                    break
+        finally:
+            random.setstate(estat[0])
+            np.random.set_state(estat[1])
+    else:
+        with ProcessPoolExecutor(max_workers=max_processos) as executor:
+            futurs = [executor.submit(_executar_replica, llavor, planificador, opcions) for llavor in llavors]
+            for futur in futurs:
+                resultats.append(futur.result())
+                if prou_precis(resultats):
+                    for pendent in futurs:
+                        pendent.cancel()
+                    break
+
+    repliques = pd.DataFrame(resultats)
+    resum = resumir_ensemble(repliques, nivell_confianca)
+    print(f"Ensemble '{planificador}': {len(repliques)} rèpliques (IC {nivell_confianca:.0%})")
+    print(resum.to_string(float_format=lambda v: f"{v:,.2f}"))
+    return repliques, resum
+
+
+def _entorn_replica(llavor, num_escorxadors=NUM_ESCORXADORS):
+    """Entorn de `generar_entorn` per a una llavor, serialitzat perquè cada candidat en parteixi d'una còpia idèntica."""
+    estat = random.getstate(), np.random.get_state()
+    random.seed(llavor)
+    np.random.seed(llavor)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return pickle.dumps(generar_entorn(num_escorxadors=num_escorxadors), protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        random.setstate(estat[0])
+        np.random.set_state(estat[1])
+
+
+def _avaluar_flota(entorn, llavor, composicio, planificador):
+    """Benefici net d'una flota (camions grans, petits) sobre una còpia de l'entorn serialitzat."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, granges, _ = simular(planificador=planificador, seed=llavor, flota=Flota.per_defecte(*composicio),
+                                 entorn=pickle.loads(entorn))
+    return calcular_resum(df, granges)["benefici_net"]
+
+
+def optimitzar_flota(candidats=range(1, 9), planificador="greedy", seed=0, repliques_inicials=2,
+                     max_repliques=16, max_processos=None, num_escorxadors=NUM_ESCORXADORS):
+    """
+    Mida de flota que maximitza el benefici net simulat, per successive halving: cada ronda simula
+    tots els candidats vius sobre les mateixes rèpliques (nombres aleatoris comuns: cada rèplica és
+    un únic entorn generat un cop i copiat per a cada candidat), en conserva la meitat millor i
+    dobla les rèpliques. `candidats` són mides de flota (camions grans) o tuples (grans, petits) per
+    provar combinacions. Retorna (corba, òptim): benefici mitjà i rèpliques per candidat, i el guanyador.
+    """
+    candidats = [c if isinstance(c, tuple) else (int(c), 0) for c in candidats]
+    llavors = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(max_repliques)]
+    max_processos = max_processos or os.cpu_count() or 1
+    entorns = {}
+    benefici = {c: {} for c in candidats}
+
+    def avaluar(parelles):
+        for llavor in {ll for _, ll in parelles} - entorns.keys():
+            entorns[llavor] = _entorn_replica(llavor, num_escorxadors)
+        if max_processos == 1:
+            valors = [_avaluar_flota(entorns[ll], ll, c, planificador) for c, ll in parelles]
+        else:
+            with ProcessPoolExecutor(max_workers=max_processos) as executor:
+                valors = list(executor.map(_avaluar_flota, [entorns[ll] for _, ll in parelles],
+                                           [ll for _, ll in parelles], [c for c, _ in parelles],
+                                           [planificador] * len(parelles)))
+        for (c, ll), v in zip(parelles, valors):
+            benefici[c][ll] = v
+
+    vius = list(candidats)
+    n = min(repliques_inicials, max_repliques)
+    while True:
+        avaluar([(c, ll) for c in vius for ll in llavors[:n] if ll not in benefici[c]])
+        mitjana = {c: statistics.fmean(benefici[c][ll] for ll in llavors[:n]) for c in vius}
+        vius.sort(key=lambda c: -mitjana[c])
+        if len(vius) == 1 or n == max_repliques and len(vius) <= 2:
+            break
+        vius = vius[:math.ceil(len(vius) / 2)]
+        n = min(2 * n, max_repliques)
+
+    # Corba sobre les rèpliques de la primera ronda (comunes a tots els candidats, i per tant comparables)
+    comunes = llavors[:min(repliques_inicials, max_repliques)]
+    corba = pd.DataFrame([{
+        "camions_grans": c[0], "camions_petits": c[1], "num_camions": sum(c),
+        "benefici_mitja": statistics.fmean(benefici[c][ll] for ll in comunes),
+        "benefici_mitja_totes": statistics.fmean(benefici[c].values()), "repliques": len(benefici[c]),
+    } for c in candidats]).sort_values(["num_camions", "camions_grans"]).reset_index(drop=True)
+    optim = vius[0]
+    print(corba.to_string(index=False))
+    print(f"FLOTA ÒPTIMA: {optim[0]} grans + {optim[1]} petits ({len(benefici[optim])} rèpliques)")
+    return corba, optim
+
+
+MAX_RUTES_MAPA = 2000  # Per sobre, el mapa "auto" passa de dibuixar cada ruta al mapa de calor de trams
+MODES_MAPA = ("auto", "rutes", "mostra", "calor")
+
+
+def trams_rutes(rutes, granges, escorxadors):
+    """
+    Trams (node origen, node destí) de cada ruta escorxador -> parades -> escorxador i el dia de cada
+    tram. Les parades es resolen amb un índex id -> granja; els nodes 0..N-1 són les granges i els
+    següents, els escorxadors. Retorna (coordenades (lon, lat) per node, origen, desti, dia, ruta).
+    """
+    index_nodes = {g.id: i for i, g in enumerate(granges)}
+    index_nodes.update({e.id: len(granges) + k for k, e in enumerate(escorxadors)})
+    coords = np.array([(n.location[1], n.location[0]) for n in list(granges) + list(escorxadors)], dtype=np.float64)
+    if "parades" not in rutes or rutes.empty:
+        buit = np.empty(0, dtype=np.int64)
+        return coords, buit, buit, buit, buit
+    escorxador_ids = rutes["escorxador_id"].tolist() if "escorxador_id" in rutes else [None] * len(rutes)
+    nodes, dies, ids_ruta = [], [], []
+    for r, (parades, esc, dia) in enumerate(zip(rutes["parades"].tolist(), escorxador_ids, rutes["dia"].tolist())):
+        if not isinstance(parades, list) or not parades:
+            continue
+        base = index_nodes.get(esc, len(granges))
+        cami = [base] + [index_nodes[p] for p in parades if p in index_nodes] + [base]
+        nodes.append(cami)
+        dies.append(np.full(len(cami) - 1, dia))
+        ids_ruta.append(np.full(len(cami) - 1, r))
+    if not nodes:
+        buit = np.empty(0, dtype=np.int64)
+        return coords, buit, buit, buit, buit
+    origen = np.concatenate([c[:-1] for c in nodes])
+    desti = np.concatenate([c[1:] for c in nodes])
+    return coords, origen, desti, np.concatenate(dies), np.concatenate(ids_ruta)
+
+
+def dibuixar_mapa_rutes(ax, rutes, granges, escorxadors, mode="auto", max_rutes=MAX_RUTES_MAPA):
+    """
+    Mapa de rutes en una sola LineCollection. "rutes": cada tram acolorit pel dia; "mostra": com
+    "rutes" però només una de cada k rutes perquè no en passin de `max_rutes`; "calor": cada tram
+    diferent un cop, acolorit i gruixut segons quantes rutes el fan servir. "auto" tria "rutes" o
+    "calor" segons `max_rutes`. Retorna el nombre de rutes dibuixades.
+    """
+    from matplotlib.collections import LineCollection
+    from matplotlib.colors import LogNorm
+
+    coords, origen, desti, dies, ids_ruta = trams_rutes(rutes, granges, escorxadors)
+    num_rutes = len(np.unique(ids_ruta))
+    if mode == "auto":
+        mode = "rutes" if num_rutes <= max_rutes else "calor"
+
+    ax.scatter([e.location[1] for e in escorxadors], [e.location[0] for e in escorxadors],
+               c='red', s=200, marker='X', zorder=10, label='Escorxador')
+    ax.scatter(coords[:len(granges), 0], coords[:len(granges), 1], c='green', alpha=0.5,
+               s=50 if len(granges) <= 1000 else 4, label='Granges', rasterized=len(granges) > 1000)
+    ax.set_xlabel("Longitud")
+    ax.set_ylabel("Latitud")
+    ax.grid(True, alpha=0.3)
+    if num_rutes == 0:
+        ax.set_title("Mapa de Rutes (Total: 0 rutes)")
+        ax.legend(loc='upper right')
+        return 0
+
+    if mode == "calor":
+        # Trams no dirigits: (a, b) i (b, a) són el mateix tram
+        a, b = np.minimum(origen, desti), np.maximum(origen, desti)
+        trams, usos = np.unique(a * len(coords) + b, return_counts=True)
+        ordre = np.argsort(usos, kind='stable')  # Els trams més usats, dibuixats a sobre
+        a, b = np.divmod(trams[ordre], len(coords))
+        usos = usos[ordre]
+        linies = LineCollection(np.stack([coords[a], coords[b]], axis=1), array=usos, cmap='inferno_r',
+                                norm=LogNorm(vmin=1, vmax=max(usos.max(), 2)),
+                                linewidths=0.5 + 2.5 * usos / usos.max(), alpha=0.8)
+        ax.add_collection(linies)
+        ax.figure.colorbar(linies, ax=ax, label="Rutes per tram")
+        ax.set_title(f"Mapa de Trams ({num_rutes} rutes, {len(trams)} trams)")
+    else:
+        titol = f"Mapa de Rutes (Total: {num_rutes} rutes)"
+        if mode == "mostra" and num_rutes > max_rutes:
+            pas = math.ceil(num_rutes / max_rutes)
+            _, ordre = np.unique(ids_ruta, return_inverse=True)
+            seleccionats = ordre % pas == 0
+            origen, desti, dies = origen[seleccionats], desti[seleccionats], dies[seleccionats]
+            titol = f"Mapa de Rutes (1 de cada {pas} de {num_rutes} rutes)"
+        linies = LineCollection(np.stack([coords[origen], coords[desti]], axis=1), array=dies, cmap='viridis',
+                                linewidths=1, alpha=0.5)
+        ax.add_collection(linies)
+        ax.figure.colorbar(linies, ax=ax, label="Dia")
+        ax.set_title(titol)
+    ax.autoscale_view()
+    ax.legend(loc='upper right')
+    return num_rutes
+
+
+def generar_dashboard(df, granges, escorxadors, sortida=None, mapa="auto"):
+    """
+    Resum per consola i gràfics. Amb `sortida` (.png, .svg...) es renderitza sense finestra amb el
+    backend Agg i es desa al fitxer; sense, s'obre la finestra interactiva com sempre. `mapa`: mode
+    del mapa de rutes (vegeu dibuixar_mapa_rutes).
+    """
+    import matplotlib
+    if sortida is not None:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    df["benefici_net"] = df["ingressos"] - df["cost_viatge"]
+    resum = calcular_resum(df, granges)
+    total_ingressos = resum["ingressos"]
+    total_cost_transport = resum["cost_transport"]
+    total_cost_fixe = resum["cost_fixe"]
+    total_alimentacio = resum["cost_alimentacio"]
+    benefici_global = resum["benefici_net"]
 
     print("\n" + "=" * 40)
     print("   DASHBOARD LOGÍSTICA PORCINA")
     print("=" * 40)
-    print(f"Flota Utilitzada: {NUM_CAMIONS_FLOTA} camions")
+    print(f"Flota Utilitzada: {df.attrs.get('num_camions', NUM_CAMIONS_FLOTA)} camions")
     print(f"Total Porcs Lliurats: {df['porcs_totals'].sum():,.0f}")
     print(f"Total Ingressos Venda: {total_ingressos:,.2f} €")
     print(f"Total Penalitzacions: {df['penalitzacions'].sum():,.2f} €")
@@ -626,14 +2919,16 @@ def generar_dashboard(df, granges, escorxador):
 
     fig, axs = plt.subplots(2, 2, figsize=(14, 10))
     
-    daily_pigs = df.groupby("dia")["porcs_totals"].sum().reindex(range(1, DIES_SIMULACIO + 1), fill_value=0)
-    colors = ['skyblue' if i % 7 < 5 else 'lightgray' for i in range(DIES_SIMULACIO)]
+    dies = df.attrs.get("dies", DIES_SIMULACIO)
+    daily_pigs = df.groupby("dia")["porcs_totals"].sum().reindex(range(1, dies + 1), fill_value=0)
+    colors = ['skyblue' if i % 7 < 5 else 'lightgray' for i in range(dies)]
     axs[0, 0].bar(daily_pigs.index, daily_pigs.values, color=colors)
     axs[0, 0].set_title("Porcs Processats (Gris=Cap de Setmana)")
-    axs[0, 0].set_xticks(range(1, DIES_SIMULACIO + 1))
+    if dies <= 31:
+        axs[0, 0].set_xticks(range(1, dies + 1))
     
     # Línia de capacitat i escala Y dinàmica per mostrar el màxim
-    cap_diaria = escorxador.capacitat_diaria
+    cap_diaria = sum(e.capacitat_diaria for e in escorxadors)
     axs[0, 0].axhline(y=cap_diaria, color='r', linestyle='--', label=f'Capacitat ({cap_diaria})')
     
     # Calculem el màxim entre les dades i la capacitat per ajustar l'eix Y
@@ -653,54 +2948,159 @@ def generar_dashboard(df, granges, escorxador):
         axs[1, 0].set_title("Distribució de Càrrega (kg)")
 
     # 4. MAPA DE RUTES (TOTS ELS DIES)
-    escorxador_loc = escorxador.location 
-    
-    # Dibuixem elements estàtics
-    axs[1, 1].scatter(escorxador_loc[1], escorxador_loc[0], c='red', s=200, marker='X', zorder=10, label='Escorxador')
-    lats_g = [g.location[0] for g in granges]
-    lons_g = [g.location[1] for g in granges]
-    axs[1, 1].scatter(lons_g, lats_g, c='green', alpha=0.5, s=50, label='Granges')
-    
-    # Filtrem totes les rutes actives (no només dia 1)
-    rutas_actives = df[df["porcs_totals"] > 0]
-    count_rutas = 0
-    
-    # Paleta de colors per diferenciar dies
-    cmap = plt.get_cmap('tab20')
-    
-    for idx, row in rutas_actives.iterrows():
-        if isinstance(row['parades'], list) and len(row['parades']) > 0:
-             ruta_lats = [escorxador_loc[0]]
-             ruta_lons = [escorxador_loc[1]]
-             
-             for parada_id in row['parades']:
-                 g_obj = next((g for g in granges if g.id == parada_id), None)
-                 if g_obj:
-                     ruta_lats.append(g_obj.location[0])
-                     ruta_lons.append(g_obj.location[1])
-             
-             ruta_lats.append(escorxador_loc[0])
-             ruta_lons.append(escorxador_loc[1])
-             
-             # Color basat en el dia
-             dia_actual = row['dia']
-             color_dia = cmap((dia_actual - 1) % 20)
-             
-             axs[1, 1].plot(ruta_lons, ruta_lats, color=color_dia, alpha=0.5, linestyle='-', marker='.', linewidth=1)
-             count_rutas += 1
-
-    axs[1, 1].set_title(f"Mapa de Rutes (Total: {count_rutas} rutes)")
-    axs[1, 1].set_xlabel("Longitud")
-    axs[1, 1].set_ylabel("Latitud")
-    axs[1, 1].legend(loc='upper right')
-    axs[1, 1].grid(True, alpha=0.3)
+    dibuixar_mapa_rutes(axs[1, 1], df[df["porcs_totals"] > 0], granges, escorxadors, mode=mapa)
 
     plt.tight_layout()
-    plt.show()
+    if sortida is not None:
+        fig.savefig(sortida, dpi=120)
+        plt.close(fig)
+        print(f"Dashboard desat a {sortida}")
+    else:
+        plt.show()
 
     return df
 
+# --- 9. LÍNIA D'ORDRES ---
+
+def _entorn_cli(args):
+    if args.dades:
+        return carregar_entorn(args.dades, args.escorxadors_dades)
+    if args.escala:
+        return generar_entorn_massiu(args.escala, seed=args.seed or 0)
+    return None
+
+
+@contextlib.contextmanager
+def _perfilador(tipus, prefix):
+    """Executa el bloc sota cProfile o pyinstrument (perfilador per mostreig, opcional), si es demana."""
+    if tipus is None:
+        yield
+        return
+    if tipus == "cprofile":
+        import cProfile
+        import pstats
+        perfilador = cProfile.Profile()
+        perfilador.enable()
+        try:
+            yield
+        finally:
+            perfilador.disable()
+            perfilador.dump_stats(prefix + ".prof")
+            pstats.Stats(perfilador).sort_stats("cumulative").print_stats(25)
+        return
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        raise SystemExit("--perfilador pyinstrument necessita el paquet pyinstrument (pip install pyinstrument)")
+    perfilador = Profiler()
+    perfilador.start()
+    try:
+        yield
+    finally:
+        perfilador.stop()
+        with open(prefix + ".perfil.html", 'w', encoding='utf-8') as f:
+            f.write(perfilador.output_html())
+        print(perfilador.output_text())
+
+
+def main(argv=None):
+    """
+    simulate  [--no-plot] [--sortida fitxer.json]   simula, exporta el JSON i (per defecte) mostra el dashboard
+    export    [--sortida fitxer.json]               només simula i exporta el JSON
+    dashboard [--imatge fitxer.png|.svg]            simula i dibuixa el dashboard (a fitxer, sense finestra)
+    convert   entrada.ndjson[.gz] [--sortida f]     NDJSON en streaming -> resultats_simulacio.json de la web
+              entrada [--columnar DIR]              NDJSON o resultats_simulacio.json -> format columnar per dies
+    Amb --sortida .ndjson o .ndjson.gz, simulate/export escriuen els resultats dia a dia.
+    --perfil desa temps i comptadors per fase al costat dels resultats; --perfilador hi afegeix cProfile.
+    --punts-control DIR desa l'estat cada dilluns (DIR/dia_NNN) i --reprendre DIR/dia_NNN continua des
+    d'aquell punt, p. ex. amb un altre --planificador o --camions per provar una branca.
+    --mapa tria el mapa de rutes del dashboard: cada ruta, una mostra o el mapa de calor de trams.
+    matplotlib només es carrega quan hi ha gràfics.
+    """
+    parser = argparse.ArgumentParser(prog="CalcP", description="Simulació de logística porcina")
+    ordres = parser.add_subparsers(dest="ordre")
+    for nom in ("simulate", "export", "dashboard"):
+        sub = ordres.add_parser(nom)
+        sub.add_argument("--planificador", choices=sorted(PLANIFICADORS), default="greedy")
+        sub.add_argument("--seed", type=int, default=None)
+        sub.add_argument("--escorxadors", type=int, default=NUM_ESCORXADORS, help="escorxadors de l'entorn aleatori")
+        sub.add_argument("--escala", choices=sorted(ESCALES_ENTORN), default=None, help="entorn de generar_entorn_massiu")
+        sub.add_argument("--dades", default=None, help="granges reals (CSV, JSON o .db) en lloc de l'entorn aleatori")
+        sub.add_argument("--escorxadors-dades", default=FITXER_ESCORXADORS)
+        sub.add_argument("--sortida", default="resultats_simulacio.json", help="fitxer JSON de resultats")
+        sub.add_argument("--imatge", default=None, help="desa el dashboard en aquest fitxer (.png, .svg) sense finestra")
+        sub.add_argument("--mapa", choices=MODES_MAPA, default="auto",
+                         help=f"mapa de rutes: cada ruta, una mostra o mapa de calor de trams (auto: calor si > {MAX_RUTES_MAPA} rutes)")
+        sub.add_argument("--columnar", default=None, metavar="DIR",
+                         help="exporta també manifest + un fitxer per dia per al dashboard web")
+        sub.add_argument("--dies", type=int, default=DIES_SIMULACIO)
+        sub.add_argument("--camions", type=int, default=None, help="camions de 20T (per defecte, transports 1.csv)")
+        sub.add_argument("--camions-petits", type=int, default=NUM_CAMIONS_PETITS)
+        sub.add_argument("--punts-control", default=None, metavar="DIR", help="desa l'estat cada dilluns a DIR/dia_NNN")
+        sub.add_argument("--reprendre", default=None, metavar="DIR", help="continua des d'un punt de control")
+        sub.add_argument("--reposicio", action="store_true", help="reposa els lots buits (horitzons llargs)")
+        sub.add_argument("--creixement-diari", action="store_true",
+                         help="els porcs creixen cada dia (corbes interpolades) en lloc de cada dilluns")
+        sub.add_argument("--perfil", action="store_true",
+                         help="temps i comptadors per fase i dia a <sortida>.perfil.json i .csv")
+        sub.add_argument("--perfilador", choices=["cprofile", "pyinstrument"], default=None,
+                         help="executa sota cProfile (<sortida>.prof) o pyinstrument (<sortida>.perfil.html)")
+        if nom == "simulate":
+            sub.add_argument("--no-plot", action="store_true", help="no dibuixa el dashboard")
+    conv = ordres.add_parser("convert")
+    conv.add_argument("entrada", help="fitxer .ndjson o .ndjson.gz")
+    conv.add_argument("--sortida", default="resultats_simulacio.json")
+    conv.add_argument("--columnar", default=None, metavar="DIR", help="converteix al format columnar en lloc de JSON")
+    args = parser.parse_args(argv)
+    if args.ordre is None:
+        args = parser.parse_args(["simulate"] + list(argv if argv is not None else sys.argv[1:]))
+    if args.ordre == "convert":
+        if args.columnar:
+            convertir_a_columnar(args.entrada, args.columnar)
+        else:
+            convertir_ndjson_a_json(args.entrada, args.sortida)
+        return None
+
+    # Amb sortida .ndjson / .ndjson.gz els resultats s'escriuen dia a dia en lloc d'acumular-se
+    streaming = args.ordre in ("simulate", "export") and args.sortida.endswith((".ndjson", ".ndjson.gz"))
+    exportador = ExportadorNDJSON(args.sortida) if streaming else None
+    reprendre = PuntControl(args.reprendre) if args.reprendre else None
+    flota = Flota.per_defecte(args.camions, args.camions_petits) if args.camions is not None else None
+    punts_control = {dia: os.path.join(args.punts_control, f"dia_{dia:03d}")
+                     for dia in range(1, args.dies + 2, DIES_SETMANA)} if args.punts_control else None
+    perfil = Perfil() if args.perfil else PERFIL_INACTIU
+    prefix = args.sortida
+    for ext in (".gz", ".ndjson", ".json"):
+        prefix = prefix[:-len(ext)] if prefix.endswith(ext) else prefix
+
+    with _perfilador(args.perfilador, prefix):
+        try:
+            df, granges, escorxadors = simular(planificador=args.planificador, seed=args.seed,
+                                               num_escorxadors=args.escorxadors,
+                                               entorn=None if reprendre else _entorn_cli(args),
+                                               exportador=exportador, dies=args.dies, flota=flota,
+                                               reprendre=reprendre, punts_control=punts_control,
+                                               reposicio=args.reposicio, perfil=perfil,
+                                               creixement_diari=args.creixement_diari)
+        finally:
+            if exportador is not None:
+                exportador.tancar()
+        with perfil.fase("exportacio"):
+            if args.ordre in ("simulate", "export") and not streaming:
+                exportar_resultats_json(df, args.sortida)
+            if args.columnar:
+                if streaming:
+                    convertir_a_columnar(args.sortida, args.columnar)
+                else:
+                    exportar_resultats_columnar(df, granges, args.columnar)
+        if args.ordre == "dashboard" or (args.ordre == "simulate" and not args.no_plot):
+            with perfil.fase("dashboard"):
+                generar_dashboard(df, granges, escorxadors, sortida=args.imatge, mapa=args.mapa)
+    if args.perfil:
+        fitxer_json, fitxer_csv = perfil.exportar(prefix + ".perfil")
+        print(f"Perfil desat a '{fitxer_json}' i '{fitxer_csv}'")
+    return df
+
+
 if __name__ == "__main__":
-    df_resultats, granges_estat_final, obj_escorxador = simular()
-    exportar_resultats_json(df_resultats)
-    generar_dashboard(df_resultats, granges_estat_final, obj_escorxador)
\ No newline at end of file
+    main()
@@ -0,0 +1,455 @@
+"""
+Benchmarks de CalcP.py: temps, rendiment i memòria de pic dels camins calents, sobre entorns
+sintètics amb llavor fixa a tres nivells d'escala, per saber si un canvi fa el motor més ràpid o més lent.
+
+    python benchmark.py                              # nivells petit i regional
+    python benchmark.py --nivells petit,regional,nacional --repeticions 3
+    python benchmark.py --desar-base                 # fixa els resultats d'aquesta execució com a línia base
+    python benchmark.py --desar-referencia           # regenera les rutes de referència (només si el canvi les ha de canviar)
+
+Cada execució s'afegeix a l'historial (JSON) i es compara amb la línia base: un benchmark més lent o
+amb més memòria de pic que la base més la tolerància surt marcat com a regressió. Abans dels temps
+es comprova que els camins optimitzats donen el mateix que els de referència: les rutes d'uns
+escenaris fixos contra rutes_referencia.json, les versions vectoritzades del Ramat contra les
+de Granja i l'índex espacial contra força bruta. Surt amb codi 1 si hi ha cap regressió o cap diferència.
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import CalcP
+
+DIR_BENCHMARKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+FITXER_HISTORIAL = os.path.join(DIR_BENCHMARKS, "historial.json")
+FITXER_BASE = os.path.join(DIR_BENCHMARKS, "base.json")
+FITXER_REFERENCIA = os.path.join(DIR_BENCHMARKS, "rutes_referencia.json")
+
+LLAVOR = 0
+TOLERANCIA = 0.15  # Marge sobre la línia base abans de considerar-ho una regressió
+# Mètriques comparades amb la base (del temps, el mínim de les repeticions, que és el més estable) i
+# la diferència absoluta mínima de cadascuna: per sota, el soroll de mesura pesa més que el canvi
+LLINDARS_REGRESSIO = {"temps_min_s": 1e-3, "memoria_pic_mb": 1.0}
+DIES_BENCHMARK = 5  # Una setmana laborable de simulació de cap a cap
+TEMPS_MINIM_MESURA = 0.05  # Cada repetició repeteix les crides curtes fins a sumar-ne com a mínim tant (s)
+
+# Nivells d'escala: l'entorn de generar_entorn_massiu, la flota (grans, petits) i les repeticions per defecte.
+# Al nacional els lots són com els del petit perquè el ramat (~20M porcs) càpiga en memòria al costat
+# de la matriu de distàncies de 20k nodes (float32 mapada a disc).
+NIVELLS = {
+    "petit": {"entorn": CalcP.ESCALES_ENTORN["petit"], "flota": (CalcP.NUM_CAMIONS_FLOTA, CalcP.NUM_CAMIONS_PETITS),
+              "repeticions": 5},
+    "regional": {"entorn": {**CalcP.ESCALES_ENTORN["regional"], "granges": 2000}, "flota": (30, 10),
+                 "repeticions": 3},
+    "nacional": {"entorn": {**CalcP.ESCALES_ENTORN["nacional"], "granges": 20000, "porcs_lot": (150, 350)},
+                 "flota": (150, 50), "repeticions": 1},
+}
+
+# Escenaris de la comprovació de rutes: (planificador, seed, escorxadors, nivell o None = generar_entorn)
+ESCENARIS_RUTES = [
+    ("greedy", 0, 1, None),
+    ("estalvis", 0, 1, None),
+    ("greedy", 1, 3, None),
+    ("estalvis", 2, 3, None),
+    ("greedy", LLAVOR, None, "petit"),
+    ("estalvis", LLAVOR, None, "petit"),
+]
+
+
+# --- Entorns ---
+
+class Instantania:
+    """
+    Estat mutable d'un entorn (ramat, granges visitades, menjar) per tornar-lo al punt de partida
+    entre repeticions sense regenerar-lo: la matriu de distàncies del nivell nacional triga més a
+    calcular que qualsevol benchmark.
+    """
+    ARRAYS = ("pesos", "inici", "edat", "z_intake", "pes_mig", "desviacio_std", "menjar_acumulat")
+
+    def __init__(self, entorn):
+        self.entorn = entorn
+        _, granges, _ = entorn
+        self.ramat = CalcP.Ramat.des_de_granges(granges)
+        self.arrays = {nom: getattr(self.ramat, nom).copy() for nom in self.ARRAYS}
+
+    def restaurar(self):
+        escorxadors, granges, _ = self.entorn
+        ramat = self.ramat
+        for nom, valors in self.arrays.items():
+            getattr(ramat, nom)[:] = valors
+        ramat._prefix = ramat._consum_setmanal = ramat._cost_granja = None
+        ramat._granges_modificades[:] = True
+        ramat.versio_granja += 1  # Les caches de càrrega de Granja ja no valen
+        ramat.lots_buidats = []
+        for g in granges:
+            g.visitada_aquesta_setmana = False
+        for e in escorxadors:
+            e.reset_diari()
+        return self.entorn
+
+
+def generar_nivell(nivell, seed=LLAVOR):
+    return CalcP.generar_entorn_massiu(NIVELLS[nivell]["entorn"], seed)
+
+
+def flota_nivell(nivell):
+    return CalcP.Flota.per_defecte(*NIVELLS[nivell]["flota"])
+
+
+def simular_silenciosament(**kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return CalcP.simular(**kwargs)
+
+
+# --- Mesura ---
+
+def mesurar(funcio, preparar=None, repeticions=3):
+    """
+    Executa `funcio(estat)` (estat = `preparar()`, fora del temps) un cop sota tracemalloc per a la
+    memòria de pic, que fa alhora d'escalfament, i després `repeticions` vegades més cronometrades
+    (com timeit.autorange, les crides curtes es repeteixen fins a TEMPS_MINIM_MESURA i se'n pren la
+    mitjana: una crida de mil·lisegons sola és sobretot soroll). `funcio` retorna el nombre d'operacions fetes, per al rendiment (operacions/s sobre la mediana).
+    """
+    estat = preparar() if preparar else None
+    tracemalloc.start()
+    try:
+        funcio(estat)
+        _, pic = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    temps = []
+    for _ in range(repeticions):
+        total, crides = 0.0, 0
+        while crides == 0 or total < TEMPS_MINIM_MESURA:
+            estat = preparar() if preparar else None
+            t0 = time.perf_counter()
+            operacions = funcio(estat)
+            total += time.perf_counter() - t0
+            crides += 1
+        temps.append(total / crides)
+    mediana = statistics.median(temps)
+    return {"temps_s": mediana, "temps_min_s": min(temps), "repeticions": repeticions, "operacions": operacions,
+            "operacions_s": operacions / mediana if mediana > 0 else None, "memoria_pic_mb": pic / 2**20}
+
+
+def benchmarks_nivell(nivell, repeticions=None, dies=DIES_BENCHMARK, seed=LLAVOR):
+    """Tots els benchmarks d'un nivell sobre un sol entorn, restaurat abans de cada repetició."""
+    repeticions = repeticions or NIVELLS[nivell]["repeticions"]
+    entorn = generar_nivell(nivell, seed)
+    instantania = Instantania(entorn)
+    escorxadors, granges, _ = entorn
+    ramat = instantania.ramat
+    lots = [lot for g in granges for lot in g.lots]
+    resultats = {}
+
+    def afegir(nom, funcio, preparar=instantania.restaurar):
+        resultats[nom] = mesurar(funcio, preparar, repeticions)
+        print(f"   {nivell:>9} {nom:<38} {resultats[nom]['temps_s'] * 1000:10.2f} ms "
+              f"{resultats[nom]['operacions_s'] or 0:14.0f} op/s {resultats[nom]['memoria_pic_mb']:9.1f} MB")
+
+    def obtenir_porcs(_):
+        for lot in lots:
+            lot.obtenir_porcs_per_venda(CalcP.CAPACITAT_CAMIO_GRAN)
+        return len(lots)
+    afegir("PorcBatch.obtenir_porcs_per_venda", obtenir_porcs)
+
+    def benefici(_):
+        for i in range(len(lots)):
+            CalcP.calcular_benefici_lot(ramat.pesos_lot(i), escorxadors[0])
+        return len(lots)
+    afegir("calcular_benefici_lot", benefici)
+
+    def consum_granja(_):
+        for g in granges:
+            g.calcular_consum_diari()
+        return len(granges)
+    afegir("Granja.calcular_consum_diari", consum_granja)
+
+    def consum_ramat(_):
+        ramat.calcular_consum_diari()
+        return len(granges)
+    afegir("Ramat.calcular_consum_diari", consum_ramat)
+
+    def te_porcs_granja(_):
+        for g in granges:
+            g.te_porcs_per_venda()
+        return len(granges)
+    afegir("Granja.te_porcs_per_venda", te_porcs_granja)
+
+    def te_porcs_ramat(_):
+        ramat.te_porcs_per_venda()
+        return len(granges)
+    afegir("Ramat.te_porcs_per_venda", te_porcs_ramat)
+
+    # De cap a cap: la planificació diària surt del Perfil de les mateixes execucions cronometrades
+    execucions = []
+
+    def simulacio(entorn_restaurat):
+        perfil = CalcP.Perfil()
+        df, _, _ = simular_silenciosament(entorn=entorn_restaurat, flota=flota_nivell(nivell), dies=dies,
+                                          seed=seed, perfil=perfil)
+        execucions.append((df, perfil.resum()))
+        return dies
+    afegir("simular", simulacio)
+
+    planificacio = []
+    for df, resum in execucions[1:]:  # La primera és la de tracemalloc
+        segons = sum(resum["fases"].get(f, {}).get("temps_s", 0.0) for f in ("candidats", "assignacio", "planificacio"))
+        planificacio.append((segons, int(resum["comptadors"].get("rutes", 0))))
+    segons = statistics.median(s for s, _ in planificacio)
+    dies_laborables = sum(1 for d in range(1, dies + 1) if (d - 1) % CalcP.DIES_SETMANA < 5)
+    resultats["planificacio_dia"] = {
+        "temps_s": segons / dies_laborables, "temps_min_s": min(s for s, _ in planificacio) / dies_laborables,
+        "repeticions": len(planificacio), "operacions": planificacio[0][1],
+        "operacions_s": planificacio[0][1] / segons if segons > 0 else None,
+        "memoria_pic_mb": resultats["simular"]["memoria_pic_mb"]}
+    print(f"   {nivell:>9} {'planificacio_dia':<38} {resultats['planificacio_dia']['temps_s'] * 1000:10.2f} ms "
+          f"{resultats['planificacio_dia']['operacions_s'] or 0:14.0f} rutes/s")
+
+    df = execucions[0][0]
+    with tempfile.TemporaryDirectory() as directori:
+        fitxer = os.path.join(directori, "resultats.json")
+
+        def exportar(_):
+            with contextlib.redirect_stdout(io.StringIO()):
+                CalcP.exportar_resultats_json(df, fitxer)
+            return len(df)
+        afegir("exportar_resultats_json", exportar, preparar=None)
+
+    return resultats
+
+
+# --- Equivalència amb la referència ---
+
+def empremta_rutes(df):
+    """Les rutes d'una simulació reduïdes al que ha de ser idèntic entre implementacions."""
+    rutes = df[df["porcs_totals"] > 0]
+    return [[int(r["dia"]), r["camio_id"], r["escorxador_id"], list(r["parades"]), int(r["porcs_totals"]),
+             round(float(r["pes_total"]), 6)] for r in rutes.to_dict(orient="records")]
+
+
+def rutes_escenari(planificador, seed, num_escorxadors, nivell):
+    entorn = generar_nivell(nivell, seed) if nivell else None
+    flota = flota_nivell(nivell) if nivell else CalcP.Flota.per_defecte()
+    df, _, _ = simular_silenciosament(planificador=planificador, seed=seed, flota=flota,
+                                      num_escorxadors=num_escorxadors or CalcP.NUM_ESCORXADORS, entorn=entorn)
+    return empremta_rutes(df)
+
+
+def clau_escenari(planificador, seed, num_escorxadors, nivell):
+    return f"{planificador}/seed={seed}/" + (f"nivell={nivell}" if nivell else f"escorxadors={num_escorxadors}")
+
+
+def comprovar_rutes(fitxer=FITXER_REFERENCIA, desar=False):
+    """Compara les rutes de ESCENARIS_RUTES amb les de referència. Retorna {escenari: error o None}."""
+    actuals = {clau_escenari(*e): rutes_escenari(*e) for e in ESCENARIS_RUTES}
+    if desar:
+        os.makedirs(os.path.dirname(fitxer), exist_ok=True)
+        with open(fitxer, 'w', encoding='utf-8') as f:
+            json.dump(actuals, f, ensure_ascii=False, indent=1)
+        print(f"✅ Rutes de referència desades a '{fitxer}'")
+        return {clau: None for clau in actuals}
+    if not os.path.exists(fitxer):
+        return {clau: f"no hi ha referència ({fitxer})" for clau in actuals}
+    with open(fitxer, encoding='utf-8') as f:
+        referencia = json.load(f)
+    errors = {}
+    for clau, rutes in actuals.items():
+        esperades = referencia.get(clau)
+        errors[clau] = None
+        if esperades is None:
+            errors[clau] = "escenari sense referència"
+        elif len(rutes) != len(esperades):
+            errors[clau] = f"{len(rutes)} rutes en lloc de {len(esperades)}"
+        else:
+            for n, (ruta, esperada) in enumerate(zip(rutes, esperades)):
+                if ruta[:5] != esperada[:5] or not np.isclose(ruta[5], esperada[5], rtol=1e-9, atol=1e-6):
+                    errors[clau] = f"la ruta {n} difereix: {ruta} en lloc de {esperada}"
+                    break
+    return errors
+
+
+def cost_menjar_referencia(granja):
+    """Cost diari d'una granja lot a lot, sense cap cache: la referència del cost vectoritzat."""
+    ramat = granja._ramat
+    return sum(float(ramat.consum_setmanal_per_porc(lots=lot._i)) / 7.0 * lot.quantitat * CalcP.PREU_MENJAR_KG
+               for lot in granja.lots if lot.quantitat > 0)
+
+
+def comprovar_vectoritzats(nivell, seed=LLAVOR):
+    """El Ramat vectoritzat contra els mètodes per granja (referència) en un entorn del nivell."""
+    _, granges, _ = generar_nivell(nivell, seed)
+    ramat = CalcP.Ramat.des_de_granges(granges)
+    errors = {}
+    # El cost en cache, abans i després de vendre la meitat dels lots i de créixer una setmana
+    for pas in ("inicial", "vendes", "creixement"):
+        if pas == "vendes":
+            for g in granges[::2]:
+                g.lots[0].obtenir_porcs_per_venda(CalcP.CAPACITAT_CAMIO_GRAN)
+        elif pas == "creixement":
+            ramat.creixer_una_setmana()
+        cost = ramat.cost_menjar_diari()
+        cost_granja = np.array([cost_menjar_referencia(g) for g in granges])
+        errors[f"cost_menjar_diari/{pas}"] = None if np.allclose(cost, cost_granja, rtol=1e-9) else \
+            f"diferència màxima {np.abs(cost - cost_granja).max():.6g} €"
+    te_venda = ramat.te_porcs_per_venda()
+    te_venda_granja = np.array([g.te_porcs_per_venda() for g in granges])
+    errors["te_porcs_per_venda"] = None if np.array_equal(te_venda, te_venda_granja) else \
+        f"{int((te_venda != te_venda_granja).sum())} granges diferents"
+    # La càrrega estimada de totes les granges alhora, amb lots ja venuts parcialment
+    for max_kg in (CalcP.CAPACITAT_CAMIO_GRAN, CalcP.CAPACITAT_CAMIO_GRAN / 3):
+        porcs, kg = ramat.estimar_carrega_granges(np.arange(len(granges)), max_kg)
+        referencia = np.array([g.estimar_carrega(max_kg) for g in granges])
+        diferents = (porcs != referencia[:, 0]) | (kg != referencia[:, 1])
+        errors[f"estimar_carrega_granges/{max_kg:g}kg"] = None if not diferents.any() else \
+            f"{int(diferents.sum())} granges diferents"
+    return errors
+
+
+def comprovar_index_espacial(seed=LLAVOR, num_punts=2000, consultes=200, k=5, radi=40.0):
+    """
+    IndexEspacial en mode haversine contra força bruta sobre la matriu de distàncies, amb punts a
+    latituds altes (58-70°N), on la graella de 111/85 km per grau més sobreestima la distància real.
+    """
+    gen = np.random.default_rng(seed)
+    lats, lons = gen.uniform(58, 70, num_punts), gen.uniform(-10, 30, num_punts)
+    distancies = CalcP.MatriuDistancies(lats, lons, mode="haversine")
+    index = CalcP.IndexEspacial(lats, lons, distancies)
+    actius = np.flatnonzero(gen.random(num_punts) < 0.7)
+    index.activar(actius.tolist())
+    fallades = {"k_mes_propers": 0, "dins_radi": 0}
+    for node in gen.choice(num_punts, consultes, replace=False).tolist():
+        esperades = np.sort(distancies.dist[node, actius[actius != node]])
+        veins = [d for _, d in index.k_mes_propers(node, k=k)]
+        if len(veins) != k or not np.allclose(veins, esperades[:k]):
+            fallades["k_mes_propers"] += 1
+        veins = sorted(d for _, d in index.dins_radi(node, radi))
+        if len(veins) != int((esperades < radi).sum()) or not np.allclose(veins, esperades[esperades < radi]):
+            fallades["dins_radi"] += 1
+    return {f"index_espacial/{nom}": None if n == 0 else f"{n} de {consultes} consultes difereixen de la força bruta"
+            for nom, n in fallades.items()}
+
+
+# --- Historial i línia base ---
+
+def _commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _llegir_json(fitxer, defecte):
+    if not os.path.exists(fitxer):
+        return defecte
+    with open(fitxer, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _escriure_json(fitxer, dades):
+    os.makedirs(os.path.dirname(os.path.abspath(fitxer)), exist_ok=True)
+    tmp = fitxer + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(dades, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, fitxer)
+
+
+def comparar_amb_base(resultats, base, tolerancia=TOLERANCIA):
+    """Regressions respecte de la base: [(nivell, benchmark, mètrica, valor, valor_base)]."""
+    regressions = []
+    for nivell, benchmarks in resultats.items():
+        for nom, r in benchmarks.items():
+            b = base.get(nivell, {}).get(nom)
+            if b is None:
+                continue
+            for metrica, llindar in LLINDARS_REGRESSIO.items():
+                if r[metrica] > b[metrica] * (1 + tolerancia) and r[metrica] - b[metrica] > llindar:
+                    regressions.append((nivell, nom, metrica, r[metrica], b[metrica]))
+    return regressions
+
+
+# --- Línia d'ordres ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks dels camins calents de CalcP.py")
+    parser.add_argument("--nivells", default="petit,regional",
+                        help=f"nivells separats per comes, de {', '.join(NIVELLS)} (el nacional necessita ~4 GB)")
+    parser.add_argument("--repeticions", type=int, default=None, help="repeticions per benchmark (per defecte, segons el nivell)")
+    parser.add_argument("--dies", type=int, default=DIES_BENCHMARK, help="dies de la simulació de cap a cap")
+    parser.add_argument("--seed", type=int, default=LLAVOR)
+    parser.add_argument("--historial", default=FITXER_HISTORIAL)
+    parser.add_argument("--base", default=FITXER_BASE, help="línia base amb què comparar")
+    parser.add_argument("--desar-base", action="store_true", help="desa aquesta execució com a línia base")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="marge relatiu abans de marcar una regressió")
+    parser.add_argument("--referencia", default=FITXER_REFERENCIA, help="rutes de referència per a la comprovació")
+    parser.add_argument("--desar-referencia", action="store_true", help="regenera les rutes de referència")
+    parser.add_argument("--sense-comprovacio", action="store_true", help="no comprova l'equivalència amb la referència")
+    args = parser.parse_args(argv)
+    nivells = [n.strip() for n in args.nivells.split(",") if n.strip()]
+    desconeguts = [n for n in nivells if n not in NIVELLS]
+    if desconeguts:
+        parser.error(f"nivells desconeguts: {', '.join(desconeguts)}")
+
+    errors = {}
+    if not args.sense_comprovacio:
+        print("🔎 Equivalència amb la referència")
+        errors.update({f"rutes/{k}": v for k, v in comprovar_rutes(args.referencia, args.desar_referencia).items()})
+        for nivell in nivells:
+            errors.update({f"{nivell}/{k}": v for k, v in comprovar_vectoritzats(nivell, args.seed).items()})
+        errors.update(comprovar_index_espacial(args.seed))
+        for clau, error in errors.items():
+            print(f"   {'✅' if error is None else '❌'} {clau}" + (f": {error}" if error else ""))
+
+    print("\n⏱️  Benchmarks")
+    resultats = {}
+    for nivell in nivells:
+        resultats[nivell] = benchmarks_nivell(nivell, args.repeticions, args.dies, args.seed)
+
+    base = _llegir_json(args.base, {}).get("resultats", {})
+    regressions = comparar_amb_base(resultats, base, args.tolerancia)
+    execucio = {
+        "data": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "maquina": platform.platform(),
+        "seed": args.seed,
+        "dies": args.dies,
+        "resultats": resultats,
+        "equivalencia": {clau: error is None for clau, error in errors.items()},
+        "regressions": [{"nivell": n, "benchmark": b, "metrica": m, "valor": v, "base": vb}
+                        for n, b, m, v, vb in regressions],
+    }
+    historial = _llegir_json(args.historial, [])
+    historial.append(execucio)
+    _escriure_json(args.historial, historial)
+    print(f"\n📈 Execució afegida a l'historial '{args.historial}' ({len(historial)} execucions)")
+    if args.desar_base:
+        _escriure_json(args.base, execucio)
+        print(f"📌 Línia base desada a '{args.base}'")
+    elif not base:
+        print(f"   (sense línia base a '{args.base}': executa amb --desar-base per fixar-ne una)")
+
+    for nivell, nom, metrica, valor, valor_base in regressions:
+        print(f"⚠️  REGRESSIÓ {nivell}/{nom}: {metrica} {valor:.4g} (base {valor_base:.4g}, "
+              f"{(valor / valor_base - 1) * 100:+.0f}%)")
+    fallades = [clau for clau, error in errors.items() if error is not None]
+    if fallades:
+        print(f"❌ {len(fallades)} comprovacions d'equivalència fallades")
+    return 1 if regressions or fallades else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,384 @@
+"""
+Servei local de simulació: un petit servidor HTTP (asyncio, només biblioteca estàndard) al voltant de
+`CalcP.simular` perquè el dashboard pugui demanar escenaris "what-if" sense executar CalcP.py a mà.
+
+    python servei.py --port 8765 --processos 2
+
+Endpoints (JSON, amb CORS obert per al servidor de desenvolupament de Vite):
+    POST /simulacions                 cos: {"num_camions", "num_camions_petits", "preu_kg", "dies",
+                                      "seed", "planificador", "num_escorxadors"} (tots opcionals).
+                                      Retorna {"id", "estat", ...}; si ja està calculat, amb el resum.
+    GET  /simulacions/<id>            estat, progrés i resum
+    GET  /simulacions/<id>/events     Server-Sent Events: un "dia" per dia acabat i un "fi" o "error"
+    GET  /resultats/<id>/<fitxer>     manifest.json i dia_NNN.json en el format columnar de la web
+
+Les feines s'executen en un ProcessPoolExecutor acotat. La clau de cada resultat és el hash dels
+paràmetres normalitzats més el de les dades d'entrada (Dades/ i el mateix CalcP.py), de manera que
+una petició repetida torna el resultat de la cache al moment, també després de reiniciar el servei.
+Els GET per <id> també troben a disc els resultats acabats d'una execució anterior del servei.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import CalcP
+
+DIR_CACHE_SERVEI = os.path.join(CalcP.DIR_CACHE_DADES, "servei")
+MAX_FEINES_PENDENTS = 32  # feines acceptades i no acabades abans de respondre 503
+MAX_COS_PETICIO = 64 * 1024
+
+# Paràmetres acceptats: nom -> (tipus, valor per defecte, mínim, màxim)
+PARAMETRES = {
+    "num_camions": (int, CalcP.NUM_CAMIONS_FLOTA, 1, 200),
+    "num_camions_petits": (int, CalcP.NUM_CAMIONS_PETITS, 0, 200),
+    "preu_kg": (float, None, 0.0, 100.0),
+    "dies": (int, CalcP.DIES_SIMULACIO, 1, 366),
+    "seed": (int, 0, 0, 2 ** 32 - 1),
+    "num_escorxadors": (int, CalcP.NUM_ESCORXADORS, 1, 20),
+}
+MISSATGES_HTTP = {200: "OK", 202: "Accepted", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+                  405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def normalitzar_parametres(cos):
+    """Valida el cos d'un POST i l'omple amb els valors per defecte. Llença ValueError si no és vàlid."""
+    if not isinstance(cos, dict):
+        raise ValueError("el cos ha de ser un objecte JSON")
+    desconeguts = set(cos) - set(PARAMETRES) - {"planificador"}
+    if desconeguts:
+        raise ValueError(f"paràmetres desconeguts: {', '.join(sorted(desconeguts))}")
+    params = {"planificador": cos.get("planificador", "greedy")}
+    if params["planificador"] not in CalcP.PLANIFICADORS:
+        raise ValueError(f"planificador desconegut: {params['planificador']!r}")
+    for nom, (tipus, defecte, minim, maxim) in PARAMETRES.items():
+        valor = cos.get(nom, defecte)
+        if valor is not None:
+            if isinstance(valor, bool) or not isinstance(valor, (int, float)) or (tipus is int and valor != int(valor)):
+                raise ValueError(f"'{nom}' ha de ser {'enter' if tipus is int else 'numèric'}")
+            valor = tipus(valor)
+            if not minim <= valor <= maxim:
+                raise ValueError(f"'{nom}' fora de rang [{minim}, {maxim}]")
+        params[nom] = valor
+    return params
+
+
+def hash_dades_entrada(dir_dades=CalcP.DIR_DADES):
+    """Hash del codi del model i de tots els fitxers de Dades/ (sense la cache ni els bloquejos d'Office)."""
+    h = hashlib.sha1(CalcP._hash_fitxer(CalcP.__file__).encode())
+    for arrel, dirs, fitxers in os.walk(dir_dades):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for nom in sorted(fitxers):
+            if nom.startswith(("~$", ".")):
+                continue
+            fitxer = os.path.join(arrel, nom)
+            h.update(os.path.relpath(fitxer, dir_dades).encode())
+            h.update(CalcP._hash_fitxer(fitxer).encode())
+    return h.hexdigest()[:16]
+
+
+def clau_feina(params, hash_dades):
+    return hashlib.sha1(json.dumps([params, hash_dades], sort_keys=True).encode()).hexdigest()[:16]
+
+
+class _ExportadorProgres(CalcP.ExportadorNDJSON):
+    """ExportadorNDJSON que, a més d'escriure el dia, n'envia un resum al procés del servei."""
+    def __init__(self, fitxer, clau, cua):
+        super().__init__(fitxer)
+        self.clau, self.cua = clau, cua
+        self.dia = 0
+
+    def escriure_dia(self, registres):
+        super().escriure_dia(registres)
+        self.dia = registres[0]["dia"]
+        self.cua.put((self.clau, "dia", {
+            "dia": self.dia,
+            "rutes": sum(1 for r in registres if r["porcs_totals"] > 0),
+            "porcs_totals": int(sum(r["porcs_totals"] for r in registres)),
+            "ingressos": float(sum(r["ingressos"] for r in registres)),
+            "cost_viatge": float(sum(r["cost_viatge"] for r in registres)),
+        }))
+
+
+def executar_feina(clau, params, directori, cua):
+    """
+    Una simulació en un procés treballador. Escriu el NDJSON en streaming i, en acabar, el format
+    columnar i resum.json a `directori` (resum.json és el que marca el resultat com a complet).
+    El final ("fi" o "error") també passa per `cua`, després de l'últim dia.
+    """
+    try:
+        resum = _simular_feina(clau, params, directori, cua)
+    except Exception as e:
+        shutil.rmtree(directori, ignore_errors=True)
+        cua.put((clau, "error", f"{type(e).__name__}: {e}"))
+        raise
+    cua.put((clau, "fi", resum))
+    return resum
+
+
+def _simular_feina(clau, params, directori, cua):
+    os.makedirs(directori, exist_ok=True)
+    fitxer_ndjson = os.path.join(directori, "resultats.ndjson")
+    with contextlib.redirect_stdout(io.StringIO()):
+        random.seed(params["seed"])
+        np.random.seed(params["seed"])
+        entorn = CalcP.generar_entorn(num_escorxadors=params["num_escorxadors"])
+        if params["preu_kg"] is not None:
+            for e in entorn[0]:
+                e.preu_kg = params["preu_kg"]
+        flota = CalcP.Flota.per_defecte(params["num_camions"], params["num_camions_petits"])
+        with _ExportadorProgres(fitxer_ndjson, clau, cua) as exportador:
+            df, granges, _ = CalcP.simular(params["planificador"], flota=flota, entorn=entorn,
+                                           exportador=exportador, dies=params["dies"])
+        CalcP.convertir_a_columnar(fitxer_ndjson, directori)
+    os.remove(fitxer_ndjson)
+    resum = CalcP.calcular_resum(df, granges)
+    resum["rutes"] = int(df["rutes"].sum())
+    resum["temps_planificacio_s"] = df.attrs["temps_planificacio"]
+    temporal = os.path.join(directori, "resum.json.tmp")
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump({"parametres": params, "resum": resum}, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, os.path.join(directori, "resum.json"))
+    return resum
+
+
+class Feina:
+    def __init__(self, clau, params):
+        self.clau = clau
+        self.params = params
+        self.estat = "en_cua"  # en_cua -> en_curs -> fet | error
+        self.progres = []
+        self.resum = None
+        self.error = None
+        self.subscriptors = set()
+
+    def publicar(self, tipus, dades):
+        if self.estat in ("fet", "error"):
+            return
+        if tipus == "dia":
+            self.estat = "en_curs"
+            self.progres.append(dades)
+        elif tipus == "fi":
+            self.estat, self.resum = "fet", dades
+            dades = self.descripcio()
+        else:
+            self.estat, self.error = "error", dades
+            dades = {"error": dades}
+        for cua in self.subscriptors:
+            cua.put_nowait((tipus, dades))
+
+    def descripcio(self):
+        return {"id": self.clau, "estat": self.estat, "parametres": self.params, "dies_fets": len(self.progres),
+                "resum": self.resum, "error": self.error,
+                "resultats": f"/resultats/{self.clau}/manifest.json" if self.estat == "fet" else None}
+
+
+class ServeiSimulacio:
+    def __init__(self, max_processos=None, dir_cache=DIR_CACHE_SERVEI):
+        self.dir_cache = dir_cache
+        self.hash_dades = hash_dades_entrada()
+        self.max_processos = max_processos or os.cpu_count() or 1
+        self.feines = {}
+        self._executor = None
+        self._gestor = None
+
+    # --- Feines ---
+
+    def _carregar_de_disc(self, clau, params=None):
+        """Feina acabada a partir del resum.json de la cache; sense `params`, els del mateix fitxer."""
+        fitxer = os.path.join(self.dir_cache, clau, "resum.json")
+        if not os.path.exists(fitxer):
+            return None
+        with open(fitxer, encoding='utf-8') as f:
+            dades = json.load(f)
+        feina = Feina(clau, dades["parametres"] if params is None else params)
+        feina.resum = dades["resum"]
+        feina.estat = "fet"
+        return feina
+
+    def _feina(self, clau):
+        """Feina per identificador: la de memòria o, si no n'hi ha (p. ex. després de reiniciar), la de disc."""
+        feina = self.feines.get(clau)
+        if feina is None and re.fullmatch(r"[0-9a-f]{16}", clau):
+            feina = self._carregar_de_disc(clau)
+            if feina is not None:
+                self.feines[clau] = feina
+        return feina
+
+    def enviar(self, params):
+        """Retorna (feina, nova). Les feines fetes o en marxa amb la mateixa clau es reutilitzen."""
+        clau = clau_feina(params, self.hash_dades)
+        feina = self.feines.get(clau)
+        if feina is not None and feina.estat != "error":
+            return feina, False
+        feina = self._carregar_de_disc(clau, params)
+        if feina is not None:
+            self.feines[clau] = feina
+            return feina, False
+        if sum(f.estat in ("en_cua", "en_curs") for f in self.feines.values()) >= MAX_FEINES_PENDENTS:
+            raise OverflowError("massa feines pendents")
+        feina = self.feines[clau] = Feina(clau, params)
+        directori = os.path.join(self.dir_cache, clau)
+        futur = asyncio.get_running_loop().run_in_executor(self._executor, executar_feina, clau, params, directori, self._cua)
+        futur.add_done_callback(lambda f: self._feina_acabada(feina, f))
+        return feina, True
+
+    @staticmethod
+    def _feina_acabada(feina, futur):
+        # El resultat normal arriba per la cua de progrés; aquí només queden les fallades del pool
+        # (p. ex. un procés treballador mort) que el treballador no ha pogut notificar
+        if not futur.cancelled() and futur.exception() is not None:
+            feina.publicar("error", f"{type(futur.exception()).__name__}: {futur.exception()}")
+
+    def _llegir_progres(self, loop):
+        """Fil que passa els missatges de progrés dels processos treballadors al bucle d'asyncio."""
+        while True:
+            missatge = self._cua.get()
+            if missatge is None:
+                return
+            clau, tipus, dades = missatge
+            feina = self.feines.get(clau)
+            if feina is not None:
+                loop.call_soon_threadsafe(feina.publicar, tipus, dades)
+
+    # --- HTTP ---
+
+    async def _respondre(self, writer, codi, cos=None, tipus="application/json", capcaleres=()):
+        dades = b"" if cos is None else cos if isinstance(cos, bytes) else json.dumps(cos, ensure_ascii=False).encode()
+        linies = [f"HTTP/1.1 {codi} {MISSATGES_HTTP.get(codi, '')}", f"Content-Type: {tipus}",
+                  f"Content-Length: {len(dades)}", "Access-Control-Allow-Origin: *",
+                  "Access-Control-Allow-Methods: GET, POST, OPTIONS", "Access-Control-Allow-Headers: Content-Type",
+                  "Connection: close", *capcaleres]
+        writer.write(("\r\n".join(linies) + "\r\n\r\n").encode() + dades)
+        await writer.drain()
+
+    async def _events(self, writer, feina):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n")
+
+        def enviar(tipus, dades):
+            writer.write(f"event: {tipus}\ndata: {json.dumps(dades, ensure_ascii=False)}\n\n".encode())
+
+        cua = asyncio.Queue()
+        feina.subscriptors.add(cua)
+        try:
+            for dades in feina.progres:
+                enviar("dia", dades)
+            if feina.estat == "fet":
+                enviar("fi", feina.descripcio())
+            if feina.estat == "error":
+                enviar("error", {"error": feina.error})
+            if feina.estat in ("fet", "error"):
+                await writer.drain()
+                return
+            await writer.drain()
+            while True:
+                tipus, dades = await cua.get()
+                enviar(tipus, dades)
+                await writer.drain()
+                if tipus != "dia":
+                    return
+        finally:
+            feina.subscriptors.discard(cua)
+
+    async def _servir_resultat(self, writer, clau, nom):
+        feina = self._feina(clau)
+        fitxer = os.path.join(self.dir_cache, clau, nom)
+        if feina is None or feina.estat != "fet" or os.path.basename(nom) != nom or not os.path.isfile(fitxer):
+            return await self._respondre(writer, 404, {"error": "resultat no trobat"})
+        with open(fitxer, 'rb') as f:
+            await self._respondre(writer, 200, f.read(), capcaleres=("Cache-Control: max-age=31536000, immutable",))
+
+    async def _atendre(self, reader, writer):
+        try:
+            peticio = (await reader.readline()).decode('latin-1').split()
+            if len(peticio) != 3:
+                return
+            metode, ruta = peticio[0], urlsplit(peticio[1]).path.strip("/").split("/")
+            capcaleres = {}
+            while (linia := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                nom, _, valor = linia.decode('latin-1').partition(":")
+                capcaleres[nom.strip().lower()] = valor.strip()
+            mida = int(capcaleres.get("content-length", 0) or 0)
+            if mida > MAX_COS_PETICIO:
+                return await self._respondre(writer, 413, {"error": "cos massa gran"})
+            cos = await reader.readexactly(mida) if mida else b""
+
+            if metode == "OPTIONS":
+                return await self._respondre(writer, 204)
+            if ruta == ["simulacions"]:
+                if metode != "POST":
+                    return await self._respondre(writer, 405, {"error": "fes servir POST"})
+                try:
+                    params = normalitzar_parametres(json.loads(cos or b"{}"))
+                except ValueError as e:  # inclou JSONDecodeError
+                    return await self._respondre(writer, 400, {"error": str(e)})
+                try:
+                    feina, nova = self.enviar(params)
+                except OverflowError as e:
+                    return await self._respondre(writer, 503, {"error": str(e)})
+                return await self._respondre(writer, 202 if nova else 200, {**feina.descripcio(), "cache": not nova})
+            if metode != "GET":
+                return await self._respondre(writer, 405, {"error": "fes servir GET"})
+            if len(ruta) in (2, 3) and ruta[0] == "simulacions":
+                feina = self._feina(ruta[1])
+                if feina is None:
+                    return await self._respondre(writer, 404, {"error": "simulació desconeguda"})
+                if len(ruta) == 2:
+                    return await self._respondre(writer, 200, {**feina.descripcio(), "progres": feina.progres})
+                if ruta[2] == "events":
+                    return await self._events(writer, feina)
+            if len(ruta) == 3 and ruta[0] == "resultats":
+                return await self._servir_resultat(writer, ruta[1], ruta[2])
+            return await self._respondre(writer, 404, {"error": "ruta desconeguda"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            with contextlib.suppress(ConnectionError):
+                writer.close()
+                await writer.wait_closed()
+
+    async def executar(self, host="127.0.0.1", port=8765):
+        loop = asyncio.get_running_loop()
+        self._gestor = multiprocessing.Manager()
+        self._cua = self._gestor.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_processos)
+        lector = threading.Thread(target=self._llegir_progres, args=(loop,), daemon=True)
+        lector.start()
+        servidor = await asyncio.start_server(self._atendre, host, port)
+        print(f"Servei de simulació a http://{host}:{port} ({self.max_processos} processos, dades {self.hash_dades})")
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            self._cua.put(None)
+            self._executor.shutdown(cancel_futures=True)
+            self._gestor.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servei HTTP local de simulació per al dashboard.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processos", type=int, default=None, help="mida del pool de processos (per defecte, nuclis)")
+    parser.add_argument("--cache", default=DIR_CACHE_SERVEI, help="directori dels resultats memoritzats")
+    args = parser.parse_args(argv)
+    servei = ServeiSimulacio(max_processos=args.processos, dir_cache=args.cache)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(servei.executar(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
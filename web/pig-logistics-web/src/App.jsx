@@ -3,10 +3,57 @@ import {
   Truck, TrendingUp, AlertTriangle, DollarSign, Activity,
   Calendar, MapPin, Navigation, Layers, Scale, Clock
 } from 'lucide-react';
-import simulationData from './data/resultats_simulacio.json';
 import videoLogistics from './data/video_logistics.mp4';
 
-const REAL_SIMULATION_DATA = simulationData;
+// Resultats en format columnar (Codigo/CalcP.py: exportar_resultats_columnar): un manifest petit
+// i un fitxer per dia que només es descarrega quan es consulta aquell dia.
+// VITE_RESULTATS_URL permet llegir-los del servei local (Codigo/servei.py), p. ex.
+// http://127.0.0.1:8765/resultats/<id>/
+const RESULTS_BASE = import.meta.env.VITE_RESULTATS_URL || `${import.meta.env.BASE_URL}resultats/`;
+
+const loadManifest = async () => {
+  try {
+    const res = await fetch(`${RESULTS_BASE}manifest.json`);
+    if (res.ok) return await res.json();
+  } catch { /* sense manifest: format antic */ }
+  // Compatibilitat amb resultats_simulacio.json (en un chunk a part, no al bundle principal)
+  const legacy = (await import('./data/resultats_simulacio.json')).default;
+  return { legacy };
+};
+
+const decodeDay = (chunk, manifest) => {
+  const farmIds = manifest.granges.id;
+  const { tipus_camio: truckTypes, escorxador_id: plants } = manifest.diccionaris;
+  return chunk.camio_id.map((camioId, k) => ({
+    dia: chunk.dia,
+    camio_id: camioId,
+    tipus_camio: truckTypes[chunk.tipus_camio[k]],
+    escorxador_id: plants[chunk.escorxador_id[k]],
+    parades: chunk.parades.slice(chunk.parades_inici[k], chunk.parades_inici[k + 1]).map(i => farmIds[i]),
+    detalls_parades: chunk.detall_granja.slice(chunk.detall_inici[k], chunk.detall_inici[k + 1])
+      .map((g, j) => `${farmIds[g]} (${chunk.detall_porcs[chunk.detall_inici[k] + j]} porcs)`),
+    porcs_totals: chunk.porcs_totals[k],
+    pes_total: chunk.pes_total[k],
+    distancia_total: chunk.distancia_total[k],
+    temps_total: chunk.temps_total[k],
+    ingressos: chunk.ingressos[k],
+    penalitzacions: chunk.penalitzacions[k],
+    cost_viatge: chunk.cost_viatge[k]
+  }));
+};
+
+const loadDay = async (manifest, day, cache) => {
+  if (manifest.legacy) {
+    return manifest.legacy.activitat_diaria.filter(d => d.dia === day && d.camio_id !== "DESCANS");
+  }
+  if (cache.has(day)) return cache.get(day);
+  const entry = manifest.dies.find(d => d.dia === day);
+  if (!entry || entry.rutes === 0) return [];
+  const res = await fetch(`${RESULTS_BASE}${entry.fitxer}`);
+  const routes = decodeDay(await res.json(), manifest);
+  cache.set(day, routes);
+  return routes;
+};
 
 const SLAUGHTERHOUSE = {
   id: "S01", name: "Escorxador Central Vic", lat: 41.93, lon: 2.25, capacity: 2000
@@ -31,6 +78,9 @@ function App() {
   const [selectedDay, setSelectedDay] = useState(1);
   const [leafletLoaded, setLeafletLoaded] = useState(false);
   const [showMap, setShowMap] = useState(false);
+  const [manifest, setManifest] = useState(null);
+  const [dailyData, setDailyData] = useState([]);
+  const dayCacheRef = useRef(new Map());
 
   useEffect(() => {
     if (!showMap) return;
@@ -61,28 +111,42 @@ function App() {
   }, [showMap]);
   
 
+  useEffect(() => {
+    if (!showMap || manifest) return;
+    loadManifest().then(setManifest);
+  }, [showMap, manifest]);
+
   const farmsMap = useMemo(() => {
-    if (!showMap) return {};
+    if (!showMap || !manifest) return {};
     const farms = {};
-    if (REAL_SIMULATION_DATA.ubicacions_granges) {
-      REAL_SIMULATION_DATA.ubicacions_granges.forEach(granja => {
-        farms[granja.id] = {
-          id: granja.id,
-          lat: granja.lat,
-          lon: granja.lon,
-          // Errores que no afectan al comportamento del programa
-          inventory: Math.floor(Math.random() * 2000) + 1000,
-          pigs_ready: Math.floor(Math.random() * 150)
-        };
-      });
-    }
+    const ubicacions = manifest.legacy
+      ? (manifest.legacy.ubicacions_granges || [])
+      : manifest.granges.id.map((id, i) => ({ id, lat: manifest.granges.lat[i], lon: manifest.granges.lon[i] }));
+    ubicacions.forEach(granja => {
+      farms[granja.id] = {
+        id: granja.id,
+        lat: granja.lat,
+        lon: granja.lon,
+        // Errores que no afectan al comportamento del programa
+        inventory: Math.floor(Math.random() * 2000) + 1000,
+        pigs_ready: Math.floor(Math.random() * 150)
+      };
+    });
     return farms;
-  }, [showMap]);
+  }, [showMap, manifest]);
 
-  const dailyData = useMemo(() => {
-    if (!showMap) return [];
-    return REAL_SIMULATION_DATA.activitat_diaria.filter(d => d.dia === selectedDay && d.camio_id !== "DESCANS");
-  }, [selectedDay, showMap]);
+  useEffect(() => {
+    if (!showMap || !manifest) return;
+    let cancelled = false;
+    loadDay(manifest, selectedDay, dayCacheRef.current).then(routes => {
+      if (!cancelled) setDailyData(routes);
+    });
+    return () => { cancelled = true; };
+  }, [selectedDay, showMap, manifest]);
+
+  const maxDay = manifest
+    ? (manifest.legacy ? manifest.legacy.metadata.dies_simulats : manifest.metadata.dies_simulats) || 15
+    : 15;
 
   const dailyMetrics = useMemo(() => {
     if (!showMap) return { profit: 0, pigs: 0, cost: 0, penalties: 0, weight: 0, distance: 0, time: 0, trips: 0, avgTripCost: 0, avgTripTime: 0, utilizationPct: 0 };
@@ -286,7 +350,7 @@ function App() {
             <div className="flex items-center gap-6 bg-[#0f172a] px-6 py-2 rounded-xl border border-white/5 shadow-inner">
               <div className="flex items-center gap-2 text-blue-400"><Calendar size={18} /><span className="text-xs font-bold uppercase tracking-widest">Dia Simulació</span></div>
               <span className="text-xl font-bold text-white w-8 text-center">{selectedDay}</span>
-              <input type="range" min="1" max="15" value={selectedDay} onChange={(e) => setSelectedDay(parseInt(e.target.value))} className="w-32 h-2 bg-gray-700 rounded-lg appearance-none cursor-pointer accent-blue-500"/>
+              <input type="range" min="1" max={maxDay} value={selectedDay} onChange={(e) => setSelectedDay(parseInt(e.target.value))} className="w-32 h-2 bg-gray-700 rounded-lg appearance-none cursor-pointer accent-blue-500"/>
             </div>
           </nav>
 
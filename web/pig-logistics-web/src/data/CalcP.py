@@ -2,10 +2,7 @@ import pandas as pd
 import numpy as np
 import math
 import random
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json
-from pyproj import Transformer  # Importació necessària per a les coordenades
 
 # --- 1. CONFIGURACIÓ I CONSTANTS ---
 
@@ -72,11 +69,19 @@ CUMULATIVE_INTAKE_DATA = {
 }
 
 # --- SISTEMA DE COORDENADES (PYPROJ) ---
-try:
-    transformer = Transformer.from_crs("EPSG:25831", "EPSG:4326", always_xy=True)
-except Exception as e:
-    print(f"⚠️ Error inicialitzant PyProj: {e}. Assegura't de tenir la llibreria instal·lada.")
-    transformer = None
+# El Transformer es crea el primer cop que cal (importar pyproj i carregar la base EPSG és lent)
+_transformer = False
+
+def obtenir_transformer():
+    global _transformer
+    if _transformer is False:
+        try:
+            from pyproj import Transformer  # Importació necessària per a les coordenades
+            _transformer = Transformer.from_crs("EPSG:25831", "EPSG:4326", always_xy=True)
+        except Exception as e:
+            print(f"⚠️ Error inicialitzant PyProj: {e}. Assegura't de tenir la llibreria instal·lada.")
+            _transformer = None
+    return _transformer
 
 def generar_xy_catalunya():
     # Rango ajustado para Catalunya (UTM zona 31N)
@@ -85,6 +90,7 @@ def generar_xy_catalunya():
     return x, y
 
 def xy_a_latlon(x, y):
+    transformer = obtenir_transformer()
     if transformer:
         lon, lat = transformer.transform(x, y)
         return lat, lon
@@ -473,6 +479,7 @@ def exportar_resultats_json(df, granges, filename="resultats_simulacio.json"):
 # --- 8. DASHBOARD ---
 
 def generar_dashboard(df, granges, escorxador, num_camions_flota):
+    import matplotlib.pyplot as plt
     df["benefici_net"] = df["ingressos"] - df["cost_viatge"]
     total_ingressos = df["ingressos"].sum()
     total_cost_transport = df["cost_viatge"].sum()